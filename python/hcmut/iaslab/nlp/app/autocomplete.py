@@ -0,0 +1,278 @@
+import argparse
+import io
+import os
+import time
+from utils import TerminalTrie, preprocess_text, custom_tokenizer
+
+def normalize_line(line:str):
+    """
+    Chuẩn hóa dòng đang gõ như preprocess_text nhưng giữ một khoảng trắng ở cuối
+    (người dùng đã gõ xong từ cuối cùng).
+    """
+    text = preprocess_text(line)
+    if text and line[-1:].isspace():
+        text += " "
+    return text
+
+# Tập terminal lớn hơn ngưỡng này (từ điển món ăn lớn) thì lọc theo tiền tố qua trie
+# thay vì duyệt cả tập
+SCAN_LIMIT = 256
+
+class PrefixParser:
+    """
+    Trạng thái phân tích tăng dần của một dòng đang gõ, giữ nguyên giữa các lần gõ phím.
+
+    Token chỉ được chốt vào chart Earley khi trie đã dừng ở một ký tự trước vị trí
+    đang sửa (gõ thêm ký tự không thể đổi kết quả khớp dài nhất); phần còn lại
+    (tail) là từ đang gõ dở. Gõ thêm một ký tự chỉ tốn công cho token vừa chốt (nếu có);
+    sửa/xóa giữa dòng thì chart được cắt về token cuối cùng còn nguyên rồi đọc tiếp.
+    """
+    def __init__(self, parser, terminals:TerminalTrie):
+        self.parser = parser
+        self.trie = terminals
+        self.chart = parser.chart()
+        self.text = ""
+        # Các token đã chốt: (terminal, vị trí kết thúc, vị trí trie dừng, chart còn sống)
+        self.spans = []
+        self.tail = ""
+        self.pushes = 0
+
+    @property
+    def alive(self):
+        # Chart chết thì không tiền tố nào kéo dài thêm thành câu hợp lệ được
+        return self.spans[-1][3] if self.spans else True
+
+    def tokens(self):
+        return [term for term, _, _, _ in self.spans]
+
+    def update(self, line:str):
+        """
+        Cập nhật theo nội dung dòng hiện tại (thêm, xóa hay sửa đều được).
+        """
+        text = normalize_line(line)
+        if text.startswith(self.text):
+            common = len(self.text)
+        else:
+            common = 0
+            for a, b in zip(text, self.text):
+                if a != b:
+                    break
+                common += 1
+        keep = 0
+        while keep < len(self.spans) and self.spans[keep][2] < common:
+            keep += 1
+        if keep < len(self.spans):
+            del self.spans[keep:]
+            self.chart.truncate(keep)
+        self.text = text
+
+        pos = self._skip_spaces(self.spans[-1][1] if self.spans else 0)
+        while self.alive:
+            term, end, stop = self.trie.scan(text, pos)
+            if term is None or stop == len(text):
+                break
+            alive = self.chart.push(self.parser.terminal_ids[term])
+            self.pushes += 1
+            self.spans.append((term, end, stop, alive))
+            pos = self._skip_spaces(end)
+        self.tail = text[pos:]
+
+    def _skip_spaces(self, pos):
+        while pos < len(self.text) and self.text[pos].isspace():
+            pos += 1
+        return pos
+
+    def viable(self):
+        """
+        Dòng hiện tại có thể gõ tiếp thành một câu hợp lệ hay không.
+        """
+        return self.alive and self._explore(self.tail, "", [], 1)
+
+    def completions(self, limit=10):
+        """
+        Các cách hoàn tất phần đang gõ dở (tail) bằng terminal hợp lệ theo văn phạm;
+        nếu tail rỗng thì là các terminal có thể đứng kế tiếp.
+        """
+        result = []
+        if self.alive:
+            self._explore(self.tail, "", result, limit)
+        return result
+
+    def is_complete(self):
+        """
+        Dòng hiện tại đã là một câu hợp lệ hay không.
+        """
+        if not self.alive:
+            return False
+        spans = self.trie.tokenize_spans(self.tail)
+        if spans is None:
+            return False
+        n = len(self.chart.tokens)
+        try:
+            return all(self.chart.push(self.parser.terminal_ids[term]) for _, _, term in spans) and self.chart.accepts()
+        finally:
+            self.chart.truncate(n)
+
+    def _explore(self, tail, done, out, limit):
+        """
+        Thêm vào out (tối đa limit) các chuỗi done + phần hoàn tất của tail; trả về True
+        nếu có ít nhất một. tail có thể gồm nhiều terminal: mỗi terminal đầy đủ ở đầu
+        tail được thử đẩy vào chart rồi xét tiếp phần sau, xong thì cắt chart lại.
+        """
+        chart, terminal_ids = self.chart, self.parser.terminal_ids
+        found = False
+        if not tail:
+            for term in chart.next_terminals(limit - len(out)):
+                out.append(done + term)
+                found = True
+            return found
+
+        node = self.trie.root
+        for m, ch in enumerate(tail):
+            if m and None in node:
+                # tail[:m] là một terminal đầy đủ; phần sau bắt đầu một token mới
+                term = node[None]
+                n = len(chart.tokens)
+                if chart.push(terminal_ids[term]):
+                    rest = tail[m:].lstrip()
+                    found = self._explore(rest, done + tail[:len(tail) - len(rest)], out, limit) or found
+                chart.truncate(n)
+                if len(out) >= limit:
+                    return True
+            node = node.get(ch)
+            if node is None:
+                return found
+
+        # Các terminal bắt đầu bằng tail và có thể đứng kế tiếp
+        seen = set()
+        for tids in chart.next_terminal_sets():
+            if len(tids) <= SCAN_LIMIT:
+                terms = (self.parser.terminals[tid] for tid in tids)
+                terms = [term for term in terms if term.startswith(tail)]
+            else:
+                terms = (term for term in _subtree_terms(node) if terminal_ids[term] in tids)
+            for term in terms:
+                if term in seen or terminal_ids[term] in self.parser.placeholders:
+                    continue
+                seen.add(term)
+                out.append(done + term)
+                found = True
+                if len(out) >= limit:
+                    return True
+        return found
+
+def _subtree_terms(node):
+    # Các terminal trong cây con của một nút trie
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        for ch, child in node.items():
+            if ch is None:
+                yield child
+            else:
+                stack.append(child)
+
+class ReadlineCompleter:
+    """
+    Hàm completer cho readline: Tab gợi ý từ kế tiếp theo văn phạm.
+    Giữ một PrefixParser cho dòng đang gõ và tạo lại khi data.json được nạp lại.
+    """
+    def __init__(self, get_snapshot, limit=20):
+        self.get_snapshot = get_snapshot
+        self.limit = limit
+        self.prefix = None
+        self.matches = []
+
+    def complete(self, text, state):
+        if state == 0:
+            snapshot = self.get_snapshot()
+            if self.prefix is None or self.prefix.parser is not snapshot.parser:
+                self.prefix = PrefixParser(snapshot.parser, snapshot.terminals)
+            self.prefix.update(text)
+            tail = self.prefix.tail
+            head = text[:len(text) - len(tail)] if tail else text
+            if head and not head[-1].isspace():
+                head += " "
+            self.matches = [head + completion + " " for completion in self.prefix.completions(self.limit)]
+        return self.matches[state] if state < len(self.matches) else None
+
+def install_readline_completer(get_snapshot):
+    """
+    Bật gợi ý bằng phím Tab trong REPL nếu có module readline; trả về True nếu bật được.
+    """
+    try:
+        import readline
+    except ImportError:
+        return False
+    completer = ReadlineCompleter(get_snapshot)
+    # Cả dòng là một "từ" để completer thấy toàn bộ tiền tố câu
+    readline.set_completer_delims("")
+    readline.set_completer(completer.complete)
+    readline.parse_and_bind("tab: complete")
+    return True
+
+def _keystrokes(sentence):
+    line = normalize_line(sentence)
+    return [line[:i] for i in range(1, len(line) + 1)]
+
+def _full_reparse(parser, terminals, line):
+    # Cách làm không tăng dần: mỗi lần gõ phím tạo chart mới và đọc lại mọi token
+    state = PrefixParser(parser, terminals)
+    state.update(line)
+    return state
+
+if __name__ == "__main__":
+    from main import INPUT_DIR, GRAMMAR_CACHE_FILE
+    from grammar_cache import load_compiled_grammar
+
+    arg_parser = argparse.ArgumentParser(description="Đo độ trễ mỗi lần gõ phím của phân tích tăng dần + gợi ý")
+    arg_parser.add_argument("--queries", nargs="+",
+                            default=[os.path.join(INPUT_DIR, "sentences.txt"), os.path.join(INPUT_DIR, "sample-queries.txt")])
+    arg_parser.add_argument("--limit", type=int, default=10, help="số gợi ý mỗi lần gõ")
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    compiled, _ = load_compiled_grammar(GRAMMAR_CACHE_FILE)
+    parser, terminals = compiled.parser, compiled.trie
+    sentences = []
+    for file in args.queries:
+        with io.open(file, "r", encoding="utf-8") as f:
+            sentences.extend(line.strip() for line in f if line.strip())
+
+    # Kiểm tra: gõ hết câu thì kết luận giống phân tích cả câu
+    mismatches = 0
+    for sentence in sentences:
+        state = PrefixParser(parser, terminals)
+        for line in _keystrokes(sentence):
+            state.update(line)
+        tokens = custom_tokenizer(sentence, terminals)
+        mismatches += state.is_complete() != (tokens is not None and parser.recognize(tokens))
+    print(f"{len(sentences)} câu, {sum(len(_keystrokes(s)) for s in sentences)} lần gõ phím, "
+          f"{mismatches} câu kết luận khác phân tích cả câu")
+
+    for label, incremental in [("tăng dần", True), ("phân tích lại", False)]:
+        updates, keystrokes, pushes = [], [], 0
+        for _ in range(args.repeat):
+            for sentence in sentences:
+                state = PrefixParser(parser, terminals)
+                for line in _keystrokes(sentence):
+                    start = time.perf_counter()
+                    if incremental:
+                        state.update(line)
+                    else:
+                        state = _full_reparse(parser, terminals, line)
+                    updated = time.perf_counter()
+                    state.viable()
+                    state.completions(args.limit)
+                    keystrokes.append(time.perf_counter() - start)
+                    updates.append(updated - start)
+                    if not incremental:
+                        pushes += state.pushes
+                if incremental:
+                    pushes += state.pushes
+        for name, latencies in [("cập nhật chart", updates), ("cập nhật + gợi ý", keystrokes)]:
+            latencies.sort()
+            p50, p99 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+            print(f"{label:<14} {name:<17} trung bình {sum(latencies) / len(latencies) * 1e6:7.1f} µs, "
+                  f"p50 {p50 * 1e6:7.1f} µs, p99 {p99 * 1e6:7.1f} µs")
+        print(f"{label:<14} {pushes / len(keystrokes):.2f} token đọc vào chart mỗi lần gõ")
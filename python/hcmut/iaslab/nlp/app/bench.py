@@ -0,0 +1,294 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from nltk import CFG, ChartParser
+from grammar import load_data, build_lexicon, lexicon_grammar_str
+from grammar_cache import load_compiled_grammar, CompiledGrammar
+from menu_db import synthetic_menu
+from utils import get_terminals, custom_tokenizer
+from main import INPUT_DIR, OUTPUT_DIR, SAMPLES_FILE, INPUT_SENTENCES_FILE, GRAMMAR_CACHE_FILE
+
+BENCH_RESULTS_FILE = os.path.join(OUTPUT_DIR, "bench-results.json")
+BENCH_BASELINE_FILE = os.path.join(OUTPUT_DIR, "bench-baseline.json")
+
+# Chậm hơn baseline quá tỉ lệ này thì coi là hồi quy
+DEFAULT_THRESHOLD = 0.2
+
+# Số câu đưa qua NLTK ChartParser (chỉ để đối chiếu, rất chậm)
+NLTK_SENTENCES = 10
+
+def read_lines(file):
+    with io.open(file, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+def synthetic_corpus(foods, size):
+    """
+    size câu hỏi/đặt món với các món lấy rải đều từ foods (menu giả lập).
+    """
+    templates = ("cho tôi 2 phần {} không cay", "{} giá bao nhiêu", "có {} không")
+    return [templates[i % 3].format(foods[i * 7919 % len(foods)]) for i in range(size)]
+
+class Context:
+    """
+    Dữ liệu dùng chung cho các benchmark: văn phạm thật, văn phạm trên menu giả lập
+    và các tập câu (input/sentences.txt, output/samples.txt, tập câu giả lập).
+    """
+    def __init__(self, menu_size, corpus_size):
+        self.compiled, _ = load_compiled_grammar(GRAMMAR_CACHE_FILE)
+        self.corpora = {"sentences": read_lines(INPUT_SENTENCES_FILE)}
+        if os.path.exists(SAMPLES_FILE):
+            self.corpora["samples"] = read_lines(SAMPLES_FILE)
+
+        data = load_data()
+        data["menu"] = synthetic_menu(menu_size)
+        self.synthetic_lexicon = build_lexicon(data)
+        self.synthetic = CompiledGrammar(None, self.synthetic_lexicon)
+        self.synthetic_corpus = synthetic_corpus(self.synthetic_lexicon["FOOD"], corpus_size)
+        self.menu_size = menu_size
+
+    def tokenized(self, corpus):
+        terminals = self.compiled.trie
+        tokens = (custom_tokenizer(sentence, terminals) for sentence in self.corpora[corpus])
+        return [t for t in tokens if t is not None]
+
+def _bench_get_terminals(ctx):
+    grammar = ctx.compiled.grammar
+    synthetic = CFG.fromstring(lexicon_grammar_str(ctx.synthetic_lexicon))
+    yield "get_terminals", 1, lambda: get_terminals(grammar)
+    yield f"get_terminals/menu-{ctx.menu_size}", 1, lambda: get_terminals(synthetic)
+
+def _bench_tokenizer(ctx):
+    terminals = ctx.compiled.trie
+    for corpus, sentences in ctx.corpora.items():
+        yield (f"custom_tokenizer/{corpus}", len(sentences),
+               lambda sentences=sentences: [custom_tokenizer(s, terminals) for s in sentences])
+    sentences, terminals = ctx.synthetic_corpus, ctx.synthetic.trie
+    yield (f"custom_tokenizer/menu-{ctx.menu_size}", len(sentences),
+           lambda: [custom_tokenizer(s, terminals) for s in sentences])
+
+def _bench_parser(ctx):
+    parser = ctx.compiled.parser
+    for corpus in ctx.corpora:
+        tokens = ctx.tokenized(corpus)
+        yield f"parse_first/{corpus}", len(tokens), lambda tokens=tokens: [parser.parse_first(t) for t in tokens]
+    tokens = ctx.tokenized("sentences")
+    # Liệt kê mọi cây (như ChartParser.parse)
+    yield "parse/sentences", len(tokens), lambda: [list(parser.parse(t)) for t in tokens]
+
+    terminals, parser = ctx.synthetic.trie, ctx.synthetic.parser
+    tokens = [custom_tokenizer(s, terminals) for s in ctx.synthetic_corpus]
+    yield f"parse_first/menu-{ctx.menu_size}", len(tokens), lambda: [parser.parse_first(t) for t in tokens]
+
+    # Đối chiếu với NLTK ChartParser trên văn phạm đầy đủ, vài câu đầu
+    chart_parser = ChartParser(ctx.compiled.grammar)
+    tokens = ctx.tokenized("sentences")[:NLTK_SENTENCES]
+    yield "nltk_chart_parser/sentences", len(tokens), lambda: [next(chart_parser.parse(t), None) for t in tokens]
+
+def _bench_generator(ctx):
+    from generator import generate_sentences
+    grammar = ctx.compiled.grammar
+    with tempfile.TemporaryDirectory() as tmp:
+        samples = os.path.join(tmp, "samples.txt")
+        for n in (1000, 10000):
+            yield (f"generate_sentences/{n}", n,
+                   lambda n=n: _quiet(generate_sentences, grammar, samples, max_sentences=n, seed=0))
+
+def _bench_semantics(ctx):
+    import cli
+    parser = ctx.compiled.parser
+    trees = [parser.parse_first(t) for t in ctx.tokenized("sentences")]
+    trees = [tree for tree in trees if tree is not None]
+    yield "extract_semantics/sentences", len(trees), lambda: [cli.extract_semantics(tree) for tree in trees]
+
+    sems = [cli.extract_semantics(tree) for tree in trees]
+    def execute():
+        order = cli.order_store.cart("bench")
+        try:
+            return [cli.execute_query(sem, order) for sem in sems]
+        finally:
+            cli.order_store.release("bench")
+    yield "execute_query/sentences", len(sems), execute
+
+def _bench_process_query(ctx):
+    import cli
+    from parse_cache import ParseCache
+    queries = ctx.corpora["sentences"] + read_lines(cli.SAMPLE_QUERIES_FILE)
+
+    def run(cold):
+        if cold:
+            cli.parse_cache = ParseCache(max_size=10000, version=cli.reloader.snapshot.key,
+                                         copy_value=cli.copy_parsed)
+        order = cli.order_store.cart("bench")
+        try:
+            return [cli.process_query(query, order) for query in queries]
+        finally:
+            cli.order_store.release("bench")
+    yield "cli.process_query/cold", len(queries), lambda: run(True)
+    yield "cli.process_query/warm", len(queries), lambda: run(False)
+
+    # Tin nhắn ghép từ n câu hợp lệ: có dấu chấm (tách theo dấu câu) và viết liền
+    # (tách theo văn phạm); thời gian mỗi tin nhắn phải tăng tuyến tính theo n
+    snapshot = cli.reloader.snapshot
+    valid = []
+    for query in ctx.corpora["sentences"]:
+        tokens = cli.tokenize(query, snapshot)
+        if tokens and cli.parse_tokens(tokens, snapshot)[0]:
+            valid.append(query.strip(" .!?;"))
+    for n in (1, 4, 16):
+        for name, sep in (("punct", ". "), ("joined", " ")):
+            messages = [sep.join(valid[(i + k) % len(valid)] for k in range(n)) for i in range(len(valid))]
+            def run_multi(messages=messages):
+                cli.parse_cache = ParseCache(max_size=10000, version=cli.reloader.snapshot.key,
+                                             copy_value=cli.copy_parsed)
+                order = cli.order_store.cart("bench")
+                try:
+                    return [cli.process_query(message, order) for message in messages]
+                finally:
+                    cli.order_store.release("bench")
+            yield f"cli.process_query/multi-{name}-{n}", len(messages), run_multi
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = os.path.join(tmp, "queries.log")
+        with io.open(log, "w", encoding="utf-8") as f:
+            for i in range(10000):
+                f.write(json.dumps({"session": f"s{i % 100}", "query": queries[i % len(queries)]}, ensure_ascii=False) + "\n")
+        yield "cli.run_batch/10000", 10000, lambda: cli.run_batch(log, os.path.join(tmp, "answers.jsonl"))
+
+def _bench_main(ctx):
+    import main
+    with tempfile.TemporaryDirectory() as tmp:
+        # Chạy trong thư mục tạm chứa bản sao input/ và cache văn phạm (không ghi đè output/)
+        shutil.copytree(INPUT_DIR, os.path.join(tmp, INPUT_DIR))
+        os.makedirs(os.path.join(tmp, OUTPUT_DIR))
+        if os.path.exists(GRAMMAR_CACHE_FILE):
+            shutil.copy(GRAMMAR_CACHE_FILE, os.path.join(tmp, GRAMMAR_CACHE_FILE))
+        cwd = os.getcwd()
+
+        def run():
+            os.chdir(tmp)
+            try:
+                _quiet(main.main, seed=0)
+            finally:
+                os.chdir(cwd)
+        yield "main.main", 1, run
+
+# (nhóm, hàm sinh các benchmark (tên, số thao tác, hàm chạy một lượt))
+BENCHMARKS = [
+    ("terminals", _bench_get_terminals),
+    ("tokenizer", _bench_tokenizer),
+    ("parser", _bench_parser),
+    ("generator", _bench_generator),
+    ("semantics", _bench_semantics),
+    ("qa", _bench_process_query),
+    ("main", _bench_main),
+]
+
+def _quiet(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+def run_benchmarks(ctx, groups=None, repeat=5):
+    """
+    Chạy các benchmark (mỗi cái một lượt khởi động rồi repeat lượt đo),
+    trả về {tên: {"group", "ops", "us_per_op", "min_us_per_op", "runs"}}.
+    """
+    results = {}
+    for group, bench in BENCHMARKS:
+        if groups and group not in groups:
+            continue
+        for name, ops, fn in bench(ctx):
+            fn()
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                fn()
+                timings.append(time.perf_counter() - start)
+            results[name] = {
+                "group": group,
+                "ops": ops,
+                "us_per_op": statistics.median(timings) / ops * 1e6,
+                "min_us_per_op": min(timings) / ops * 1e6,
+                "runs": repeat,
+            }
+            print(f"{name:<36} {results[name]['us_per_op']:>12.1f} µs/op "
+                  f"(min {results[name]['min_us_per_op']:.1f}, {ops} op)")
+    return results
+
+def write_results(results, output_file, **meta):
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            **meta,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    with io.open(output_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+def compare(results, baseline_file, threshold=DEFAULT_THRESHOLD):
+    """
+    So sánh với baseline (file kết quả của một lần chạy trước) theo µs/op trung vị.
+    Trả về danh sách tên các benchmark chậm hơn baseline quá threshold.
+    """
+    with io.open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    print(f"\n{'benchmark':<36} {'baseline':>12} {'hiện tại':>12} {'thay đổi':>9}")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<36} {'-':>12} {result['us_per_op']:>12.1f} {'mới':>9}")
+            continue
+        before = baseline[name]["us_per_op"]
+        change = result["us_per_op"] / before - 1 if before > 0 else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  <-- HỒI QUY"
+        print(f"{name:<36} {before:>12.1f} {result['us_per_op']:>12.1f} {change:>+9.0%}{flag}")
+    return regressions
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Đo hiệu năng tokenizer, parser, sinh câu, ngữ nghĩa và hỏi đáp")
+    arg_parser.add_argument("--output", default=BENCH_RESULTS_FILE, help="file JSON kết quả")
+    arg_parser.add_argument("--baseline", nargs="?", const=BENCH_BASELINE_FILE, default=None,
+                            help=f"so sánh với baseline (mặc định {BENCH_BASELINE_FILE}), lỗi nếu có hồi quy")
+    arg_parser.add_argument("--update-baseline", action="store_true", help="lưu kết quả lần này làm baseline")
+    arg_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                            help="tỉ lệ chậm hơn baseline được coi là hồi quy")
+    arg_parser.add_argument("--only", nargs="+", choices=[group for group, _ in BENCHMARKS],
+                            help="chỉ chạy các nhóm này")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="số lượt đo mỗi benchmark")
+    arg_parser.add_argument("--menu-size", type=int, default=10000, help="số món của menu giả lập")
+    arg_parser.add_argument("--corpus-size", type=int, default=20000, help="số câu giả lập trên menu giả lập")
+    arg_parser.add_argument("--quick", action="store_true", help="menu và tập câu giả lập nhỏ, 1 lượt đo")
+    args = arg_parser.parse_args()
+    if args.quick:
+        args.repeat, args.menu_size, args.corpus_size = 1, 1000, 2000
+
+    ctx = Context(args.menu_size, args.corpus_size)
+    results = run_benchmarks(ctx, args.only, args.repeat)
+    meta = {"repeat": args.repeat, "menu_size": args.menu_size, "corpus_size": args.corpus_size}
+    write_results(results, args.output, **meta)
+    print(f"\nĐã ghi kết quả ra {args.output}")
+    if args.update_baseline:
+        write_results(results, BENCH_BASELINE_FILE, **meta)
+        print(f"Đã lưu baseline: {BENCH_BASELINE_FILE}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark chậm hơn baseline quá {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nKhông có hồi quy.")
@@ -0,0 +1,42 @@
+import hashlib
+import math
+
+class BloomFilter:
+    """
+    Bộ lọc Bloom để khử trùng câu với bộ nhớ cố định.
+    Có thể báo nhầm "đã có" với xác suất xấp xỉ error_rate,
+    nhưng không bao giờ bỏ sót câu đã thêm.
+    """
+    def __init__(self, capacity:int, error_rate:float=0.001):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item:str):
+        # Băm ổn định giữa các lần chạy (cần cho chế độ chạy tiếp)
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def __contains__(self, item:str):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def add(self, item:str):
+        """
+        Thêm item; trả về True nếu item (có lẽ) chưa có trước đó.
+        """
+        new = False
+        for pos in self._positions(item):
+            mask = 1 << (pos & 7)
+            if not self.bits[pos >> 3] & mask:
+                self.bits[pos >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
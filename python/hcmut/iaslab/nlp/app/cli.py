@@ -1,9 +1,22 @@
-import json
 import os
 import io
-from nltk import Tree, ChartParser
-from utils import get_terminals, custom_tokenizer
-from main import OUTPUT_DIR, GRAMMAR_FILE
+import json
+import sys
+import time
+import zlib
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from nltk import Tree
+from utils import custom_tokenizer, read_records, split_sentences, positive_int, non_negative_int
+from parse_cache import ParseCache
+from order_store import MemoryOrderStore
+from snapshot import MenuReloader
+from metrics import Metrics, NULL_TIMER
+from pcfg import add_decoder_arguments, decoder_from_args
+from autocomplete import install_readline_completer
+from main import OUTPUT_DIR, GRAMMAR_CACHE_FILE
 
 # Định nghĩa thư mục input
 INPUT_DIR = "input"
@@ -14,25 +27,46 @@ QHNN_FILE = os.path.join(OUTPUT_DIR, "qhnn.txt")
 QHVP_FILE = os.path.join(OUTPUT_DIR, "qhvp.txt")
 LL_FILE = os.path.join(OUTPUT_DIR, "ll.txt")
 ANSWER_FILE = os.path.join(OUTPUT_DIR, "answer.txt")
-
-# Load menu data
-file_path = os.path.join(os.path.dirname(__file__), "data.json")
-with open(file_path, "r", encoding="utf-8") as f:
-    db = json.load(f)
-menu = {item["name"]: {"price": item["price"], "options": item["options"]} for item in db["menu"]}
-
-# Giỏ hàng: lưu thông tin chi tiết từng món
-# current_order = {"phở bò": {"quantity": 2, "attributes": ["tái"], "time": "12 giờ"}}
-current_order = {}
-
-# Load grammar
-with open(GRAMMAR_FILE, "r", encoding="utf-8") as f:
-    grammar_str = f.read()
-from nltk import CFG
-grammar = CFG.fromstring(grammar_str)
-parser = ChartParser(grammar)
-terminals = get_terminals(grammar)
-
+# Kết quả dạng JSONL (mỗi câu một bản ghi); 4 file trên được suy ra từ file này
+ANSWERS_FILE = os.path.join(OUTPUT_DIR, "answers.jsonl")
+# Số liệu đo (--metrics) và log câu chậm (--slow-ms)
+METRICS_FILE = os.path.join(OUTPUT_DIR, "metrics.json")
+SLOW_LOG_FILE = os.path.join(OUTPUT_DIR, "slow-queries.jsonl")
+
+# Phiên của các câu không kèm session (dùng chung giỏ hàng current_order)
+DEFAULT_SESSION = "cli"
+
+# Load menu data và grammar (từ cache nếu data.json và khung văn phạm không đổi).
+# reloader.snapshot gom menu, bảng giá, bộ phân tích, hành động ngữ nghĩa, đường tắt
+# và menu DB (SQLite); khi data.json đổi thì cả khối được thay một lần.
+reloader = MenuReloader(GRAMMAR_CACHE_FILE)
+
+# Giỏ hàng của CLI (một khách), lưu trong bộ nhớ; server.py dùng một giỏ cho mỗi phiên
+# current_order.items() = [("phở bò", 2, ["tái"], "12 giờ", 100000)]
+order_store = MemoryOrderStore(reloader.snapshot.prices)
+current_order = order_store.cart(DEFAULT_SESSION)
+
+def copy_parsed(value):
+    # Bản sao (có phân tích được, ngữ nghĩa) cho parse cache: ngữ nghĩa là dict phẳng
+    # gồm chuỗi, số và list chuỗi nên chỉ cần chép dict và các list, không cần deepcopy
+    parsed, sem = value
+    if isinstance(sem, dict):
+        sem = {key: list(item) if isinstance(item, list) else item for key, item in sem.items()}
+    return parsed, sem
+
+# Cache kết quả phân tích + ngữ nghĩa theo dãy id terminal của câu (không lưu câu trả lời
+# vì câu trả lời phụ thuộc vào giỏ hàng hiện tại)
+parse_cache = ParseCache(max_size=10000, version=reloader.snapshot.key, copy_value=copy_parsed)
+
+# Đo thời gian từng giai đoạn, bộ đếm, log câu chậm (tắt mặc định; bật bằng --metrics)
+metrics = Metrics()
+
+# Chọn dẫn xuất theo văn phạm xác suất (pcfg.ViterbiDecoder, bật bằng --weights);
+# None thì dùng dẫn xuất đầu tiên như ChartParser
+decoder = None
+
+reloader.subscribe(lambda snapshot: parse_cache.bind(snapshot.key))
+reloader.subscribe(lambda snapshot: order_store.set_prices(snapshot.prices))
 
 def extract_semantics(tree: Tree):
     if not isinstance(tree, Tree):
@@ -91,6 +125,10 @@ def extract_semantics(tree: Tree):
     elif label == 'Q_STATUS':
         return {'type': 'status'}
 
+    elif label == 'Q_FILTER':
+        attr = next((sub for sub in tree if isinstance(sub, Tree) and sub.label() == 'ATTRIBUTE'), None)
+        return {'type': 'filter', 'option': " ".join(attr.leaves()) if attr else None}
+
     # NP / NP_QUANTIFIED
     elif label in ['NP', 'NP_QUANTIFIED']:
         food_tree = next((sub for sub in tree if isinstance(sub, Tree) and sub.label() == 'FOOD'), None)
@@ -135,10 +173,16 @@ def semantics_to_logical_form(sem):
         return "menu()"
     elif typ == 'status':
         return "status()"
+    elif typ == 'filter':
+        return f"filter({sem.get('option')})"
     return "unknown()"
 
 
 def map_to_db_query(sem):
+    """
+    Dạng hiển thị của truy vấn (ghi ra qhvp.txt); câu lệnh thật được chạy
+    là câu lệnh có tham số do menu_db.compile sinh ra.
+    """
     if not sem:
         return "INVALID QUERY"
     typ = sem['type']
@@ -151,6 +195,8 @@ def map_to_db_query(sem):
         return "SELECT name, price FROM menu"
     elif typ == 'status':
         return "SELECT * FROM current_order"
+    elif typ == 'filter':
+        return f"SELECT name, price FROM menu WHERE option = '{sem.get('option')}'"
     elif typ in ['order', 'add']:
         return f"INSERT/UPDATE order: {food} × {sem.get('quantity',1)}"
     elif typ == 'remove':
@@ -158,9 +204,16 @@ def map_to_db_query(sem):
     return "NO QUERY"
 
 
-def execute_query(sem):
+def execute_query(sem, order=None, snapshot=None):
+    """
+    Thực thi truy vấn trên menu của snapshot và giỏ hàng order
+    (mặc định là giỏ hàng toàn cục current_order của CLI và snapshot hiện tại).
+    """
     if not sem:
         return "Câu lệnh không hợp lệ."
+    if order is None:
+        order = current_order
+    menu_db = (snapshot or reloader.snapshot).menu_db
 
     typ = sem['type']
     food = sem.get('food')
@@ -169,135 +222,407 @@ def execute_query(sem):
     time = sem.get('time', '')
 
     if typ == 'menu':
-        items = ", ".join([f"{name} ({menu[name]['price']}đ)" for name in menu])
+        items = ", ".join([f"{name} ({price}đ)" for name, price in menu_db.query(sem)])
         return f"Menu có: {items}."
 
     elif typ == 'price':
-        if food in menu:
-            return f"{food.capitalize()} giá {menu[food]['price']:,} VND.".replace(",", ".")
+        rows = menu_db.query(sem)
+        if rows:
+            return f"{food.capitalize()} giá {rows[0][0]:,} VND.".replace(",", ".")
         return f"Không có món {food} trong menu."
 
     elif typ == 'avail':
-        if food in menu:
+        if menu_db.query(sem)[0][0]:
             return f"Có món {food}."
         return f"Không có món {food}."
 
+    elif typ == 'filter':
+        option = sem.get('option')
+        rows = menu_db.query(sem)
+        if rows:
+            items = ", ".join([f"{name} ({price}đ)" for name, price in rows])
+            return f"Các món {option}: {items}."
+        return f"Không có món nào {option}."
+
     elif typ == 'status':
-        if not current_order:
+        items = order.items()
+        if not items:
             return "Bạn chưa đặt món nào."
 
         lines = ["Đơn hàng của bạn:"]
-        total = 0
-        delivery_times = set()
-
-        for food_name, info in current_order.items():
-            q = info['quantity']
-            price = menu[food_name]['price']
-            subtotal = q * price
-            total += subtotal
-            attr_str = f" ({', '.join(info['attributes'])})" if info['attributes'] else ""
-            time_str = f" – Giao lúc {info['time']}" if info['time'] else ""
-            delivery_times.add(info['time'])
+        for food_name, q, item_attrs, item_time, subtotal in items:
+            attr_str = f" ({', '.join(item_attrs)})" if item_attrs else ""
+            time_str = f" – Giao lúc {item_time}" if item_time else ""
             lines.append(f"• {q} {food_name}{attr_str}{time_str} → {subtotal:,}đ".replace(",", "."))
 
-        # Tổng tiền và thời gian giao
+        # Tổng tiền và thời gian giao (tính trong order store)
+        total, delivery_times = order.summary()
         lines.append(f"\nTổng tiền: {total:,} VND".replace(",", "."))
         if delivery_times and '' not in delivery_times:
-            times_str = " và ".join(delivery_times) if len(delivery_times) <= 2 else ", ".join(list(delivery_times)[:-1]) + " và " + list(delivery_times)[-1]
+            times_str = " và ".join(delivery_times) if len(delivery_times) <= 2 else ", ".join(delivery_times[:-1]) + " và " + delivery_times[-1]
             lines.append(f"Thời gian giao hàng: {times_str}")
 
         return "\n".join(lines)
 
     elif typ in ['order', 'add']:
-        if food not in menu:
+        if not menu_db.contains(food):
             return f"Không có món {food} trong menu."
-        if food in current_order:
-            current_order[food]['quantity'] += qty
-            current_order[food]['attributes'].extend(attrs)
-            if time:
-                current_order[food]['time'] = time  # Cập nhật thời gian mới nhất
-        else:
-            current_order[food] = {
-                'quantity': qty,
-                'attributes': attrs,
-                'time': time
-            }
+        order.add(food, qty, attrs, time)
         action = "thêm" if typ == 'add' else "đặt"
         time_str = f" lúc {time}" if time else ""
         return f"Đã {action} {qty} {food}{time_str} vào đơn hàng thành công!"
 
     elif typ == 'remove':
-        if food in current_order:
-            del current_order[food]
+        if order.remove(food):
             return f"Đã xóa {food} khỏi đơn hàng."
         return f"Không có {food} trong đơn hàng để xóa."
 
     return "Không hiểu yêu cầu của bạn."
 
 
-def process_query(query):
-    tokens = custom_tokenizer(query, terminals)
-    if tokens is None:
-        return "Token error", "No query", "invalid()", "Lỗi tokenize."
-
-    try:
-        parse_trees = list(parser.parse(tokens))
-        if not parse_trees:
-            return "No parse", "No query", "invalid()", "Câu không hợp lệ với văn phạm."
-        tree = parse_trees[0]
-    except Exception as e:
-        return "Parse error", "No query", "invalid()", f"Lỗi phân tích: {e}"
+def parse_tokens(tokens, snapshot=None, ids=None):
+    """
+    Phân tích dãy token: thử đường tắt trước, sau đó bộ phân tích Earley.
+    ids: dãy id terminal (EarleyParser.intern) nếu đã có.
+    Trả về (có phân tích được hay không, ngữ nghĩa).
+    """
+    snapshot = snapshot or reloader.snapshot
+    sem = snapshot.fast_path.match(tokens, ids)
+    if sem is not None:
+        return True, sem
+    if decoder is not None:
+        # Dẫn xuất có xác suất lớn nhất, trong ngân sách của decoder (BudgetExceeded nếu vượt)
+        return decoder.parse_semantics(snapshot.parser, tokens, snapshot.actions, ids)
+    # Ngữ nghĩa được tính từ dưới lên khi phân tích, không dựng cây
+    return snapshot.parser.parse_semantics(tokens, snapshot.actions, ids)
+
+
+def cache_key(tokens, snapshot):
+    """
+    (ids, khóa parse cache) của dãy token: khóa là byte của dãy id terminal
+    (gọn hơn tuple chuỗi); tuple token nếu có từ lạ (ids là None).
+    """
+    ids = snapshot.parser.intern(tokens)
+    return ids, ids.tobytes() if ids is not None else tuple(tokens)
+
+
+def answer_semantics(parsed, sem, order=None, snapshot=None, timer=NULL_TIMER):
+    """
+    Sinh 4 kết quả (qhnn, qhvp, ll, answer) từ ngữ nghĩa, thực thi trên giỏ hàng order.
+    """
+    if not parsed:
+        return "No parse", "No query", "invalid()", "Câu không hợp lệ với văn phạm."
 
-    sem = extract_semantics(tree)
     qhnn = str(sem)
     qhvp = map_to_db_query(sem)
     ll = semantics_to_logical_form(sem)
-    answer = execute_query(sem)
+    timer.lap("semantics")
+    answer = execute_query(sem, order, snapshot)
+    timer.lap("execute")
 
     return qhnn, qhvp, ll, answer
 
 
-def main_cli():
-    print("=== HỆ THỐNG ĐẶT MÓN ĂN Q&A ===")
-    print("Đọc câu hỏi mẫu từ:", SAMPLE_QUERIES_FILE)
+def token_error():
+    return "Token error", "No query", "invalid()", "Lỗi tokenize."
 
-    # Đọc file sample-queries.txt
-    if not os.path.exists(SAMPLE_QUERIES_FILE):
-        print(f"Không tìm thấy file {SAMPLE_QUERIES_FILE}")
-        print("Vui lòng tạo file input/sample-queries.txt với các câu hỏi (mỗi dòng một câu).")
+
+def parse_error(e):
+    return "Parse error", "No query", "invalid()", f"Lỗi phân tích: {e}"
+
+
+def tokenize(query, snapshot=None):
+    """
+    Tokenize chính xác; nếu lỗi (gõ không dấu, sai chính tả) thì thử tokenize mờ.
+    Trả về các terminal chuẩn hoặc None.
+    """
+    snapshot = snapshot if snapshot is not None else reloader.snapshot
+    tokens = custom_tokenizer(query, snapshot.terminals)
+    if tokens is None:
+        tokens = snapshot.fuzzy.tokenize(query)
+    return tokens
+
+
+def tokenize_parts(query, snapshot=None):
+    """
+    Tách tin nhắn theo dấu ngắt câu rồi tokenize từng đoạn (None nếu đoạn bị lỗi tokenize);
+    bỏ các đoạn rỗng, cả tin nhắn là một đoạn nếu không còn đoạn nào.
+    """
+    parts = [tokenize(part, snapshot) for part in split_sentences(query)]
+    return [tokens for tokens in parts if tokens != []] or [tokenize(query, snapshot)]
+
+
+def parse_clauses(tokens, snapshot=None, ids=None, parse=None):
+    """
+    Phân tích một đoạn (không có dấu ngắt câu) có thể gồm nhiều câu viết liền nhau
+    ("thêm 1 trà sữa thêm 2 trà sữa"): thử cả đoạn trước; nếu không phân tích được thì
+    tách bằng EarleyParser.segment và phân tích từng câu.
+    parse(tokens, ids): hàm phân tích một câu (mặc định parse_tokens).
+    Trả về [(tokens, có phân tích được hay không, ngữ nghĩa)], một phần tử nếu không tách.
+    """
+    snapshot = snapshot or reloader.snapshot
+    if parse is None:
+        parse = lambda part, part_ids: parse_tokens(part, snapshot, part_ids)
+    if ids is None:
+        ids = snapshot.parser.intern(tokens)
+    parsed, sem = parse(tokens, ids)
+    if parsed or ids is None or len(tokens) < 2:
+        return [(tokens, parsed, sem)]
+    clauses = []
+    for i, j in snapshot.parser.segment(tokens, ids):
+        part_parsed, part_sem = parse(tokens[i:j], ids[i:j])
+        if not part_parsed:
+            return [(tokens, parsed, sem)]
+        clauses.append((tokens[i:j], part_parsed, part_sem))
+    return clauses or [(tokens, parsed, sem)]
+
+
+def cached_parse(tokens, ids, snapshot, timer=NULL_TIMER):
+    """
+    parse_tokens qua parse cache (khóa cache_key).
+    """
+    key = ids.tobytes() if ids is not None else tuple(tokens)
+    cached = parse_cache.get(key, snapshot.key)
+    if cached is not None:
+        timer.count("cache_hits")
+        return cached
+    timer.count("cache_misses")
+    parsed, sem = parse_tokens(tokens, snapshot, ids)
+    parse_cache.put(key, (parsed, sem), snapshot.key)
+    return parsed, sem
+
+
+def answer_clauses(clauses, order=None, snapshot=None, timer=NULL_TIMER):
+    """
+    Thực thi lần lượt các câu của một tin nhắn trên giỏ hàng order.
+    clauses: [(tokens, có phân tích được hay không, ngữ nghĩa, lỗi)], lỗi là
+    "token_errors"/"parse_errors" (ngữ nghĩa khi đó là thông báo lỗi) hoặc None.
+    Một câu: kết quả như answer_semantics. Nhiều câu: qhnn, qhvp, ll nối bằng "; ",
+    câu trả lời nối theo dòng.
+    Trả về (qhnn, qhvp, ll, answer) và bộ đếm lỗi của cả tin nhắn (hoặc None).
+    """
+    results = []
+    counters = set()
+    for tokens, parsed, sem, error in clauses:
+        if error == "token_errors":
+            results.append(token_error())
+        elif error == "parse_errors":
+            results.append(parse_error(sem))
+        else:
+            results.append(answer_semantics(parsed, sem, order, snapshot, timer))
+            error = None if parsed else "no_parse"
+        counters.add(error)
+    counter = next((name for name in ("token_errors", "parse_errors", "no_parse") if name in counters), None)
+    if len(results) == 1:
+        return results[0], counter
+    qhnn, qhvp, ll, answer = zip(*results)
+    return ("; ".join(qhnn), "; ".join(qhvp), "; ".join(ll), "\n".join(answer)), counter
+
+
+def process_query(query, order=None):
+    """
+    Xử lý một tin nhắn: tách thành các câu theo dấu ngắt câu (và theo văn phạm nếu
+    các câu viết liền nhau), phân tích rồi thực thi lần lượt trên giỏ hàng order.
+    """
+    timer = metrics.timer(query)
+    # Cả tin nhắn dùng một snapshot, kể cả khi data.json được nạp lại giữa chừng
+    snapshot = reloader.snapshot
+    parts = tokenize_parts(query, snapshot)
+    timer.lap("tokenize")
+
+    clauses = []
+    for tokens in parts:
+        if tokens is None:
+            clauses.append((None, False, None, "token_errors"))
+            continue
+        try:
+            clauses.extend(clause + (None,) for clause in parse_clauses(
+                tokens, snapshot, parse=lambda part, ids: cached_parse(part, ids, snapshot, timer)))
+        except Exception as e:
+            clauses.append((tokens, False, e, "parse_errors"))
+    timer.lap("parse")
+
+    if len(clauses) > 1:
+        timer.count("multi_intent")
+    result, counter = answer_clauses(clauses, order, snapshot, timer)
+    tokens = clauses[0][0] if len(clauses) == 1 else None
+    return timer.done(result, counter, tokens, snapshot.parser)
+
+
+def print_cache_stats():
+    stats = parse_cache.stats()
+    print(f"Parse cache: {stats['hits']} hit, {stats['misses']} miss, "
+          f"{stats['evictions']} eviction, {stats['size']} mục")
+    fast_path = reloader.snapshot.fast_path
+    print(f"Đường tắt: {fast_path.hits}/{fast_path.hits + fast_path.misses} câu ({fast_path.hit_rate():.1%})")
+    if reloader.reloads:
+        print(f"Nạp lại data.json: {reloader.reloads} lần, lần cuối {reloader.last_reload_ms:.1f} ms ({reloader.last_reload_kind})")
+    if metrics.enabled:
+        for line in metrics.summary():
+            print(line)
+
+
+def process_record(line_no, session, query):
+    """
+    Xử lý một câu trên giỏ hàng của phiên (current_order nếu không có session).
+    """
+    order = current_order if session is None else order_store.cart(session)
+    try:
+        qhnn, qhvp, ll, answer = process_query(query, order)
+    except Exception as e:
+        qhnn, qhvp, ll, answer = "Error", "No query", "invalid()", f"Lỗi: {e}"
+    return {"line": line_no, "session": session, "query": query,
+            "qhnn": qhnn, "qhvp": qhvp, "ll": ll, "answer": answer}
+
+
+def _process_chunk(records):
+    # Chạy trong tiến trình hiện tại hoặc tiến trình con; trả về các dòng JSONL
+    return [json.dumps(process_record(*record), ensure_ascii=False) + "\n" for record in records]
+
+
+def _init_batch_worker(config, viterbi=None):
+    global metrics, decoder
+    metrics = Metrics(**config)
+    decoder = viterbi
+
+
+def _process_chunk_worker(records):
+    # Trong tiến trình con: trả kèm số liệu đo của khối (nếu bật) để tiến trình chính cộng dồn
+    lines = _process_chunk(records)
+    if not metrics.enabled:
+        return lines, None
+    state = metrics.state()
+    metrics.reset()
+    return lines, state
+
+
+def _batch_lines(records, workers=1, chunk_size=1000):
+    """
+    Sinh các khối dòng JSONL theo đúng thứ tự câu vào.
+
+    workers > 1: mỗi worker là một process pool một tiến trình, các phiên được chia
+    theo crc32(session) nên mọi câu của một phiên chạy lần lượt trên cùng một
+    tiến trình (cùng giỏ hàng). Số khối đang xử lý bị giới hạn để bộ nhớ không
+    tăng theo độ dài luồng vào.
+    """
+    chunks = iter(lambda: list(islice(records, chunk_size)), [])
+    if workers <= 1:
+        for chunk in chunks:
+            yield _process_chunk(chunk)
         return
 
-    with open(SAMPLE_QUERIES_FILE, "r", encoding="utf-8") as f:
-        sample_queries = [line.strip() for line in f if line.strip()]
+    pools = [ProcessPoolExecutor(1, initializer=_init_batch_worker, initargs=(metrics.config(), decoder))
+             for _ in range(workers)]
+    pending = deque()
+
+    def merge(shards, futures):
+        results = [future.result() if future is not None else None for future in futures]
+        for result in results:
+            if result is not None and result[1] is not None:
+                metrics.merge(result[1])
+        results = [iter(result[0]) if result is not None else None for result in results]
+        return [next(results[shard]) for shard in shards]
+
+    try:
+        for chunk in chunks:
+            shards = [zlib.crc32((session or DEFAULT_SESSION).encode("utf-8")) % workers
+                      for _, session, _ in chunk]
+            parts = [[] for _ in range(workers)]
+            for shard, record in zip(shards, chunk):
+                parts[shard].append(record)
+            pending.append((shards, [pools[k].submit(_process_chunk_worker, part) if part else None
+                                     for k, part in enumerate(parts)]))
+            if len(pending) > 2 * workers:
+                yield merge(*pending.popleft())
+        while pending:
+            yield merge(*pending.popleft())
+    finally:
+        for pool in pools:
+            pool.shutdown(cancel_futures=True)
+
+
+def run_batch(input_file, output_file=ANSWERS_FILE, workers=1, chunk_size=1000):
+    """
+    Xử lý luồng câu hỏi từ input_file ("-" là stdin) và ghi mỗi câu một bản ghi JSONL
+    {"line", "session", "query", "qhnn", "qhvp", "ll", "answer"} ra output_file
+    ("-" là stdout), ghi theo khối có đệm.
+    Trả về (số câu, thời gian chạy tính bằng giây).
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be at least 1, got {chunk_size}")
+    f_in = sys.stdin if input_file == "-" else io.open(input_file, "r", encoding="utf-8")
+    f_out = sys.stdout if output_file == "-" else io.open(output_file, "w", encoding="utf-8", buffering=1 << 20)
+    start = time.perf_counter()
+    count = 0
+    try:
+        for lines in _batch_lines(read_records(f_in), workers, chunk_size):
+            f_out.writelines(lines)
+            count += len(lines)
+    finally:
+        if f_in is not sys.stdin:
+            f_in.close()
+        if f_out is not sys.stdout:
+            f_out.close()
+        else:
+            f_out.flush()
+    return count, time.perf_counter() - start
+
 
-    # Xử lý và ghi kết quả
-    with io.open(QHNN_FILE, "w", encoding="utf-8") as f_qhnn, \
-         io.open(QHVP_FILE, "w", encoding="utf-8") as f_qhvp, \
-         io.open(LL_FILE, "w", encoding="utf-8") as f_ll, \
-         io.open(ANSWER_FILE, "w", encoding="utf-8") as f_answer:
+def write_text_outputs(answers_file=ANSWERS_FILE):
+    """
+    Suy ra qhnn.txt, qhvp.txt, ll.txt và answer.txt từ file JSONL của run_batch.
+    """
+    buffering = 1 << 16
+    with io.open(answers_file, "r", encoding="utf-8") as f_in, \
+         io.open(QHNN_FILE, "w", encoding="utf-8", buffering=buffering) as f_qhnn, \
+         io.open(QHVP_FILE, "w", encoding="utf-8", buffering=buffering) as f_qhvp, \
+         io.open(LL_FILE, "w", encoding="utf-8", buffering=buffering) as f_ll, \
+         io.open(ANSWER_FILE, "w", encoding="utf-8", buffering=buffering) as f_answer:
 
         f_qhnn.write("=== QUAN HỆ NGỮ NGHĨA (qhnn.txt) ===\n\n")
         f_qhvp.write("=== QUAN HỆ VĂN PHẠM - DB (qhvp.txt) ===\n\n")
         f_ll.write("=== DẠNG LUẬN LÝ (ll.txt) ===\n\n")
         f_answer.write("=== TRẢ LỜI NGƯỜI DÙNG (answer.txt) ===\n\n")
 
-        for query in sample_queries:
-            qhnn, qhvp, ll, answer = process_query(query)
+        for line in f_in:
+            record = json.loads(line)
+            query = record["query"]
+            f_qhnn.write(f"Câu: {query}\n→ {record['qhnn']}\n\n")
+            f_qhvp.write(f"Câu: {query}\n→ {record['qhvp']}\n\n")
+            f_ll.write(f"Câu: {query}\n→ {record['ll']}\n\n")
+            f_answer.write(f"Q: {query}\nA: {record['answer']}\n\n")
+
+
+def main_cli():
+    print("=== HỆ THỐNG ĐẶT MÓN ĂN Q&A ===")
+    cache_state = "warm (cache)" if reloader.cache_hit else "cold (biên dịch lại)"
+    print(f"Nạp văn phạm: {reloader.load_ms:.1f} ms - {cache_state}")
+    print("Đọc câu hỏi mẫu từ:", SAMPLE_QUERIES_FILE)
+
+    # Đọc file sample-queries.txt
+    if not os.path.exists(SAMPLE_QUERIES_FILE):
+        print(f"Không tìm thấy file {SAMPLE_QUERIES_FILE}")
+        print("Vui lòng tạo file input/sample-queries.txt với các câu hỏi (mỗi dòng một câu).")
+        return
 
-            f_qhnn.write(f"Câu: {query}\n→ {qhnn}\n\n")
-            f_qhvp.write(f"Câu: {query}\n→ {qhvp}\n\n")
-            f_ll.write(f"Câu: {query}\n→ {ll}\n\n")
-            f_answer.write(f"Q: {query}\nA: {answer}\n\n")
+    # Xử lý theo luồng ra answers.jsonl (trong tiến trình này, giỏ hàng current_order
+    # dùng tiếp trong REPL), rồi suy ra 4 file kết quả
+    count, _ = run_batch(SAMPLE_QUERIES_FILE, ANSWERS_FILE)
+    write_text_outputs(ANSWERS_FILE)
 
-    print(f"Đã xử lý {len(sample_queries)} câu hỏi.")
+    print(f"Đã xử lý {count} câu hỏi.")
     print(f"Kết quả được lưu trong thư mục: {OUTPUT_DIR}")
 
-    # Vòng lặp tương tác
+    # Vòng lặp tương tác; sửa data.json trong lúc chạy sẽ được nạp lại tự động
+    reloader.watch()
+    # Phím Tab gợi ý từ kế tiếp theo văn phạm (phân tích tăng dần trên dòng đang gõ)
+    install_readline_completer(lambda: reloader.snapshot)
     print("\nNhập câu lệnh (hoặc 'exit' để thoát):")
     while True:
         try:
             user_input = input("> ").strip()
             if user_input.lower() in ['exit', 'quit', 'thoát']:
+                print_cache_stats()
                 print("Tạm biệt!")
                 break
             if not user_input:
@@ -305,6 +630,7 @@ def main_cli():
             _, _, _, answer = process_query(user_input)
             print(answer)
         except KeyboardInterrupt:
+            print_cache_stats()
             print("\nTạm biệt!")
             break
         except Exception as e:
@@ -312,4 +638,35 @@ def main_cli():
 
 
 if __name__ == "__main__":
-    main_cli()
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Part II: hỏi đáp đặt món (REPL hoặc chế độ batch JSONL)")
+    arg_parser.add_argument("--batch", metavar="FILE",
+                            help="xử lý luồng câu hỏi từ FILE ('-' là stdin): mỗi dòng là một câu "
+                                 "hoặc {\"session\": ..., \"query\": ...}")
+    arg_parser.add_argument("--output", default=ANSWERS_FILE, help="file JSONL kết quả ('-' là stdout)")
+    arg_parser.add_argument("--workers", type=non_negative_int, default=1, help="số tiến trình (các phiên được chia theo session)")
+    arg_parser.add_argument("--chunk-size", type=positive_int, default=1000, help="số câu trong mỗi khối")
+    arg_parser.add_argument("--metrics", nargs="?", const=METRICS_FILE, default=None, metavar="FILE",
+                            help=f"đo từng giai đoạn và ghi số liệu khi kết thúc (mặc định {METRICS_FILE}; "
+                                 "đuôi .prom cho định dạng Prometheus)")
+    arg_parser.add_argument("--slow-ms", type=float, default=None,
+                            help=f"ghi các câu chậm hơn ngưỡng này (ms) vào {SLOW_LOG_FILE}")
+    arg_parser.add_argument("--profile-rate", type=float, default=0.0,
+                            help="tỉ lệ câu chạy dưới cProfile (ghi ra FILE.pstats)")
+    add_decoder_arguments(arg_parser)
+    args = arg_parser.parse_args()
+    decoder = decoder_from_args(args, reloader.snapshot.parser)
+    if args.metrics or args.slow_ms is not None or args.profile_rate:
+        metrics = Metrics(enabled=True, slow_ms=args.slow_ms,
+                          slow_log=SLOW_LOG_FILE if args.slow_ms is not None else None,
+                          profile_rate=args.profile_rate)
+    if args.batch:
+        count, elapsed = run_batch(args.batch, args.output, workers=args.workers, chunk_size=args.chunk_size)
+        rate = count / elapsed if elapsed > 0 else 0.0
+        print(f"Đã xử lý {count} câu trong {elapsed:.2f} giây ({rate:.0f} câu/giây, {args.workers} tiến trình)",
+              file=sys.stderr)
+        if metrics.enabled:
+            print("\n".join(metrics.summary()), file=sys.stderr)
+    else:
+        main_cli()
+    if metrics.enabled:
+        metrics.export(args.metrics or METRICS_FILE)
\ No newline at end of file
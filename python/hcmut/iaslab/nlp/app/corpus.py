@@ -0,0 +1,262 @@
+import argparse
+import io
+import os
+import time
+from collections import Counter
+from itertools import islice
+import numpy as np
+import pandas as pd
+from utils import custom_tokenizer, read_records, positive_int
+from metrics import BUCKETS, Histogram
+from main import OUTPUT_DIR, SAMPLES_FILE, GRAMMAR_CACHE_FILE
+
+# Bảng phân tích corpus (CSV), các khối Parquet (nếu có pyarrow/fastparquet) và báo cáo tổng hợp
+CORPUS_FILE = os.path.join(OUTPUT_DIR, "corpus.csv")
+CORPUS_PARQUET_DIR = os.path.join(OUTPUT_DIR, "corpus-parquet")
+CORPUS_REPORT_FILE = os.path.join(OUTPUT_DIR, "corpus-report.txt")
+
+# Các cột của bảng, theo thứ tự
+COLUMNS = ("line", "query", "status", "tokenizer", "tokens", "type", "food", "quantity",
+           "attributes", "option", "time", "tokenize_us", "parse_us")
+
+# Trạng thái của một câu (cùng tên với các bộ đếm của metrics)
+STATUSES = ("ok", "token_error", "no_parse", "parse_error")
+
+def parquet_engine():
+    """
+    Thư viện ghi Parquet có sẵn ("pyarrow" hoặc "fastparquet"), None nếu không có.
+    """
+    for engine in ("pyarrow", "fastparquet"):
+        try:
+            __import__(engine)
+            return engine
+        except ImportError:
+            pass
+    return None
+
+def _analyze_chunk(snapshot, records, fuzzy):
+    """
+    Tokenize, phân tích và trích ngữ nghĩa một khối câu; trả về DataFrame của khối.
+    Dữ liệu được gom theo cột (list) rồi chuyển một lần, không tạo dict cho mỗi câu.
+    """
+    parser, terminals, fast_path, actions = snapshot.parser, snapshot.terminals, snapshot.fast_path, snapshot.actions
+    columns = {name: [] for name in COLUMNS}
+    perf_counter = time.perf_counter
+    for line_no, _, query in records:
+        start = perf_counter()
+        tokens = custom_tokenizer(query, terminals)
+        tokenizer = "exact"
+        if tokens is None and fuzzy:
+            tokens = snapshot.fuzzy.tokenize(query)
+            tokenizer = "fuzzy"
+        tokenized = perf_counter()
+
+        sem, parse_us = None, np.nan
+        if tokens is None:
+            status, tokenizer = "token_error", None
+        else:
+            try:
+                ids = parser.intern(tokens)
+                sem = fast_path.match(tokens, ids)
+                if sem is None:
+                    parsed, sem = parser.parse_semantics(tokens, actions, ids)
+                    if not parsed:
+                        sem = None
+                status = "ok" if sem is not None else "no_parse"
+            except ValueError:
+                status = "parse_error"
+            parse_us = (perf_counter() - tokenized) * 1e6
+        sem = sem if isinstance(sem, dict) else {}
+
+        columns["line"].append(line_no)
+        columns["query"].append(query)
+        columns["status"].append(status)
+        columns["tokenizer"].append(tokenizer)
+        columns["tokens"].append(len(tokens) if tokens is not None else 0)
+        columns["type"].append(sem.get("type"))
+        columns["food"].append(sem.get("food"))
+        columns["quantity"].append(sem.get("quantity"))
+        attributes = sem.get("attributes")
+        columns["attributes"].append("|".join(attributes) if attributes else None)
+        columns["option"].append(sem.get("option"))
+        columns["time"].append(sem.get("time"))
+        columns["tokenize_us"].append((tokenized - start) * 1e6)
+        columns["parse_us"].append(parse_us)
+    return _frame(columns)
+
+def _frame(columns):
+    # Kiểu cột cố định để mọi khối (và file Parquet) cùng một schema
+    df = pd.DataFrame(columns, columns=COLUMNS)
+    df["line"] = df["line"].astype("int64")
+    df["tokens"] = df["tokens"].astype("int32")
+    df["quantity"] = df["quantity"].astype("Int64")
+    df["tokenize_us"] = df["tokenize_us"].astype("float32")
+    df["parse_us"] = df["parse_us"].astype("float32")
+    for name in ("query", "status", "tokenizer", "type", "food", "attributes", "option", "time"):
+        df[name] = df[name].astype("string")
+    return df
+
+def _ranked(counter):
+    # Giảm dần theo số lần, bằng nhau thì theo tên (không phụ thuộc thứ tự các khối)
+    return sorted(counter.items(), key=lambda item: (-item[1], item[0]))
+
+class CorpusReport:
+    """
+    Tổng hợp dần trên từng khối của bảng (không giữ lại các khối): phân bố trạng thái,
+    loại câu hỏi, món, thuộc tính và số lượng; thời gian tokenize/parse theo histogram
+    của metrics (phân vị ước lượng theo bucket) và thời gian parse trung bình theo loại câu.
+    """
+    def __init__(self):
+        self.rows = 0
+        self.status = Counter()
+        self.intents = Counter()
+        self.foods = Counter()
+        self.attributes = Counter()
+        self.fuzzy = 0
+        self.quantity = Counter()
+        self.tokens = 0
+        self.intent_parse_us = Counter()
+        self.stages = {"tokenize": Histogram(), "parse": Histogram()}
+
+    def add(self, df):
+        self.rows += len(df)
+        self.status.update(df["status"].value_counts().to_dict())
+        self.intents.update(df["type"].value_counts().to_dict())
+        self.foods.update(df["food"].value_counts().to_dict())
+        self.attributes.update(df["attributes"].dropna().str.split("|").explode().value_counts().to_dict())
+        self.fuzzy += int((df["tokenizer"] == "fuzzy").sum())
+        self.quantity.update(df["quantity"].value_counts().to_dict())
+        self.tokens += int(df["tokens"].sum())
+        self.intent_parse_us.update(df.groupby("type")["parse_us"].sum().to_dict())
+        for stage in self.stages:
+            seconds = df[f"{stage}_us"].dropna().to_numpy(dtype=np.float64) / 1e6
+            # Cùng bucket với Histogram.observe (bisect_left)
+            counts = np.bincount(np.searchsorted(BUCKETS, seconds, side="left"), minlength=len(BUCKETS) + 1)
+            self.stages[stage].merge({"counts": counts.tolist(), "count": len(seconds), "sum": float(seconds.sum())})
+
+    def lines(self, top=10):
+        """
+        Các dòng của báo cáo.
+        """
+        rows = self.rows or 1
+        unparsed = self.rows - self.status["ok"]
+        lines = [f"Tổng số câu: {self.rows}, trung bình {self.tokens / rows:.1f} token/câu",
+                 f"Tỉ lệ không phân tích được: {unparsed}/{self.rows} ({unparsed / rows:.2%})"]
+        if self.fuzzy:
+            lines.append(f"Tokenize mờ: {self.fuzzy} câu")
+
+        lines.append("\nTrạng thái:")
+        for status in STATUSES:
+            lines.append(f"  {status:<12} {self.status[status]:>9} {self.status[status] / rows:8.2%}")
+
+        lines.append("\nLoại câu hỏi (thời gian parse trung bình):")
+        for intent, n in _ranked(self.intents):
+            lines.append(f"  {intent:<12} {n:>9} {n / rows:8.2%} {self.intent_parse_us[intent] / n:9.1f} µs")
+
+        lines.append(f"\nMón ăn ({len(self.foods)} món, {top} món nhiều nhất):")
+        lines.extend(f"  {food:<24} {n:>9}" for food, n in _ranked(self.foods)[:top])
+        lines.append(f"\nThuộc tính ({len(self.attributes)}):")
+        lines.extend(f"  {attribute:<24} {n:>9}" for attribute, n in _ranked(self.attributes)[:top])
+        lines.append("\nSố lượng:")
+        lines.extend(f"  {quantity:<24} {n:>9}" for quantity, n in sorted(self.quantity.items()))
+
+        lines.append("\nThời gian:")
+        for stage, h in self.stages.items():
+            mean = h.sum / h.count if h.count else 0.0
+            lines.append(f"  {stage:<10} trung bình {mean * 1e6:9.1f} µs, p50 ≤ {h.quantile(0.5) * 1e6:g} µs, "
+                         f"p90 ≤ {h.quantile(0.9) * 1e6:g} µs, p99 ≤ {h.quantile(0.99) * 1e6:g} µs")
+        return lines
+
+    def write(self, output_file):
+        with io.open(output_file, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.lines()) + "\n")
+
+def analyze_corpus(snapshot, input_file, output_file=CORPUS_FILE, parquet_dir=None, chunk_size=5000, fuzzy=False):
+    """
+    Phân tích một corpus (mỗi dòng một câu hoặc JSON {"query": ...} như cli.py --batch)
+    theo từng khối chunk_size câu: mỗi khối thành một DataFrame, nối vào file CSV
+    output_file và (nếu có parquet_dir) ghi thành một file Parquet riêng; chỉ một khối
+    nằm trong bộ nhớ. Trả về CorpusReport tổng hợp.
+    fuzzy: thử tokenize mờ các câu không tokenize chính xác được (như cli.py).
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be at least 1, got {chunk_size}")
+    report = CorpusReport()
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    if parquet_dir is not None:
+        os.makedirs(parquet_dir, exist_ok=True)
+        for name in os.listdir(parquet_dir):
+            if name.startswith("part-") and name.endswith(".parquet"):
+                os.remove(os.path.join(parquet_dir, name))
+
+    start = time.perf_counter()
+    with io.open(input_file, "r", encoding="utf-8") as f_in, \
+         io.open(output_file, "w", encoding="utf-8", newline="") as f_out:
+        records = read_records(f_in)
+        part = 0
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            df = _analyze_chunk(snapshot, chunk, fuzzy)
+            df.to_csv(f_out, header=part == 0, index=False, float_format="%.1f")
+            if parquet_dir is not None:
+                df.to_parquet(os.path.join(parquet_dir, f"part-{part:05d}.parquet"), index=False)
+            report.add(df)
+            part += 1
+    elapsed = time.perf_counter() - start
+    rate = report.rows / elapsed if elapsed > 0 else 0.0
+    print(f"Đã phân tích {report.rows} câu trong {elapsed:.2f} giây ({rate:.0f} câu/giây, {part} khối)")
+    return report
+
+def report_table(table_file, chunk_size=100000):
+    """
+    Tổng hợp lại từ bảng đã ghi (CSV, hoặc thư mục các khối Parquet), đọc theo khối.
+    """
+    report = CorpusReport()
+    if os.path.isdir(table_file):
+        for name in sorted(os.listdir(table_file)):
+            if name.endswith(".parquet"):
+                report.add(pd.read_parquet(os.path.join(table_file, name)))
+        return report
+    dtype = {"quantity": "Int64", "tokens": "int32", "tokenize_us": "float32", "parse_us": "float32"}
+    dtype.update({name: "string" for name in ("query", "status", "tokenizer", "type", "food", "attributes", "option", "time")})
+    for df in pd.read_csv(table_file, chunksize=chunk_size, dtype=dtype, keep_default_na=False, na_values=[""]):
+        report.add(df)
+    return report
+
+if __name__ == "__main__":
+    from grammar import load_data
+    from grammar_cache import load_compiled_grammar
+    from snapshot import Snapshot
+
+    arg_parser = argparse.ArgumentParser(description="Phân tích corpus thành bảng cột (CSV/Parquet) và báo cáo tổng hợp")
+    arg_parser.add_argument("--input", default=SAMPLES_FILE, help="mỗi dòng một câu hoặc JSON {\"query\": ...}")
+    arg_parser.add_argument("--output", default=CORPUS_FILE, help="file CSV")
+    arg_parser.add_argument("--parquet", nargs="?", const=CORPUS_PARQUET_DIR, default=None, metavar="DIR",
+                            help="ghi thêm mỗi khối thành một file Parquet trong DIR (cần pyarrow hoặc fastparquet)")
+    arg_parser.add_argument("--report", default=CORPUS_REPORT_FILE)
+    arg_parser.add_argument("--chunk-size", type=positive_int, default=5000)
+    arg_parser.add_argument("--fuzzy", action="store_true", help="thử tokenize mờ như cli.py")
+    arg_parser.add_argument("--from-table", metavar="TABLE",
+                            help="chỉ tổng hợp lại từ bảng đã có (CSV hoặc thư mục Parquet), không phân tích")
+    args = arg_parser.parse_args()
+
+    if args.from_table:
+        report = report_table(args.from_table)
+    else:
+        if not os.path.exists(args.input):
+            print(f"Lỗi: Không tìm thấy file {args.input}")
+            raise SystemExit(1)
+        parquet_dir = args.parquet
+        if parquet_dir is not None and parquet_engine() is None:
+            print("Không có pyarrow hoặc fastparquet: bỏ qua Parquet, chỉ ghi CSV")
+            parquet_dir = None
+        compiled, _ = load_compiled_grammar(GRAMMAR_CACHE_FILE)
+        report = analyze_corpus(Snapshot(load_data(), compiled), args.input, args.output, parquet_dir,
+                                args.chunk_size, args.fuzzy)
+        print(f"Bảng: {args.output}" + (f", Parquet: {parquet_dir}" if parquet_dir else ""))
+    report.write(args.report)
+    for line in report.lines():
+        print(line)
+    print(f"Báo cáo: {args.report}")
@@ -0,0 +1,1007 @@
+import copy
+import heapq
+import math
+import time
+from array import array
+from nltk import CFG, Tree
+from nltk.grammar import Nonterminal
+from grammar_analysis import GrammarAnalysis, END
+
+class BudgetExceeded(ValueError):
+    """
+    Phân tích Viterbi vượt ngân sách (số item hoặc thời hạn) của một câu.
+    """
+
+class EarleyParser:
+    """
+    Bộ phân tích Earley biên dịch một lần từ CFG của NLTK.
+
+    - Ký hiệu được mã hóa thành số nguyên: nonterminal là id >= 0,
+      terminal là ~id (số âm).
+    - Tập nullable tính sẵn; khi dự đoán một nonterminal nullable thì dấu chấm
+      được đẩy qua ngay (Aycock-Horspool), tương đương khử luật rỗng một lần.
+    - Luật từ vựng dạng A -> "t" không sinh item mà tra thẳng theo token.
+    - Cây trả về là nltk.Tree, chọn luật theo thứ tự trong văn phạm
+      giống ChartParser, và chỉ dựng khi được yêu cầu.
+    - lexicon = {loại từ vựng: [từ]} (tùy chọn): văn phạm chỉ có một luật giữ chỗ
+      cho mỗi loại đó; mọi từ của loại dùng chung luật này và được tra theo token,
+      nên văn phạm không phình theo kích thước menu.
+    - Phân tích tĩnh (analysis: FIRST/FOLLOW) cho phép loại câu không thể hợp lệ
+      trong O(n) trước khi dựng chart và chỉ dự đoán các luật bắt đầu được bằng
+      token kế tiếp (bật/tắt bằng prune).
+    """
+    def __init__(self, grammar:CFG, lexicon=None):
+        self.grammar = grammar
+        self.nonterminals = []
+        self.nonterminal_ids = {}
+        self.terminals = []
+        self.terminal_ids = {}
+
+        for production in grammar.productions():
+            self._nonterminal_id(production.lhs())
+        self.productions = []
+        self.by_lhs = [[] for _ in self.nonterminals]
+        for production in grammar.productions():
+            lhs = self.nonterminal_ids[production.lhs()]
+            rhs = tuple(
+                self._nonterminal_id(sym) if isinstance(sym, Nonterminal) else ~self._terminal_id(sym)
+                for sym in production.rhs()
+            )
+            self.by_lhs[lhs].append(len(self.productions))
+            self.productions.append((lhs, rhs))
+        # Nonterminal chỉ xuất hiện ở vế phải (không có luật) vẫn có danh sách rỗng
+        self.by_lhs.extend([] for _ in range(len(self.nonterminals) - len(self.by_lhs)))
+        self.start = self.nonterminal_ids[grammar.start()]
+
+        # Luật từ vựng một terminal: lexical[A] = {terminal id: production id}
+        self.lexical = [{} for _ in self.nonterminals]
+        self.phrasal = [[] for _ in self.nonterminals]
+        for lhs, prods in enumerate(self.by_lhs):
+            for p in prods:
+                rhs = self.productions[p][1]
+                if len(rhs) == 1 and rhs[0] < 0:
+                    self.lexical[lhs].setdefault(~rhs[0], p)
+                else:
+                    self.phrasal[lhs].append(p)
+
+        # Loại từ vựng: lexical[A] = {id của từng từ: luật giữ chỗ của A}
+        self.skeleton_terminals = len(self.terminals)
+        self.placeholders = set()
+        self.categories = {}
+        self.category_terminals = []
+        for category in (lexicon or {}):
+            lhs = self.nonterminal_ids.get(Nonterminal(category))
+            if lhs is None or len(self.by_lhs[lhs]) != 1 or not self.lexical[lhs]:
+                raise ValueError("Lexical category %s needs exactly one placeholder production." % category)
+            (placeholder, p), = self.lexical[lhs].items()
+            self.placeholders.add(placeholder)
+            self.categories[category] = lhs
+            self.category_terminals.append((lhs, placeholder))
+        self._set_lexicon(lexicon or {})
+
+        self.nullable = self._compute_nullable()
+        self.analysis = GrammarAnalysis(self.productions, self.nullable, self.phrasal, self.start)
+        self.prune = True
+
+    def _set_lexicon(self, lexicon):
+        for category, words in lexicon.items():
+            lhs = self.categories[category]
+            p = self.by_lhs[lhs][0]
+            self.lexical[lhs] = {self._terminal_id(word): p for word in words}
+
+    def with_lexicon(self, changes):
+        """
+        Bản sao với từ điển đã sửa: changes = {loại: (từ thêm, từ bớt)}.
+        Khung văn phạm, productions, nullable và các loại không đổi được dùng chung
+        với bản cũ (bản cũ giữ nguyên để các câu đang phân tích dở chạy tiếp).
+        """
+        parser = copy.copy(self)
+        parser.terminals = list(self.terminals)
+        parser.terminal_ids = dict(self.terminal_ids)
+        parser.lexical = list(self.lexical)
+        for category, (added, removed) in changes.items():
+            lhs = self.categories[category]
+            p = self.by_lhs[lhs][0]
+            lexical = dict(self.lexical[lhs])
+            for word in removed:
+                lexical.pop(self.terminal_ids.get(word), None)
+            for word in added:
+                lexical[parser._terminal_id(word)] = p
+            parser.lexical[lhs] = lexical
+        return parser
+
+    def is_live(self, word):
+        """
+        word có thể xuất hiện trong câu hay không (terminal của khung văn phạm hoặc từ trong từ điển).
+        """
+        tid = self.terminal_ids.get(word)
+        if tid is None:
+            return False
+        if tid < self.skeleton_terminals and tid not in self.placeholders:
+            return True
+        return any(tid in self.lexical[lhs] for lhs in self.categories.values())
+
+    def vocabulary(self):
+        """
+        Các terminal có thể xuất hiện trong câu (bỏ terminal giữ chỗ và từ đã bị xóa khỏi từ điển).
+        """
+        live = set(range(self.skeleton_terminals)) - self.placeholders
+        for lhs in self.categories.values():
+            live.update(self.lexical[lhs])
+        return [self.terminals[tid] for tid in sorted(live)]
+
+    def token_classes(self, tid):
+        """
+        Các terminal của khung văn phạm mà token tid có thể là: chính nó, và terminal
+        giữ chỗ của mỗi loại từ vựng chứa nó.
+        """
+        classes = () if tid >= self.skeleton_terminals or tid in self.placeholders else (tid,)
+        for lhs, placeholder in self.category_terminals:
+            if tid in self.lexical[lhs]:
+                classes += (placeholder,)
+        return classes
+
+    def _nonterminal_id(self, sym):
+        if sym not in self.nonterminal_ids:
+            self.nonterminal_ids[sym] = len(self.nonterminals)
+            self.nonterminals.append(sym)
+        return self.nonterminal_ids[sym]
+
+    def _terminal_id(self, sym):
+        if sym not in self.terminal_ids:
+            self.terminal_ids[sym] = len(self.terminals)
+            self.terminals.append(sym)
+        return self.terminal_ids[sym]
+
+    def _compute_nullable(self):
+        nullable = [False] * len(self.nonterminals)
+        changed = True
+        while changed:
+            changed = False
+            for lhs, rhs in self.productions:
+                if not nullable[lhs] and all(sym >= 0 and nullable[sym] for sym in rhs):
+                    nullable[lhs] = changed = True
+        return nullable
+
+    def encode(self, tokens):
+        """
+        Đổi token sang id terminal; báo lỗi như ChartParser nếu có từ lạ.
+        """
+        ids = [self.terminal_ids.get(token) for token in tokens]
+        if None in ids:
+            missing = [tok for tok, tid in zip(tokens, ids) if tid is None]
+            raise ValueError("Grammar does not cover some of the input words: %r." % missing)
+        return ids
+
+    def intern(self, tokens):
+        """
+        Dãy id terminal của tokens dạng array gọn ('H', hoặc 'I' khi có hơn 65535 terminal),
+        None nếu có từ lạ. Dùng làm khóa cache (tobytes) và truyền thẳng cho
+        parse_semantics/FastPath.match để không phải tra lại từng chuỗi.
+        """
+        get = self.terminal_ids.get
+        ids = [get(token) for token in tokens]
+        if None in ids:
+            return None
+        return array("H" if len(self.terminals) <= 0xFFFF else "I", ids)
+
+    def chart(self, lookahead=None):
+        """
+        Tạo chart rỗng (cột 0 đã dự đoán ký hiệu bắt đầu).
+        lookahead: các terminal mà token đầu có thể là (None nếu chưa biết).
+        """
+        return EarleyChart(self, lookahead)
+
+    def recognize(self, tokens):
+        """
+        Chỉ kiểm tra câu có thuộc văn phạm hay không, không dựng cây.
+        """
+        return self._accepted_chart(list(tokens)) is not None
+
+    def _accepted_chart(self, tokens, ids=None):
+        if ids is None:
+            ids = self.encode(tokens)
+        if not self.prune:
+            chart = self.chart()
+            for tid in ids:
+                if not chart.push(tid):
+                    return None
+            return chart if chart.accepts() else None
+
+        # Biết cả câu: loại sớm theo cặp token liền nhau, rồi dự đoán theo token kế tiếp
+        classes = [self.token_classes(tid) for tid in ids] + [(END,)]
+        if not self.analysis.possible(classes[:-1]):
+            return None
+        chart = self.chart(classes[0])
+        for k, tid in enumerate(ids):
+            if not chart.push(tid, classes[k + 1]):
+                return None
+        return chart if chart.accepts() else None
+
+    def parse(self, tokens):
+        """
+        Sinh lần lượt (lazy) các cây cú pháp theo cùng thứ tự ưu tiên luật
+        như ChartParser; chỉ lấy cây đầu tiên thì không phải liệt kê hết.
+        """
+        tokens = list(tokens)
+        chart = self._accepted_chart(tokens)
+        if chart is None:
+            return iter(())
+        return _Derivations(chart, tokens).trees(self.start, 0, len(tokens))
+
+    def parse_first(self, tokens):
+        """
+        Trả về cây cú pháp đầu tiên, hoặc None nếu câu không hợp lệ.
+        """
+        tokens = list(tokens)
+        chart = self._accepted_chart(tokens)
+        if chart is None:
+            return None
+        labels = [sym.symbol() for sym in self.nonterminals]
+        return _Derivations(chart, tokens).first(
+            self.start, 0, len(tokens),
+            lambda p, children: Tree(labels[self.productions[p][0]], [value for _, value in children]))
+
+    def parse_forest(self, tokens):
+        """
+        Rừng phân tích (ParseForest) chứa mọi dẫn xuất của câu, hoặc None nếu câu không hợp lệ.
+        """
+        tokens = list(tokens)
+        chart = self._accepted_chart(tokens)
+        if chart is None:
+            return None
+        return ParseForest(_Derivations(chart, tokens))
+
+    def compile_actions(self, table, default):
+        """
+        Gán hành động ngữ nghĩa cho từng production: table ánh xạ tên vế trái
+        sang hàm action(children); luật không có trong table dùng default.
+        """
+        return [table.get(self.nonterminals[lhs].symbol(), default) for lhs, _ in self.productions]
+
+    def chart_size(self, tokens):
+        """
+        Số item trong chart của câu (dừng ở token làm chart chết nếu câu sai),
+        dùng khi ghi log câu chậm; None nếu câu có từ lạ (không dựng được chart).
+        """
+        ids = self.intern(tokens)
+        if ids is None:
+            return None
+        classes = [self.token_classes(tid) for tid in ids] + [(END,)] if self.prune else None
+        chart = self.chart(classes[0] if classes else None)
+        for k, tid in enumerate(ids):
+            if not chart.push(tid, classes[k + 1] if classes else None):
+                break
+        return chart.size()
+
+    def parse_semantics(self, tokens, actions, ids=None):
+        """
+        Tính ngữ nghĩa từ dưới lên trên dẫn xuất đầu tiên (cùng dẫn xuất với
+        parse_first) mà không dựng nltk.Tree. Mỗi action nhận danh sách
+        (nhãn con hoặc None nếu là terminal, giá trị con).
+        ids: kết quả intern(tokens) nếu đã có.
+        Trả về (True, giá trị) hoặc (False, None) nếu câu không hợp lệ.
+        """
+        tokens = list(tokens)
+        chart = self._accepted_chart(tokens, ids)
+        if chart is None:
+            return False, None
+        return True, _Derivations(chart, tokens).first(
+            self.start, 0, len(tokens), lambda p, children: actions[p](children))
+
+    def segment(self, tokens, ids=None):
+        """
+        Tách một dãy token ghép từ nhiều câu thành các câu của văn phạm trong một lượt
+        đọc: chart đọc từng token; khi token kế tiếp làm chart chết thì cắt tại vị trí
+        gần nhất mà phần đã đọc là một câu (khớp dài nhất) và đọc tiếp bằng chart mới
+        từ đó. Chỉ đọc lại các token sau chỗ cắt, nên thời gian tăng tuyến tính theo
+        số câu. Trả về các đoạn [(i, j)], hoặc [] nếu không tách được thành toàn câu hợp lệ.
+        """
+        if ids is None:
+            ids = self.encode(tokens)
+        # Loại nhanh theo terminal mở đầu/kết thúc câu: cần ít nhất một chỗ mà token
+        # trước kết thúc được câu và token sau mở đầu được câu
+        analysis = self.analysis
+        classes = [self.token_classes(tid) for tid in ids]
+        ends = [any(t in analysis.end_terminals for t in c) for c in classes]
+        starts = [any(t in analysis.start_terminals for t in c) for c in classes]
+        if not any(a and b for a, b in zip(ends, starts[1:])):
+            return []
+        spans = []
+        start = k = 0
+        chart = self.chart()
+        accepted = None  # vị trí cuối cùng mà tiền tố đang đọc là một câu
+        while k < len(ids):
+            if chart.push(ids[k]):
+                k += 1
+                if chart.accepts():
+                    accepted = k
+                continue
+            if accepted is None:
+                return []
+            spans.append((start, accepted))
+            start = k = accepted
+            chart, accepted = self.chart(), None
+        if accepted != len(ids):
+            return []
+        spans.append((start, len(ids)))
+        return spans
+
+    def null_derivations(self, costs):
+        """
+        Dẫn xuất rỗng rẻ nhất của mỗi nonterminal nullable theo chi phí costs[p]:
+        {nonterminal: (chi phí, production)}.
+        """
+        best = {}
+        changed = True
+        while changed:
+            changed = False
+            for p, (lhs, rhs) in enumerate(self.productions):
+                if all(sym >= 0 and sym in best for sym in rhs):
+                    cost = costs[p] + sum(best[sym][0] for sym in rhs)
+                    if lhs not in best or cost < best[lhs][0]:
+                        best[lhs] = (cost, p)
+                        changed = True
+        return best
+
+    def viterbi_chart(self, tokens, costs, beam=None, max_items=None, deadline=None, nulls=None, ids=None):
+        """
+        Chart Viterbi đã đọc hết câu (ViterbiChart), None nếu câu không hợp lệ hoặc mọi
+        item đã bị cắt khỏi chùm. Xem ViterbiChart về beam, max_items và deadline.
+        """
+        if ids is None:
+            ids = self.encode(tokens)
+        if nulls is None:
+            nulls = self.null_derivations(costs)
+        classes = None
+        if self.prune:
+            classes = [self.token_classes(tid) for tid in ids] + [(END,)]
+            if not self.analysis.possible(classes[:-1]):
+                return None
+        chart = ViterbiChart(self, costs, nulls, beam, max_items, deadline, classes)
+        for tid in ids:
+            if not chart.push(tid):
+                return None
+        return chart if chart.best() is not None else None
+
+    def parse_viterbi(self, tokens, costs, beam=None, max_items=None, deadline=None, nulls=None, ids=None, build=None):
+        """
+        Cây có tổng chi phí nhỏ nhất (costs[p], ví dụ -log xác suất của production p),
+        tìm bằng Earley Viterbi có cắt chùm: (chi phí, nltk.Tree), hoặc None nếu câu
+        không hợp lệ. build(p, children) như parse_semantics để tính giá trị khác thay cây.
+        Báo BudgetExceeded nếu vượt max_items hoặc deadline (thời điểm perf_counter).
+        """
+        tokens = list(tokens)
+        chart = self.viterbi_chart(tokens, costs, beam, max_items, deadline, nulls, ids)
+        if chart is None:
+            return None
+        if build is None:
+            labels = [sym.symbol() for sym in self.nonterminals]
+            build = lambda p, children: Tree(labels[self.productions[p][0]], [value for _, value in children])
+        return chart.best(), chart.build(tokens, build)
+
+class EarleyChart:
+    """
+    Chart Earley mở rộng được theo từng token.
+    Item là bộ (production, vị trí chấm, cột bắt đầu).
+    """
+    def __init__(self, engine:EarleyParser, lookahead=None):
+        self.engine = engine
+        self.tokens = []
+        # ends[j] = {(A, i)}: A phủ đoạn token[i:j]
+        self.ends = []
+        self._waiting = []    # cột j: {nonterminal kế tiếp: [item]}
+        self._scanning = []   # cột j: {terminal id kế tiếp: [item]}
+        self._lexical = []    # cột j: các nonterminal có luật từ vựng đã được dự đoán
+        start = engine.start
+        prods = engine.phrasal[start] if lookahead is None else engine.analysis.predictions(start, lookahead)
+        self._add_column([(p, 0, 0) for p in prods], [start], lookahead)
+
+    def _add_column(self, seeds, lexical_predictions=(), lookahead=None):
+        """
+        Dựng cột mới từ các item hạt giống. lookahead (các terminal mà token kế tiếp
+        có thể là, (END,) nếu hết câu) cho phép bỏ các luật không thể bắt đầu bằng
+        token đó; None thì dự đoán mọi luật (chưa biết token kế tiếp).
+        """
+        engine = self.engine
+        productions, nullable = engine.productions, engine.nullable
+        analysis = engine.analysis
+        j = len(self.ends)
+        ends, waiting, scanning = set(), {}, {}
+        predicted = set(lexical_predictions)
+        lexical = list(lexical_predictions)
+        self.ends.append(ends)
+        self._waiting.append(waiting)
+        self._scanning.append(scanning)
+        self._lexical.append(lexical)
+
+        seen = set()
+        agenda = []
+        for item in seeds:
+            if item not in seen:
+                seen.add(item)
+                agenda.append(item)
+        while agenda:
+            p, d, o = agenda.pop()
+            lhs, rhs = productions[p]
+            if d == len(rhs):
+                if (lhs, o) in ends:
+                    continue
+                ends.add((lhs, o))
+                new_items = [(p2, d2 + 1, o2) for p2, d2, o2 in self._waiting[o].get(lhs, ())]
+            else:
+                sym = rhs[d]
+                if sym < 0:
+                    scanning.setdefault(~sym, []).append((p, d, o))
+                    continue
+                waiting.setdefault(sym, []).append((p, d, o))
+                new_items = []
+                if sym not in predicted:
+                    predicted.add(sym)
+                    if engine.lexical[sym]:
+                        lexical.append(sym)
+                    prods = engine.phrasal[sym] if lookahead is None else analysis.predictions(sym, lookahead)
+                    new_items.extend((q, 0, j) for q in prods)
+                if nullable[sym]:
+                    new_items.append((p, d + 1, o))
+                # Nonterminal đã hoàn tất trong cùng cột trước khi item này tới
+                if (sym, j) in ends:
+                    new_items.append((p, d + 1, o))
+            for item in new_items:
+                if item not in seen:
+                    seen.add(item)
+                    agenda.append(item)
+
+    def push(self, tid, lookahead=None):
+        """
+        Đọc thêm một token (id terminal). Trả về False nếu không còn
+        item nào sống, tức tiền tố hiện tại không thể thành câu hợp lệ.
+        lookahead: như trong _add_column, cho token sau token này.
+        """
+        engine = self.engine
+        j = len(self.ends) - 1
+        seeds = [(p, d + 1, o) for p, d, o in self._scanning[j].get(tid, ())]
+        for sym in self._lexical[j]:
+            p = engine.lexical[sym].get(tid)
+            if p is not None:
+                seeds.append((p, 1, j))
+        self.tokens.append(tid)
+        self._add_column(seeds, (), lookahead)
+        return bool(seeds)
+
+    def accepts(self):
+        return (self.engine.start, 0) in self.ends[-1]
+
+    def size(self):
+        """
+        Số item trong chart: các đoạn đã hoàn tất và các item đang chờ nonterminal/terminal.
+        """
+        return (sum(len(ends) for ends in self.ends)
+                + sum(len(items) for column in self._waiting + self._scanning for items in column.values()))
+
+    def truncate(self, n):
+        """
+        Quay lại trạng thái sau n token đầu (bỏ các cột sau đó), để sửa hoặc xóa
+        phần cuối câu mà không phân tích lại từ đầu.
+        """
+        del self.tokens[n:]
+        for columns in (self.ends, self._waiting, self._scanning, self._lexical):
+            del columns[n + 1:]
+
+    def next_terminal_sets(self):
+        """
+        Các tập id terminal có thể là token kế tiếp: terminal của khung văn phạm
+        đang chờ đọc, rồi bảng từ của từng loại từ vựng đã được dự đoán.
+        """
+        j = len(self.ends) - 1
+        lexical = self.engine.lexical
+        return [self._scanning[j]] + [lexical[sym] for sym in self._lexical[j]]
+
+    def next_terminals(self, limit=None):
+        """
+        Các terminal có thể là token kế tiếp, tối đa limit từ.
+        """
+        engine = self.engine
+        result, seen = [], set()
+        for tids in self.next_terminal_sets():
+            for tid in tids:
+                if tid in seen or tid in engine.placeholders:
+                    continue
+                seen.add(tid)
+                result.append(engine.terminals[tid])
+                if limit is not None and len(result) >= limit:
+                    return result
+        return result
+
+    def spans(self, lhs, i):
+        """
+        Các vị trí kết thúc j sao cho lhs phủ token[i:j], tăng dần.
+        """
+        result = [j for j in range(i, len(self.ends)) if (lhs, i) in self.ends[j]]
+        if self.engine.nullable[lhs] and (not result or result[0] != i):
+            result.insert(0, i)
+        return result
+
+class ViterbiChart:
+    """
+    Chart Earley có trọng số (Viterbi, kiểu Stolcke), mở rộng được theo từng token.
+
+    Mỗi item (production, vị trí chấm, cột bắt đầu) mang alpha: chi phí nhỏ nhất của
+    cả tiền tố đã đọc đi qua item, và gamma: chi phí phần đã phủ của riêng item.
+    Trong mỗi cột, item được lấy ra theo alpha tăng dần bằng heap (chi phí >= 0 nên
+    lần đầu lấy ra là tốt nhất), kèm con trỏ ngược để dựng dẫn xuất tốt nhất.
+
+    Giới hạn độ trễ:
+    - beam: mỗi cột chỉ giữ tối đa beam item tốt nhất trong số các item vừa đọc
+      token (các item dự đoán/hoàn tất sau đó suy ra từ chúng); phần còn lại bị bỏ,
+      có thể mất dẫn xuất tốt nhất, thậm chí không còn phân tích được;
+    - max_items: tổng số item của cả câu, vượt thì báo BudgetExceeded;
+    - deadline: thời điểm time.perf_counter(), quá hạn thì báo BudgetExceeded.
+    Nonterminal nullable được đi qua ngay với chi phí dẫn xuất rỗng rẻ nhất (nulls).
+    """
+    def __init__(self, engine:EarleyParser, costs, nulls, beam=None, max_items=None, deadline=None, classes=None):
+        self.engine = engine
+        self.costs = costs
+        self.nulls = nulls
+        self.beam = beam
+        self.max_items = max_items
+        self.deadline = deadline
+        # classes[k]: các terminal mà token k có thể là, (END,) ở cuối; None thì không cắt tỉa dự đoán
+        self.classes = classes
+        self.tokens = []
+        self.items = []       # cột j: {item: (alpha, gamma, con trỏ ngược)}
+        self.completed = []   # cột j: {(A, i): item hoàn tất tốt nhất của A phủ token[i:j]}
+        self._waiting = []    # cột j: {nonterminal kế tiếp: [item]}
+        self._scanning = []   # cột j: {terminal id kế tiếp: [item]}
+        self._predicted = []  # cột j: {nonterminal đã dự đoán: alpha của item dự đoán}
+        self._lexical = []    # cột j: các nonterminal có luật từ vựng đã được dự đoán
+        self.size = 0
+        start = engine.start
+        self._add_column([], {start: 0.0})
+
+    def _predictions(self, sym, j):
+        if self.classes is None:
+            return self.engine.phrasal[sym]
+        return self.engine.analysis.predictions(sym, self.classes[j])
+
+    def _add_column(self, seeds, predicted=None):
+        """
+        Dựng cột mới từ các hạt giống (alpha, thứ tự, item, gamma, con trỏ ngược).
+        predicted: các nonterminal được dự đoán sẵn ở cột này kèm alpha.
+        """
+        engine, costs, nulls = self.engine, self.costs, self.nulls
+        productions = engine.productions
+        j = len(self.items)
+        items, completed, waiting, scanning = {}, {}, {}, {}
+        predicted = dict(predicted or {})
+        lexical = [sym for sym in predicted if engine.lexical[sym]]
+        self.items.append(items)
+        self.completed.append(completed)
+        self._waiting.append(waiting)
+        self._scanning.append(scanning)
+        self._predicted.append(predicted)
+        self._lexical.append(lexical)
+
+        heap = list(seeds)
+        if self.beam is not None and len(heap) > self.beam:
+            # Cắt chùm: chỉ giữ beam item đọc token tốt nhất (khác nhau) làm hạt giống
+            best = {}
+            for seed in sorted(heap):
+                best.setdefault(seed[2], seed)
+            heap = list(best.values())[:self.beam]
+        order = len(seeds)
+        for sym, alpha in predicted.items():
+            for q in self._predictions(sym, j):
+                heap.append((alpha + costs[q], order, (q, 0, j), costs[q], None))
+                order += 1
+        heapq.heapify(heap)
+        while heap:
+            alpha, _, item, gamma, back = heapq.heappop(heap)
+            if item in items:
+                continue
+            items[item] = (alpha, gamma, back)
+            self.size += 1
+            if self.max_items is not None and self.size > self.max_items:
+                raise BudgetExceeded("Parse budget exceeded: more than %d items." % self.max_items)
+            if self.deadline is not None and not self.size & 31 and time.perf_counter() > self.deadline:
+                raise BudgetExceeded("Parse budget exceeded: deadline passed after %d items." % self.size)
+
+            p, d, o = item
+            lhs, rhs = productions[p]
+            new_items = []
+            if d == len(rhs):
+                if (lhs, o) in completed:
+                    continue
+                completed[(lhs, o)] = item
+                column = self.items[o]
+                for waiting_item in list(self._waiting[o].get(lhs, ())):
+                    p2, d2, o2 = waiting_item
+                    alpha2, gamma2, _ = column[waiting_item]
+                    new_items.append((alpha2 + gamma, (p2, d2 + 1, o2), gamma2 + gamma, ((waiting_item, o), (lhs, item, j))))
+            else:
+                sym = rhs[d]
+                if sym < 0:
+                    scanning.setdefault(~sym, []).append(item)
+                    continue
+                waiting.setdefault(sym, []).append(item)
+                if sym not in predicted:
+                    predicted[sym] = alpha
+                    if engine.lexical[sym]:
+                        lexical.append(sym)
+                    for q in self._predictions(sym, j):
+                        new_items.append((alpha + costs[q], (q, 0, j), costs[q], None))
+                null = nulls.get(sym)
+                if null is not None:
+                    new_items.append((alpha + null[0], (p, d + 1, o), gamma + null[0], ((item, j), (sym, None, None))))
+            for alpha2, item2, gamma2, back2 in new_items:
+                if item2 not in items:
+                    heapq.heappush(heap, (alpha2, order, item2, gamma2, back2))
+                    order += 1
+
+    def push(self, tid):
+        """
+        Đọc thêm một token (id terminal). Trả về False nếu không còn item nào sống.
+        """
+        engine = self.engine
+        j = len(self.items) - 1
+        column = self.items[j]
+        seeds = []
+        for item in self._scanning[j].get(tid, ()):
+            p, d, o = item
+            alpha, gamma, _ = column[item]
+            seeds.append((alpha, len(seeds), (p, d + 1, o), gamma, ((item, j), (None, j, None))))
+        for sym in self._lexical[j]:
+            p = engine.lexical[sym].get(tid)
+            if p is not None:
+                cost = self.costs[p]
+                seeds.append((self._predicted[j][sym] + cost, len(seeds), (p, 1, j), cost, (None, (None, j, None))))
+        self.tokens.append(tid)
+        self._add_column(seeds)
+        return bool(self.items[-1])
+
+    def best(self):
+        """
+        Chi phí của dẫn xuất tốt nhất còn trong chùm cho cả câu đã đọc, None nếu không có.
+        """
+        item = self.completed[-1].get((self.engine.start, 0))
+        return None if item is None else self.items[-1][item][1]
+
+    def build(self, tokens, build):
+        """
+        Dựng dẫn xuất tốt nhất bằng build(p, children) (xem EarleyParser.parse_semantics).
+        """
+        item = self.completed[-1][(self.engine.start, 0)]
+        return self._build(item, len(self.items) - 1, tokens, build)
+
+    def _build(self, item, j, tokens, build):
+        labels = self.engine.nonterminals
+        children = []
+        back = self.items[j][item][2]
+        # Đi ngược từ item hoàn tất về item dự đoán: mỗi bước thêm một con (token,
+        # thành phần đã hoàn tất hoặc nonterminal rỗng)
+        while back is not None:
+            previous, (sym, child, end) = back
+            if sym is None:
+                children.append((None, tokens[child]))
+            elif child is None:
+                children.append((labels[sym].symbol(), self._build_null(sym, build)))
+            else:
+                children.append((labels[sym].symbol(), self._build(child, end, tokens, build)))
+            if previous is None:
+                break
+            item, j = previous
+            back = self.items[j][item][2]
+        children.reverse()
+        return build(item[0], children)
+
+    def _build_null(self, sym, build):
+        p = self.nulls[sym][1]
+        labels = self.engine.nonterminals
+        return build(p, [(labels[child].symbol(), self._build_null(child, build))
+                         for child in self.engine.productions[p][1]])
+
+
+class ParseForest:
+    """
+    Rừng phân tích dùng chung (SPPF) của một câu, dựng dần từ chart đã nhận câu.
+
+    - Nút ký hiệu ("S", A, i, j): A phủ token[i:j]; mỗi luật của A khớp đoạn này
+      là một nhánh (cạnh) gói tại nút.
+    - Nút trung gian ("I", p, k, i, j): phần rhs[k:] của luật p phủ token[i:j];
+      mỗi điểm cắt cho ký hiệu rhs[k] là một cạnh với tối đa hai con.
+    Có O(|G| n^2) nút và O(|G| n^3) cạnh nên đếm dẫn xuất và lấy k cây tốt nhất
+    chỉ đi trên các nút này, không liệt kê từng cây.
+    """
+    def __init__(self, derivations):
+        self._derivations = derivations
+        self.engine = derivations.engine
+        self.tokens = derivations.tokens
+        self.root = ("S", self.engine.start, 0, len(self.tokens))
+        self._edges = {}
+        self._counts = {}
+        self._best = {}
+
+    def edges(self, node):
+        """
+        Các cạnh gói tại node: danh sách (production hoặc None, các nút con).
+        """
+        edges = self._edges.get(node)
+        if edges is not None:
+            return edges
+        derivations, productions = self._derivations, self.engine.productions
+        if node[0] == "S":
+            _, lhs, i, j = node
+            edges = [(p, (("I", p, 0, i, j),)) for p in self.engine.by_lhs[lhs] if derivations.fits(p, 0, i, j)]
+        else:
+            _, p, k, i, j = node
+            rhs = productions[p][1]
+            if k == len(rhs):
+                edges = [(None, ())]
+            elif rhs[k] < 0:
+                edges = [(None, (("I", p, k + 1, i + 1, j),))]
+            else:
+                edges = [(None, (("S", rhs[k], i, e), ("I", p, k + 1, e, j)))
+                         for e in derivations.spans(rhs[k], i) if e <= j and derivations.fits(p, k + 1, e, j)]
+        self._edges[node] = edges
+        return edges
+
+    def nodes(self):
+        """
+        Các nút đi tới được từ gốc (mỗi nút một lần).
+        """
+        seen, stack = {self.root}, [self.root]
+        while stack:
+            node = stack.pop()
+            for _, tails in self.edges(node):
+                for tail in tails:
+                    if tail not in seen:
+                        seen.add(tail)
+                        stack.append(tail)
+        return seen
+
+    def count(self, node=None):
+        """
+        Số dẫn xuất (cây) của node (mặc định: gốc), tính trên rừng không liệt kê cây;
+        math.inf nếu văn phạm có chu trình (A =>+ A) trong đoạn này.
+        """
+        node = self.root if node is None else node
+        counts = self._counts
+        if node in counts:
+            # None: đang tính dở, tức gặp lại chính nó qua một chu trình
+            return math.inf if counts[node] is None else counts[node]
+        counts[node] = None
+        total = 0
+        for _, tails in self.edges(node):
+            product = 1
+            for tail in tails:
+                product *= self.count(tail)
+            total += product
+        counts[node] = total
+        return total
+
+    def ambiguities(self):
+        """
+        Các điểm gói (nút có hơn một cạnh): danh sách (mô tả, i, j, số cạnh).
+        Nút ký hiệu được mô tả bằng tên nonterminal (nhiều luật khớp); nút trung gian
+        bằng luật có dấu • tại ký hiệu có nhiều điểm cắt.
+        """
+        result = []
+        for node in self.nodes():
+            edges = self.edges(node)
+            if len(edges) > 1:
+                result.append((self._describe(node), node[-2], node[-1], len(edges)))
+        result.sort(key=lambda x: (x[1], x[2], x[0]))
+        return result
+
+    def _describe(self, node):
+        labels = self.engine.nonterminals
+        if node[0] == "S":
+            return labels[node[1]].symbol()
+        _, p, k, _, _ = node
+        lhs, rhs = self.engine.productions[p]
+        names = [labels[sym].symbol() if sym >= 0 else repr(self.engine.terminals[~sym]) for sym in rhs]
+        return "%s -> %s" % (labels[lhs].symbol(), " ".join(names[:k] + ["•"] + names[k:]))
+
+    def first(self):
+        """
+        Cây đầu tiên (giống EarleyParser.parse_first).
+        """
+        labels = [sym.symbol() for sym in self.engine.nonterminals]
+        productions = self.engine.productions
+        return self._derivations.first(
+            self.engine.start, 0, len(self.tokens),
+            lambda p, children: Tree(labels[productions[p][0]], [value for _, value in children]))
+
+    def trees(self):
+        """
+        Liệt kê lần lượt (lazy) mọi cây, theo thứ tự của EarleyParser.parse.
+        """
+        return self._derivations.trees(self.engine.start, 0, len(self.tokens))
+
+    def kbest(self, k, weights=None):
+        """
+        k cây có tổng trọng số nhỏ nhất: danh sách (trọng số, nltk.Tree) tăng dần.
+        weights[p] là chi phí của production p (ví dụ -log xác suất); không có
+        weights thì mọi cây bằng nhau và thứ tự giống trees().
+        Mỗi nút chỉ giữ k dẫn xuất tốt nhất, ghép từ danh sách của các con bằng heap.
+        """
+        self._best = {}
+        self._best_k, self._weights = k, weights
+        best = self._kbest(self.root)
+        return [(cost, self._tree(self.root, rank)) for rank, (cost, _, _) in enumerate(best)]
+
+    def _kbest(self, node):
+        best = self._best
+        if node in best:
+            # Đang tính dở (chu trình): bỏ nhánh này, chỉ giữ dẫn xuất hữu hạn
+            return best[node] or []
+        best[node] = None
+        weights = self._weights
+        edges = self.edges(node)
+        lists, heap = [], []
+        for e, (p, tails) in enumerate(edges):
+            tail_lists = [self._kbest(tail) for tail in tails]
+            lists.append(tail_lists)
+            if all(tail_lists):
+                cost = (weights[p] if weights is not None and p is not None else 0)
+                heap.append((cost + sum(l[0][0] for l in tail_lists), e, (0,) * len(tails)))
+        heapq.heapify(heap)
+        seen = {(e, ranks) for _, e, ranks in heap}
+        result = []
+        while heap and len(result) < self._best_k:
+            cost, e, ranks = heapq.heappop(heap)
+            result.append((cost, e, ranks))
+            tail_lists = lists[e]
+            for t, rank in enumerate(ranks):
+                if rank + 1 < len(tail_lists[t]):
+                    successor = ranks[:t] + (rank + 1,) + ranks[t + 1:]
+                    if (e, successor) not in seen:
+                        seen.add((e, successor))
+                        heapq.heappush(heap, (cost - tail_lists[t][rank][0] + tail_lists[t][rank + 1][0], e, successor))
+        best[node] = result
+        return result
+
+    def _tree(self, node, rank):
+        # Nút ký hiệu -> nltk.Tree; nút trung gian -> danh sách con của phần rhs[k:]
+        _, e, ranks = self._best[node][rank]
+        _, tails = self.edges(node)[e]
+        if node[0] == "S":
+            return Tree(self.engine.nonterminals[node[1]].symbol(), self._tree(tails[0], ranks[0]))
+        _, p, k, i, _ = node
+        rhs = self.engine.productions[p][1]
+        if k == len(rhs):
+            return []
+        if rhs[k] < 0:
+            return [self.tokens[i]] + self._tree(tails[0], ranks[0])
+        return [self._tree(tails[0], ranks[0])] + self._tree(tails[1], ranks[1])
+
+class _Derivations:
+    """
+    Duyệt các dẫn xuất trong chart đã nhận câu để dựng cây theo yêu cầu.
+    """
+    def __init__(self, chart:EarleyChart, tokens):
+        self.chart = chart
+        self.engine = chart.engine
+        self.tokens = tokens
+        self._spans = {}
+        self._fits = {}
+
+    def spans(self, lhs, i):
+        key = (lhs, i)
+        if key not in self._spans:
+            self._spans[key] = self.chart.spans(lhs, i)
+        return self._spans[key]
+
+    def fits(self, p, k, i, j):
+        """
+        Phần rhs[k:] của production p có phủ đúng token[i:j] hay không.
+        """
+        key = (p, k, i, j)
+        if key in self._fits:
+            return self._fits[key]
+        rhs = self.engine.productions[p][1]
+        if k == len(rhs):
+            ok = i == j
+        elif rhs[k] < 0:
+            # Luật từ vựng (kể cả luật giữ chỗ của loại từ vựng) khớp qua bảng lexical
+            ok = (i < j and (self.chart.tokens[i] == ~rhs[k]
+                             or self.engine.lexical[self.engine.productions[p][0]].get(self.chart.tokens[i]) == p)
+                  and self.fits(p, k + 1, i + 1, j))
+        else:
+            ok = any(e <= j and self.fits(p, k + 1, e, j) for e in self.spans(rhs[k], i))
+        self._fits[key] = ok
+        return ok
+
+    def first(self, lhs, i, j, build):
+        """
+        Dựng dẫn xuất đầu tiên của lhs trên token[i:j] bằng hàm build(p, children),
+        children là danh sách (nhãn con hoặc None, giá trị con).
+        """
+        productions, labels = self.engine.productions, self.engine.nonterminals
+        for p in self.engine.by_lhs[lhs]:
+            if not self.fits(p, 0, i, j):
+                continue
+            children = []
+            pos = i
+            for k, sym in enumerate(productions[p][1]):
+                if sym < 0:
+                    children.append((None, self.tokens[pos]))
+                    pos += 1
+                else:
+                    end = next(e for e in self.spans(sym, pos) if e <= j and self.fits(p, k + 1, e, j))
+                    children.append((labels[sym].symbol(), self.first(sym, pos, end, build)))
+                    pos = end
+            return build(p, children)
+
+    def trees(self, lhs, i, j):
+        label = self.engine.nonterminals[lhs].symbol()
+        for p in self.engine.by_lhs[lhs]:
+            if self.fits(p, 0, i, j):
+                for children in self._children(p, 0, i, j):
+                    yield Tree(label, children)
+
+    def _children(self, p, k, i, j):
+        rhs = self.engine.productions[p][1]
+        if k == len(rhs):
+            yield []
+            return
+        sym = rhs[k]
+        if sym < 0:
+            for rest in self._children(p, k + 1, i + 1, j):
+                yield [self.tokens[i]] + rest
+            return
+        for e in self.spans(sym, i):
+            if e <= j and self.fits(p, k + 1, e, j):
+                for child in self.trees(sym, i, e):
+                    for rest in self._children(p, k + 1, e, j):
+                        yield [child] + rest
+
+def verify_against_nltk(parser, grammar:CFG, token_lists):
+    """
+    So sánh parse_first với cây đầu tiên của nltk.ChartParser trên cùng văn phạm
+    (kiểm tra hồi quy khi sửa chart: từ vựng, cắt tỉa dự đoán, intern, tách câu...).
+    Trả về danh sách (tokens, cây của EarleyParser, cây của NLTK) khác nhau.
+    """
+    from nltk import ChartParser
+    reference = ChartParser(grammar)
+    differences = []
+    for tokens in token_lists:
+        try:
+            expected = next(iter(reference.parse(tokens)), None)
+        except ValueError:
+            expected = None
+        try:
+            tree = parser.parse_first(tokens)
+        except ValueError:
+            tree = None
+        if tree != expected:
+            differences.append((tokens, tree, expected))
+    return differences
+
+if __name__ == "__main__":
+    import argparse
+    import io
+    import sys
+    from grammar_cache import load_compiled_grammar
+    from main import GRAMMAR_CACHE_FILE, INPUT_SENTENCES_FILE
+    from utils import custom_tokenizer
+
+    arg_parser = argparse.ArgumentParser(description="Kiểm tra EarleyParser.parse_first so với nltk.ChartParser")
+    arg_parser.add_argument("--files", nargs="+", default=[INPUT_SENTENCES_FILE],
+                            help="file câu cần kiểm tra (mỗi dòng một câu), ví dụ thêm output/samples.txt")
+    args = arg_parser.parse_args()
+
+    compiled, _ = load_compiled_grammar(GRAMMAR_CACHE_FILE)
+    failed = False
+    for file in args.files:
+        with io.open(file, "r", encoding="utf-8") as f:
+            sentences = [line.strip() for line in f if line.strip()]
+        token_lists = [tokens for tokens in (custom_tokenizer(s, compiled.trie) for s in sentences) if tokens is not None]
+        start = time.perf_counter()
+        differences = verify_against_nltk(compiled.parser, compiled.grammar, token_lists)
+        for tokens, tree, expected in differences:
+            print(f"KHÁC: {' '.join(tokens)}\n  Earley: {tree}\n  NLTK:   {expected}")
+        print(f"{file}: {len(token_lists)}/{len(sentences)} câu tokenize được, {len(differences)} khác biệt "
+              f"({time.perf_counter() - start:.1f} giây)")
+        failed |= bool(differences)
+    sys.exit(1 if failed else 0)
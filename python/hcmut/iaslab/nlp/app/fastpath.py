@@ -0,0 +1,202 @@
+import argparse
+import copy
+import io
+import time
+from earley import EarleyParser
+
+# Các dạng câu hỏi thường gặp được đi tắt, không cần phân tích chart
+FAST_PATH_TARGETS = ('Q_PRICE', 'Q_AVAIL', 'Q_MENU', 'Q_STATUS', 'Q_FILTER')
+
+class FastPath:
+    """
+    Bộ khớp mẫu đi tắt, suy ra tự động từ các production của văn phạm.
+
+    Ký hiệu bắt đầu được khai triển thành mọi "khuôn" (shape): dãy các
+    tiền-terminal (nonterminal chỉ có luật từ vựng hoặc luật rỗng) kèm khung
+    dẫn xuất. Các khuôn được xếp vào một trie theo dãy tiền-terminal.
+    Một dãy token được trả lời ngay khi khớp đúng một khuôn và khuôn đó thuộc
+    FAST_PATH_TARGETS; câu nhập nhằng hoặc dạng khác quay về bộ phân tích đầy đủ.
+    """
+    def __init__(self, parser:EarleyParser, actions, targets=FAST_PATH_TARGETS, max_shapes=100000):
+        self.parser = parser
+        self.actions = actions
+        self.hits = 0
+        self.misses = 0
+
+        productions = parser.productions
+        self.preterminal = [
+            bool(prods) and all(not rhs or (len(rhs) == 1 and rhs[0] < 0)
+                                for rhs in (productions[p][1] for p in prods))
+            for prods in parser.by_lhs
+        ]
+        self.targets = {parser.nonterminal_ids[sym] for sym in parser.nonterminals if sym.symbol() in targets}
+
+        self.categories = self._index_categories(parser)
+
+        self.trie = {}
+        self._max_shapes = max_shapes
+        shapes = self._expand(parser.start, False, ())
+        self.shape_count = len(shapes)
+        for skeleton, sequence, is_target in shapes:
+            node = self.trie
+            for category in sequence:
+                node = node.setdefault(category, {})
+            node.setdefault(None, []).append((skeleton, is_target))
+
+    def _index_categories(self, parser):
+        # Các tiền-terminal chứa mỗi terminal: categories[terminal id] = [nonterminal id]
+        categories = [[] for _ in parser.terminals]
+        for lhs, lexical in enumerate(parser.lexical):
+            if self.preterminal[lhs]:
+                for tid in lexical:
+                    categories[tid].append(lhs)
+        return categories
+
+    def with_parser(self, parser:EarleyParser, words=None):
+        """
+        Bản sao cho bộ phân tích có từ điển mới (cùng khung văn phạm):
+        các khuôn giữ nguyên, chỉ dựng lại chỉ mục terminal -> tiền-terminal
+        (chỉ cho các từ trong words nếu biết những từ nào thay đổi).
+        """
+        fast_path = copy.copy(self)
+        fast_path.parser = parser
+        if words is None:
+            fast_path.categories = self._index_categories(parser)
+            return fast_path
+        categories = list(self.categories)
+        categories.extend([] for _ in range(len(parser.terminals) - len(categories)))
+        for word in words:
+            tid = parser.terminal_ids[word]
+            categories[tid] = [lhs for lhs, lexical in enumerate(parser.lexical)
+                               if self.preterminal[lhs] and tid in lexical]
+        fast_path.categories = categories
+        return fast_path
+
+    def _expand(self, sym, is_target, stack):
+        """
+        Khai triển sym thành danh sách (khung, dãy tiền-terminal, có thuộc target).
+        Khung là ("slot", nonterminal) hoặc (production, [khung con]).
+        """
+        parser = self.parser
+        if sym < 0:
+            return [(("slot", sym), [sym], is_target)]
+        if sym in stack:
+            raise ValueError("Văn phạm đệ quy: không khai triển được khuôn đi tắt")
+        is_target = is_target or sym in self.targets
+        if self.preterminal[sym]:
+            result = []
+            if parser.lexical[sym]:
+                result.append((("slot", sym), [sym], is_target))
+            result.extend(((p, []), [], is_target) for p in parser.by_lhs[sym] if not parser.productions[p][1])
+            return result
+
+        result = []
+        for p in parser.by_lhs[sym]:
+            partial = [([], [], is_target)]
+            for child in parser.productions[p][1]:
+                options = self._expand(child, is_target, stack + (sym,))
+                partial = [(skels + [skel], seq + sub_seq, flag or sub_flag)
+                           for skels, seq, flag in partial
+                           for skel, sub_seq, sub_flag in options]
+                if len(partial) > self._max_shapes:
+                    raise ValueError("Quá nhiều khuôn đi tắt")
+            result.extend(((p, skels), seq, flag) for skels, seq, flag in partial)
+        return result
+
+    def _matches(self, tids):
+        """
+        Tìm tối đa 2 khuôn khớp với dãy token (đủ để biết có nhập nhằng hay không).
+        """
+        found = []
+        stack = [(self.trie, 0)]
+        while stack and len(found) < 2:
+            node, pos = stack.pop()
+            if pos == len(tids):
+                found.extend(node.get(None, ()))
+                continue
+            tid = tids[pos]
+            for category in self.categories[tid]:
+                child = node.get(category)
+                if child is not None:
+                    stack.append((child, pos + 1))
+            child = node.get(~tid)
+            if child is not None:
+                stack.append((child, pos + 1))
+        return found
+
+    def _evaluate(self, skeleton, tids, tokens, pos):
+        head, children = skeleton
+        if head == "slot":
+            tid = tids[pos]
+            if children < 0:
+                return (None, tokens[pos]), pos + 1
+            p = self.parser.lexical[children][tid]
+            value = self.actions[p]([(None, tokens[pos])])
+            return (self.parser.nonterminals[children].symbol(), value), pos + 1
+        values = []
+        for child in children:
+            value, pos = self._evaluate(child, tids, tokens, pos)
+            values.append(value)
+        lhs = self.parser.productions[head][0]
+        return (self.parser.nonterminals[lhs].symbol(), self.actions[head](values)), pos
+
+    def match(self, tokens, tids=None):
+        """
+        Trả về ngữ nghĩa nếu câu đi tắt được, ngược lại None.
+        tids: dãy id terminal (EarleyParser.intern) nếu đã có.
+        """
+        if tids is None:
+            tids = [self.parser.terminal_ids.get(token) for token in tokens]
+        if None not in tids:
+            found = self._matches(tids)
+            if len(found) == 1 and found[0][1]:
+                self.hits += 1
+                (_, sem), _ = self._evaluate(found[0][0], tids, tokens, 0)
+                return sem
+        self.misses += 1
+        return None
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+def verify(fast_path:FastPath, sentences, tokenize):
+    """
+    Chạy từng câu qua cả đường tắt và bộ phân tích đầy đủ, trả về
+    danh sách (câu, ngữ nghĩa đi tắt, ngữ nghĩa đầy đủ) bị khác nhau.
+    """
+    differences = []
+    for sentence in sentences:
+        tokens = tokenize(sentence)
+        if tokens is None:
+            continue
+        fast = fast_path.match(tokens)
+        if fast is None:
+            continue
+        _, full = fast_path.parser.parse_semantics(tokens, fast_path.actions)
+        if str(fast) != str(full):
+            differences.append((sentence, fast, full))
+    return differences
+
+if __name__ == "__main__":
+    from grammar import SEMANTIC_ACTIONS, default_action
+    from grammar_cache import load_compiled_grammar
+    from main import GRAMMAR_CACHE_FILE, SAMPLES_FILE
+    from utils import custom_tokenizer
+
+    arg_parser = argparse.ArgumentParser(description="Kiểm tra đường tắt so với bộ phân tích đầy đủ")
+    arg_parser.add_argument("--verify", default=SAMPLES_FILE, help="file câu cần kiểm tra (mỗi dòng một câu)")
+    args = arg_parser.parse_args()
+
+    compiled, _ = load_compiled_grammar(GRAMMAR_CACHE_FILE)
+    actions = compiled.parser.compile_actions(SEMANTIC_ACTIONS, default_action)
+    start = time.perf_counter()
+    fast_path = FastPath(compiled.parser, actions)
+    print(f"Dựng đường tắt: {fast_path.shape_count} khuôn, {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    with io.open(args.verify, "r", encoding="utf-8") as f:
+        sentences = [line.strip() for line in f if line.strip()]
+    differences = verify(fast_path, sentences, lambda s: custom_tokenizer(s, compiled.trie))
+    for sentence, fast, full in differences:
+        print(f"KHÁC: {sentence}\n  đi tắt: {fast}\n  đầy đủ: {full}")
+    print(f"{len(sentences)} câu, đi tắt {fast_path.hits} câu ({fast_path.hit_rate():.1%}), {len(differences)} khác biệt")
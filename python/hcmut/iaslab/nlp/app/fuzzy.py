@@ -0,0 +1,344 @@
+import argparse
+import io
+import os
+import random
+import sys
+import time
+import unicodedata
+from utils import TerminalTrie, preprocess_text, custom_tokenizer
+
+def _build_fold_table():
+    """
+    Bảng bỏ dấu theo từng ký tự (giữ nguyên độ dài chuỗi): "ở" -> "o", "đ" -> "d".
+    """
+    table = {ord('đ'): 'd', ord('Đ'): 'D'}
+    for start, end in [(0x00C0, 0x0250), (0x1EA0, 0x1F00)]:
+        for code in range(start, end):
+            base = unicodedata.normalize("NFD", chr(code))[0]
+            if base != chr(code) and base.isascii() and base.isalpha():
+                table[code] = base
+    return table
+
+FOLD_TABLE = _build_fold_table()
+
+def fold_diacritics(text:str):
+    """
+    Bỏ dấu tiếng Việt; mỗi ký tự thành đúng một ký tự nên vị trí trong chuỗi không đổi.
+    """
+    return text.translate(FOLD_TABLE)
+
+def edit_distance(a:str, b:str, max_distance=None):
+    """
+    Khoảng cách Damerau-Levenshtein (có hoán vị hai ký tự liền nhau) giữa a và b.
+    Nếu có max_distance thì chỉ tính trong dải |i - j| <= max_distance, dừng sớm
+    và trả về max_distance + 1 khi vượt ngưỡng.
+    """
+    if a == b:
+        return 0
+    n, m = len(a), len(b)
+    if max_distance is None:
+        max_distance = max(n, m)
+    elif abs(n - m) > max_distance:
+        return max_distance + 1
+    if max_distance == 1:
+        return 1 if _one_edit_apart(a, b) else 2
+    over = max_distance + 1
+    prev2, prev = None, [j if j <= max_distance else over for j in range(m + 1)]
+    for i in range(1, n + 1):
+        lo, hi = max(1, i - max_distance), min(m, i + max_distance)
+        cur = [over] * (m + 1)
+        if i <= max_distance:
+            cur[0] = i
+        ca = a[i - 1]
+        row_min = cur[0]
+        for j in range(lo, hi + 1):
+            cb = b[j - 1]
+            d = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb and prev2[j - 2] + 1 < d:
+                d = prev2[j - 2] + 1
+            cur[j] = d
+            if d < row_min:
+                row_min = d
+        if row_min > max_distance:
+            return over
+        prev2, prev = prev, cur
+    return min(prev[m], over)
+
+def _one_edit_apart(a, b):
+    # a != b và |len(a) - len(b)| <= 1: so sánh cắt chuỗi sau vị trí khác đầu tiên
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) < len(b):
+        return a[i:] == b[i + 1:]
+    return (a[i + 1:] == b[i + 1:]
+            or (i + 1 < len(a) and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]))
+
+def typo_budget(length):
+    """
+    Số lỗi gõ cho phép trong một từ (đã bỏ dấu) theo độ dài: từ quá ngắn phải đúng hẳn.
+    """
+    if length <= 2:
+        return 0
+    if length <= 7:
+        return 1
+    return 2
+
+class SymSpellIndex:
+    """
+    Chỉ mục SymSpell: với mỗi từ, lưu mọi biến thể xóa tối đa max_distance ký tự
+    (chỉ trên prefix_length ký tự đầu để giới hạn kích thước). Tra một cụm chỉ cần
+    sinh các biến thể xóa của nó rồi tra dict, không so với từng từ trong từ điển.
+    """
+    def __init__(self, words, max_distance=2, prefix_length=7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.words = set()
+        self.lengths = set()
+        self.deletes = {}
+        for word in words:
+            self.add(word)
+
+    def _variants(self, word, max_distance):
+        variants = {word}
+        frontier = {word}
+        for _ in range(max_distance):
+            frontier = {v[:i] + v[i + 1:] for v in frontier for i in range(len(v))} - variants
+            variants |= frontier
+        return variants
+
+    def add(self, word):
+        if word in self.words:
+            return
+        self.words.add(word)
+        self.lengths.add(len(word))
+        for variant in self._variants(word[:self.prefix_length], self.max_distance):
+            self.deletes.setdefault(variant, []).append(word)
+
+    def lookup(self, word, max_distance=None):
+        """
+        Các từ cách word không quá max_distance: danh sách (khoảng cách, từ) tăng dần.
+        """
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        if max_distance == 0:
+            return [(0, word)] if word in self.words else []
+        # Không có từ nào đủ gần về độ dài thì khỏi sinh biến thể
+        if not any(len(word) + d in self.lengths for d in range(-max_distance, max_distance + 1)):
+            return []
+        seen, results = set(), []
+        for variant in self._variants(word[:self.prefix_length], max_distance):
+            for candidate in self.deletes.get(variant, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                distance = edit_distance(word, candidate, max_distance)
+                if distance <= max_distance:
+                    results.append((distance, candidate))
+        results.sort()
+        return results
+
+class FuzzyTokenizer:
+    """
+    Tokenize câu gõ không dấu hoặc sai chính tả, trả về các terminal chuẩn (có dấu)
+    để đưa vào bộ phân tích.
+
+    1. Khớp dài nhất trên trie các terminal đã bỏ dấu (như custom_tokenizer); chỉ nhận
+       khi mọi token kết thúc ở ranh giới từ và (nếu có recognize) câu thuộc văn phạm,
+       để "bòo" không bị cắt thành "bò" + "ổ".
+    2. Nếu không: mỗi từ được tra một lần trong chỉ mục SymSpell (các từ xuất hiện
+       trong terminal) để lấy các từ sửa được, rồi quy hoạch động trên trie theo từ
+       của các terminal; chọn cách tách có ít lỗi gõ nhất, rồi ít token nhất,
+       rồi gần câu gốc nhất; chỉ nhận nếu câu thuộc văn phạm (khi có recognize).
+    Chỉ mục SymSpell chỉ được dựng ở lần đầu cần sửa lỗi gõ.
+    recognize(tokens): hàm kiểm tra dãy terminal có là câu hợp lệ (ví dụ EarleyParser.recognize).
+    """
+    def __init__(self, terminals, recognize=None):
+        self.recognize = recognize
+        # Các terminal có cùng dạng bỏ dấu ("bỏ"/"bò") được giữ theo thứ tự văn phạm
+        self.canonical = {}
+        for term in terminals:
+            if term:
+                self.canonical.setdefault(fold_diacritics(term), []).append(term)
+        self.trie = TerminalTrie(self.canonical)
+        # Trie theo từ: {từ: nút con}, khóa None giữ terminal (đã bỏ dấu) kết thúc tại nút
+        self.word_trie = {}
+        for folded in self.canonical:
+            node = self.word_trie
+            for word in folded.split():
+                node = node.setdefault(word, {})
+            node[None] = folded
+        self._index = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = SymSpellIndex({word for folded in self.canonical for word in folded.split()})
+        return self._index
+
+    def _best_term(self, folded, original):
+        # Trong các terminal cùng dạng bỏ dấu, chọn cái gần chữ người dùng gõ nhất
+        candidates = self.canonical[folded]
+        if len(candidates) == 1:
+            return candidates[0], 0
+        return min(((term, edit_distance(original, term)) for term in candidates), key=lambda x: x[1])
+
+    def tokenize(self, sentence:str):
+        """
+        Trả về danh sách terminal chuẩn, hoặc None nếu không sửa được.
+        """
+        text = preprocess_text(sentence)
+        folded = fold_diacritics(text)
+        spans = self.trie.tokenize_spans(folded)
+        tokens = None
+        if spans is not None and all(end == len(folded) or folded[end].isspace() for _, end, _ in spans):
+            tokens = [self._best_term(term, text[start:end])[0] for start, end, term in spans]
+            if self._recognized(tokens):
+                return tokens
+        # Có token cắt giữa từ hoặc câu không hợp lệ: sửa lỗi gõ theo từng từ
+        corrected = self._tokenize_typos(text.split(), folded.split())
+        if corrected is not None and self._recognized(corrected):
+            return corrected
+        # Không cách nào thuộc văn phạm: giữ cách tách theo ranh giới từ (nếu có) để báo "No parse"
+        return tokens
+
+    def _recognized(self, tokens):
+        if self.recognize is None:
+            return True
+        try:
+            return self.recognize(tokens)
+        except ValueError:
+            return False
+
+    def _tokenize_typos(self, words, folded_words):
+        n = len(words)
+        if n == 0:
+            return None
+        corrections = [self.index.lookup(word, typo_budget(len(word))) for word in folded_words]
+        # best[i] = (số lỗi gõ, số token, khoảng cách tới câu gốc, token) cho i từ đầu
+        best = [None] * (n + 1)
+        best[0] = (0, 0, 0, [])
+        for i in range(n):
+            if best[i] is None:
+                continue
+            errors, count, raw, tokens = best[i]
+            stack = [(self.word_trie, i, 0)]
+            while stack:
+                node, j, distance = stack.pop()
+                if j == n:
+                    continue
+                for d, word in corrections[j]:
+                    child = node.get(word)
+                    if child is None:
+                        continue
+                    if None in child:
+                        term, raw_distance = self._best_term(child[None], " ".join(words[i:j + 1]))
+                        candidate = (errors + distance + d, count + 1, raw + raw_distance, tokens + [term])
+                        current = best[j + 1]
+                        if current is None or candidate[:3] < current[:3]:
+                            best[j + 1] = candidate
+                    stack.append((child, j + 1, distance + d))
+        return best[n][3] if best[n] is not None else None
+
+def _strip_diacritics_query(query):
+    return fold_diacritics(query.lower())
+
+def _typo_query(query, rng):
+    """
+    Câu bỏ dấu có đúng một lỗi gõ (hoán vị, xóa, thêm hoặc thay ký tự) trong một từ dài.
+    """
+    words = _strip_diacritics_query(query).split()
+    positions = [i for i, word in enumerate(words) if len(word) >= 4 and word.isalpha()]
+    if not positions:
+        return " ".join(words)
+    i = rng.choice(positions)
+    word, k = words[i], rng.randrange(1, len(words[i]) - 1)
+    op = rng.choice(["swap", "delete", "insert", "replace"])
+    if op == "swap":
+        word = word[:k - 1] + word[k] + word[k - 1] + word[k + 1:]
+    elif op == "delete":
+        word = word[:k] + word[k + 1:]
+    elif op == "insert":
+        word = word[:k] + rng.choice("aeioun") + word[k:]
+    else:
+        word = word[:k] + rng.choice("aeioun") + word[k + 1:]
+    words[i] = word
+    return " ".join(words)
+
+# Câu có lỗi gõ ở cuối từ mà bước khớp trên trie bỏ dấu từng cắt giữa từ ("bòo" -> "bò" + "ổ"):
+# (câu, kết quả mong đợi)
+REGRESSION_CASES = [
+    ("phở bòo giá bao nhiêu", ["phở bò", "giá bao nhiêu"]),
+    ("pho boo gia bao nhieu", ["phở bò", "giá bao nhiêu"]),
+    ("tra suaa gia bao nhieu", ["trà sữa", "giá bao nhiêu"]),
+    ("giá phở bòa", None),
+    ("thêm 1 ly trà sữaa", ["thêm", "1", "ly", "trà sữa"]),
+]
+
+def _brute_force_lookup(vocabulary, word, max_distance):
+    # Cách làm không có chỉ mục: so với từng từ trong từ điển
+    return sorted((d, v) for v in vocabulary for d in [edit_distance(word, v, max_distance)] if d <= max_distance)
+
+if __name__ == "__main__":
+    from grammar import DATA_FILE
+    from grammar_cache import load_compiled_grammar
+    from main import INPUT_DIR, GRAMMAR_CACHE_FILE
+
+    arg_parser = argparse.ArgumentParser(description="Đo tokenize mờ (không dấu, sai chính tả) so với tokenize chính xác")
+    arg_parser.add_argument("--queries", nargs="+",
+                            default=[os.path.join(INPUT_DIR, "sentences.txt"), os.path.join(INPUT_DIR, "sample-queries.txt")])
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    compiled, _ = load_compiled_grammar(GRAMMAR_CACHE_FILE, DATA_FILE)
+    queries = []
+    for file in args.queries:
+        with io.open(file, "r", encoding="utf-8") as f:
+            queries.extend(line.strip() for line in f if line.strip())
+    queries = [q for q in queries if custom_tokenizer(q, compiled.trie) is not None]
+    expected = [custom_tokenizer(q, compiled.trie) for q in queries]
+
+    start = time.perf_counter()
+    fuzzy = FuzzyTokenizer(compiled.terminals, compiled.parser.recognize)
+    fuzzy.index
+    print(f"{len(compiled.terminals)} terminal, dựng chỉ mục: {(time.perf_counter() - start) * 1000:.1f} ms, "
+          f"{len(fuzzy.index.deletes)} biến thể xóa")
+
+    rng = random.Random(args.seed)
+    sets = [
+        ("chính xác", queries, lambda q: custom_tokenizer(q, compiled.trie)),
+        ("mờ, câu có dấu", queries, fuzzy.tokenize),
+        ("mờ, không dấu", [_strip_diacritics_query(q) for q in queries], fuzzy.tokenize),
+        ("mờ, không dấu + lỗi gõ", [_typo_query(q, rng) for q in queries], fuzzy.tokenize),
+    ]
+    print(f"{'trường hợp':<24} {'µs/câu':>9} {'đúng':>12}")
+    for label, inputs, tokenize in sets:
+        results = [tokenize(q) for q in inputs]
+        correct = sum(r == e for r, e in zip(results, expected))
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for q in inputs:
+                tokenize(q)
+        elapsed = (time.perf_counter() - start) / (args.repeat * len(inputs))
+        print(f"{label:<24} {elapsed * 1e6:>9.1f} {correct:>5}/{len(inputs):<6}")
+
+    # Tra từng từ của các câu có lỗi gõ: chỉ mục SymSpell so với so khoảng cách với từng từ
+    words = [w for q in sets[3][1] for w in q.split()]
+    vocabulary = sorted(fuzzy.index.words)
+    for label, lookup in [("SymSpell", fuzzy.index.lookup),
+                          ("so từng từ", lambda w, d: _brute_force_lookup(vocabulary, w, d))]:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for w in words:
+                lookup(w, typo_budget(len(w)))
+        elapsed = (time.perf_counter() - start) / (args.repeat * len(words))
+        print(f"tra một từ ({label}, {len(vocabulary)} từ): {elapsed * 1e6:.1f} µs")
+
+    failures = [(q, fuzzy.tokenize(q), e) for q, e in REGRESSION_CASES if fuzzy.tokenize(q) != e]
+    for query, result, expected_tokens in failures:
+        print(f"KHÁC: {query}\n  nhận: {result}\n  cần:  {expected_tokens}")
+    print(f"Ca hồi quy: {len(REGRESSION_CASES) - len(failures)}/{len(REGRESSION_CASES)} đúng")
+    if failures:
+        sys.exit(1)
@@ -1,52 +1,382 @@
 from nltk import CFG
+from nltk.grammar import Nonterminal
+from itertools import islice
+import hashlib
 import random
 import io
-def generate_sentence(grammar:CFG, symbol):
-    """
-    Hàm đệ quy để sinh một câu/cụm từ ngẫu nhiên
-    từ một ký hiệu (symbol) cho trước trong văn phạm.
-    """
-    # Lấy tất cả các quy tắc (productions) cho symbol này
-    productions = grammar.productions(lhs=symbol)
-    # Chọn ngẫu nhiên một quy tắc
-    production = random.choice(productions)
-    
-    sentence_parts = []
-    for sym in production.rhs():
-        if isinstance(sym, str):
-            # Nếu là terminal (từ vựng), thêm vào câu
-            sentence_parts.append(sym)
-        else:
-            # Nếu là non-terminal (ký hiệu), gọi đệ quy
-            sentence_parts.append(generate_sentence(grammar, sym))
-            
-    return " ".join(sentence_parts)
-
-def generate_sentences(grammar:CFG, SAMPLES_FILE, max_sentences=10000):
-    """
-    Sinh câu ngẫu nhiên từ văn phạm và lưu vào file.
+import json
+import os
+import time
+from multiprocessing import Pool
+from bloom import BloomFilter
+def count_derivations(grammar:CFG):
+    """
+    Đếm số dẫn xuất của từng nonterminal bằng quy hoạch động (số nguyên lớn).
+    Văn phạm nhập nhằng thì số dẫn xuất lớn hơn số câu phân biệt.
+    """
+    counts = {}
+
+    def count(symbol, stack=()):
+        if not isinstance(symbol, Nonterminal):
+            return 1
+        if symbol in counts:
+            return counts[symbol]
+        if symbol in stack:
+            raise ValueError(f"Văn phạm đệ quy tại {symbol}: số câu là vô hạn")
+        total = 0
+        for production in grammar.productions(lhs=symbol):
+            n = 1
+            for sym in production.rhs():
+                n *= count(sym, stack + (symbol,))
+            total += n
+        counts[symbol] = total
+        return total
+
+    for production in grammar.productions():
+        count(production.lhs())
+    return counts
+
+class SentenceSpace:
+    """
+    Tập mọi câu (phân biệt) của văn phạm, đánh số theo thứ tự từ điển.
+
+    Văn phạm được dựng thành ôtômat hữu hạn theo từng từ rồi tất định hóa,
+    nên các câu trùng nhau do nhập nhằng (Q_PREFIX -> "", các tiền tố rỗng,
+    "có những món gì" ở cả Q_MENU và Q_STATUS) chỉ được đếm một lần.
+    counts[q] là số câu đi được từ trạng thái q; nhờ đó có thể
+    đổi một số thứ tự (rank) thành câu (unrank) mà không cần thử lại.
+    """
+    def __init__(self, grammar:CFG):
+        self._eps = []
+        self._words = []
+        start, self._final = self._fragment(grammar, grammar.start(), ())
+        self.transitions = []   # trạng thái -> [(từ, trạng thái kế)] sắp theo từ
+        self.accepting = []
+        self._determinize(start)
+        del self._eps, self._words
+        self.counts = self._count()
+        self.size = self.counts[0]
+
+    def _new_state(self):
+        self._eps.append([])
+        self._words.append([])
+        return len(self._eps) - 1
+
+    def _fragment(self, grammar, symbol, stack):
+        # Dựng NFA (kiểu Thompson) cho một ký hiệu, trả về (đầu, cuối)
+        begin, end = self._new_state(), self._new_state()
+        if not isinstance(symbol, Nonterminal):
+            state = begin
+            for word in symbol.split():
+                nxt = self._new_state()
+                self._words[state].append((word, nxt))
+                state = nxt
+            self._eps[state].append(end)
+            return begin, end
+        if symbol in stack:
+            raise ValueError(f"Văn phạm đệ quy tại {symbol}: số câu là vô hạn")
+        for production in grammar.productions(lhs=symbol):
+            state = begin
+            for sym in production.rhs():
+                sub_begin, sub_end = self._fragment(grammar, sym, stack + (symbol,))
+                self._eps[state].append(sub_begin)
+                state = sub_end
+            self._eps[state].append(end)
+        return begin, end
+
+    def _closure(self, states):
+        stack, seen = list(states), set(states)
+        while stack:
+            for nxt in self._eps[stack.pop()]:
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+        # Chỉ giữ trạng thái có cạnh theo từ hoặc là trạng thái kết thúc
+        return frozenset(q for q in seen if self._words[q] or q == self._final)
+
+    def _determinize(self, start):
+        first = self._closure([start])
+        ids = {first: 0}
+        subsets = [first]
+        while len(self.transitions) < len(subsets):
+            subset = subsets[len(self.transitions)]
+            moves = {}
+            for q in subset:
+                for word, nxt in self._words[q]:
+                    moves.setdefault(word, []).append(nxt)
+            row = []
+            for word in sorted(moves):
+                target = self._closure(moves[word])
+                if target not in ids:
+                    ids[target] = len(subsets)
+                    subsets.append(target)
+                row.append((word, ids[target]))
+            self.transitions.append(row)
+            self.accepting.append(self._final in subset)
+
+    def _count(self):
+        counts = [None] * len(self.transitions)
+
+        def count(q):
+            if counts[q] is None:
+                counts[q] = int(self.accepting[q]) + sum(count(nxt) for _, nxt in self.transitions[q])
+            return counts[q]
+
+        count(0)
+        return counts
+
+    def unrank(self, rank:int):
+        """
+        Trả về câu thứ rank (0 <= rank < size) theo thứ tự từ điển.
+        """
+        if not 0 <= rank < self.size:
+            raise IndexError(rank)
+        words, q = [], 0
+        while True:
+            if self.accepting[q]:
+                if rank == 0:
+                    return " ".join(words)
+                rank -= 1
+            for word, nxt in self.transitions[q]:
+                if rank < self.counts[nxt]:
+                    words.append(word)
+                    q = nxt
+                    break
+                rank -= self.counts[nxt]
+
+    def __iter__(self):
+        """
+        Liệt kê các câu theo thứ tự từ điển.
+        """
+        stack = [(0, [])]
+        while stack:
+            q, words = stack.pop()
+            if self.accepting[q]:
+                yield " ".join(words)
+            for word, nxt in reversed(self.transitions[q]):
+                stack.append((nxt, words + [word]))
+
+def sample_ranks(size:int, k:int, rng:random.Random):
+    """
+    Chọn k số thứ tự phân biệt, đều trong [0, size) (thuật toán Floyd).
+    """
+    chosen = set()
+    for j in range(size - k, size):
+        t = rng.randrange(j + 1)
+        chosen.add(j if t in chosen else t)
+    return sorted(chosen)
+
+def generate_sentences(grammar:CFG, SAMPLES_FILE, max_sentences=10000, seed=None, ordered=False):
+    """
+    Sinh các câu phân biệt từ văn phạm và lưu vào file.
     Giới hạn tối đa 10,000 câu.
+
+    Mặc định chọn ngẫu nhiên đều các số thứ tự rồi unrank, mỗi số cho đúng
+    một câu khác nhau; ordered=True thì lấy các câu đầu tiên theo thứ tự.
     """
     print(f"--- 2.2: Sinh câu mẫu ra file {SAMPLES_FILE} ---")
-    
-    generated_sentences = set()
-    
-    # Thử sinh 50,000 lần để đạt được tối đa 10,000 câu *duy nhất*
-    # Văn phạm nhỏ có thể không sinh đủ 10,000 câu duy nhất
-    attempts = 0
-    max_attempts = max_sentences 
-
-    while len(generated_sentences) < max_sentences and attempts < max_attempts:
-        sentence = generate_sentence(grammar, grammar.start())
-        # Chuẩn hóa khoảng trắng (vd: " quán... " -> "quán...")
-        sentence_normalized = " ".join(sentence.split())
-        if sentence_normalized:
-            generated_sentences.add(sentence_normalized)
-        attempts += 1
+
+    space = SentenceSpace(grammar)
+    derivations = count_derivations(grammar)[grammar.start()]
+    print(f"Văn phạm sinh được {space.size:,} câu phân biệt ({derivations:,} dẫn xuất)")
+
+    n = min(max_sentences, space.size)
+    if ordered:
+        sentences = islice(space, n)
+    else:
+        rng = random.Random(seed)
+        sentences = (space.unrank(rank) for rank in sample_ranks(space.size, n, rng))
 
     # Ghi các câu đã sinh ra file
     with io.open(SAMPLES_FILE, "w", encoding="utf-8") as f:
-        for sentence in generated_sentences:
+        for sentence in sentences:
             f.write(sentence + "\n")
-            
-    print(f"Đã sinh {len(generated_sentences)} câu duy nhất vào file: {SAMPLES_FILE}\n")
\ No newline at end of file
+
+    print(f"Đã sinh {n} câu duy nhất vào file: {SAMPLES_FILE}\n")
+
+def _save_checkpoint(checkpoint_file, state):
+    tmp_file = checkpoint_file + ".tmp"
+    with io.open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_file, checkpoint_file)
+
+def stream_sentences(grammar:CFG, SAMPLES_FILE, max_sentences=10000, seed=None,
+                     error_rate=0.001, checkpoint_every=100000, resume=False):
+    """
+    Sinh câu theo luồng cho tập dữ liệu lớn: ghi dần qua bộ đệm, khử trùng
+    bằng bộ lọc Bloom (bộ nhớ cố định), tái lập được bằng seed.
+
+    Sau mỗi checkpoint_every câu, file được flush và trạng thái (số câu, vị trí
+    byte, trạng thái bộ sinh ngẫu nhiên) ghi vào SAMPLES_FILE + ".ckpt".
+    resume=True chạy tiếp từ checkpoint đó và cho kết quả giống như chạy một mạch;
+    báo ValueError nếu checkpoint được tạo với văn phạm hoặc seed khác.
+    """
+    print(f"--- 2.2: Sinh câu mẫu (streaming) ra file {SAMPLES_FILE} ---")
+
+    space = SentenceSpace(grammar)
+    target = min(max_sentences, space.size)
+    checkpoint_file = SAMPLES_FILE + ".ckpt"
+    # Khóa của ngôn ngữ: checkpoint của văn phạm khác (data.json đã đổi) không dùng tiếp được
+    grammar_key = hashlib.sha256(str(grammar).encode("utf-8")).hexdigest()
+    rng = random.Random(seed)
+    written, draws, offset = 0, 0, 0
+    # Dừng nếu phải bốc quá nhiều lần (ngôn ngữ gần cạn hoặc bộ lọc đầy)
+    max_draws = 20 * target + 1000
+
+    state = None
+    if resume and os.path.exists(checkpoint_file):
+        with io.open(checkpoint_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("grammar_key") != grammar_key:
+            raise ValueError(f"{checkpoint_file} was created with a different grammar; cannot resume")
+        if state.get("seed") != seed:
+            raise ValueError(f"{checkpoint_file} was created with seed {state.get('seed')}, not {seed}; cannot resume")
+        target, error_rate, max_draws = state["target"], state["error_rate"], state["max_draws"]
+        written, draws, offset = state["written"], state["draws"], state["offset"]
+        version, internal, gauss_next = state["rng_state"]
+        rng.setstate((version, tuple(internal), gauss_next))
+        print(f"Chạy tiếp từ checkpoint: đã có {written} câu")
+
+    seen = BloomFilter(target, error_rate)
+    if state is not None:
+        # Bỏ phần ghi sau checkpoint cuối rồi nạp lại bộ lọc từ các câu đã có
+        with io.open(SAMPLES_FILE, "r+b") as f:
+            f.truncate(offset)
+        with io.open(SAMPLES_FILE, "r", encoding="utf-8") as f:
+            for line in f:
+                seen.add(line.rstrip("\n"))
+
+    with io.open(SAMPLES_FILE, "ab" if state else "wb", buffering=1 << 20) as f:
+        def checkpoint():
+            f.flush()
+            _save_checkpoint(checkpoint_file, {
+                "grammar_key": grammar_key, "seed": seed, "max_draws": max_draws,
+                "target": target, "error_rate": error_rate,
+                "written": written, "draws": draws, "offset": f.tell(),
+                "rng_state": rng.getstate(),
+            })
+
+        while written < target and draws < max_draws:
+            sentence = space.unrank(rng.randrange(space.size))
+            draws += 1
+            if not seen.add(sentence):
+                continue
+            f.write((sentence + "\n").encode("utf-8"))
+            written += 1
+            if written % checkpoint_every == 0:
+                checkpoint()
+        checkpoint()
+
+    print(f"Đã sinh {written} câu duy nhất ({draws} lần bốc) vào file: {SAMPLES_FILE}\n")
+
+class ProductionTable:
+    """
+    Bảng luật mã hóa số nguyên để sinh câu nhanh: rules[A] là danh sách
+    vế phải của A, mỗi ký hiệu là id nonterminal (>= 0) hoặc ~id terminal.
+    """
+    def __init__(self, grammar:CFG):
+        nonterminals = {}
+        for production in grammar.productions():
+            nonterminals.setdefault(production.lhs(), len(nonterminals))
+        words = {}
+        self.rules = [[] for _ in nonterminals]
+        for production in grammar.productions():
+            rhs = []
+            for sym in production.rhs():
+                if isinstance(sym, Nonterminal):
+                    rhs.append(nonterminals[sym])
+                else:
+                    rhs.append(~words.setdefault(sym, len(words)))
+            self.rules[nonterminals[production.lhs()]].append(tuple(rhs))
+        self.words = list(words)
+        self.start = nonterminals[grammar.start()]
+
+    def generate(self, rng:random.Random):
+        """
+        Sinh một câu ngẫu nhiên bằng ngăn xếp (không đệ quy).
+        """
+        rules, words = self.rules, self.words
+        parts = []
+        stack = [self.start]
+        while stack:
+            sym = stack.pop()
+            if sym < 0:
+                word = words[~sym]
+                if word:
+                    parts.append(word)
+            else:
+                stack.extend(reversed(rng.choice(rules[sym])))
+        return " ".join(parts)
+
+def shard_seed(seed, round_index:int, shard:int):
+    """
+    Seed riêng của từng shard, chỉ phụ thuộc vào seed gốc, vòng sinh và số thứ tự shard.
+    """
+    digest = hashlib.blake2b(f"{seed}:{round_index}:{shard}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+# Bảng luật của tiến trình con, nạp một lần khi khởi tạo
+_worker_table = None
+
+def _init_shard_worker(table):
+    global _worker_table
+    _worker_table = table
+
+def _generate_shard(task):
+    shard_file, seed, quota, error_rate = task
+    rng = random.Random(seed)
+    seen = BloomFilter(quota, error_rate)
+    written, draws = 0, 0
+    with io.open(shard_file, "wb", buffering=1 << 20) as f:
+        while written < quota and draws < 20 * quota + 1000:
+            sentence = _worker_table.generate(rng)
+            draws += 1
+            if seen.add(sentence):
+                f.write((sentence + "\n").encode("utf-8"))
+                written += 1
+    return written
+
+def shard_sentences(grammar:CFG, SAMPLES_FILE, max_sentences=10000, seed=None, workers=2,
+                    error_rate=0.001, max_rounds=100):
+    """
+    Sinh câu song song trên nhiều tiến trình. Mỗi shard có seed suy ra từ seed gốc,
+    ghi ra file riêng; sau đó các shard được gộp theo thứ tự vào SAMPLES_FILE
+    và khử trùng giữa các shard. Nếu còn thiếu câu (do trùng giữa shard) thì
+    sinh thêm một vòng với các seed mới. Cùng seed và số tiến trình luôn cho cùng kết quả.
+    """
+    print(f"--- 2.2: Sinh câu mẫu ({workers} shard) ra file {SAMPLES_FILE} ---")
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+
+    start = time.perf_counter()
+    table = ProductionTable(grammar)
+    seen = BloomFilter(max_sentences, error_rate)
+    generated, written = 0, 0
+    with Pool(workers, initializer=_init_shard_worker, initargs=(table,)) as pool, \
+         io.open(SAMPLES_FILE, "w", encoding="utf-8", buffering=1 << 20) as f_out:
+        for round_index in range(max_rounds):
+            missing = max_sentences - written
+            if missing <= 0:
+                break
+            # Mỗi shard sinh dư một chút; phần vượt quá bị cắt khi gộp
+            quota = -(-missing // workers)
+            tasks = [(f"{SAMPLES_FILE}.shard-{i}", shard_seed(seed, round_index, i), quota, error_rate)
+                     for i in range(workers)]
+            generated += sum(pool.map(_generate_shard, tasks))
+
+            # Gộp các shard theo thứ tự, bỏ các câu đã xuất hiện trước đó
+            before = written
+            for shard_file, _, _, _ in tasks:
+                with io.open(shard_file, "r", encoding="utf-8") as f_in:
+                    for line in f_in:
+                        if written < max_sentences and seen.add(line.rstrip("\n")):
+                            f_out.write(line)
+                            written += 1
+                os.remove(shard_file)
+            if written == before:
+                break
+    elapsed = time.perf_counter() - start
+
+    rate = generated / elapsed if elapsed > 0 else 0.0
+    print(f"seed={seed}: {generated} câu từ các shard, {generated - written} câu bị loại khi gộp (trùng hoặc dư), {rate:.0f} câu/giây")
+    print(f"Đã sinh {written} câu duy nhất vào file: {SAMPLES_FILE}\n")
@@ -1,29 +1,12 @@
 import io
 import json
 import os
-def write_grammar(GRAMMAR_FILE):
-    """
-    Định nghĩa CFG và lưu vào file output/grammar.txt.
-    """
-    print(f"--- 2.1: Viết grammar ra file {GRAMMAR_FILE} ---")
-    # Đọc dữ liệu từ data.json
-    file_path = os.path.join(os.path.dirname(__file__), "data.json")
-    with open(file_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    # Trích xuất dữ liệu
+from functools import partial
 
-    foods = [item["name"] for item in data["menu"]]
-    food_rules = " | ".join(f'"{food}"' for food in foods)
+DATA_FILE = os.path.join(os.path.dirname(__file__), "data.json")
 
-    attributes = set(opt for item in data["menu"] for opt in item["options"])
-    attribute_rules = " | ".join(f'"{attr}"' for attr in attributes)
-
-    unit_rules = " | ".join(f'"{unit}"' for unit in data["unit"])
-
-    number_rules = " | ".join(f'"{num}"' for num in data["number"])
-
-    grammar_str = r"""
+# Khung văn phạm; các chỗ %s được điền bằng dữ liệu từ data.json
+GRAMMAR_TEMPLATE = r"""
     # --- START ---
     S -> CMD | QRY
 
@@ -44,7 +27,7 @@ def write_grammar(GRAMMAR_FILE):
     V_REMOVE_ACTION -> "hủy" | "bỏ" | "xóa"
 
     # --- 2. CÁC LOẠI CÂU HỎI (QUERY) ---
-    QRY -> Q_AVAIL | Q_PRICE | Q_MENU | Q_STATUS
+    QRY -> Q_AVAIL | Q_PRICE | Q_MENU | Q_STATUS | Q_FILTER
 
     # 2.1. Hỏi còn món (AVAILABILITY)
     Q_AVAIL -> Q_PREFIX Q_AVAIL_INFIX NP Q_AVAIL_SUFFIX | Q_AVAIL_INFIX NP Q_AVAIL_SUFFIX
@@ -60,6 +43,10 @@ def write_grammar(GRAMMAR_FILE):
     Q_STATUS_PREFIX -> "tôi đã đặt những món gì" | "tôi đã đặt những gì" | "có gì" | "có những gì" | "có những món gì"
     Q_STATUS_SUFFIX -> "rồi"
 
+    # 2.5. Lọc món theo thuộc tính (FILTER)
+    Q_FILTER -> Q_PREFIX Q_FILTER_PREFIX ATTRIBUTE | Q_FILTER_PREFIX ATTRIBUTE
+    Q_FILTER_PREFIX -> "món nào" | "những món nào" | "có món nào" | "có những món nào"
+
     # --- 3. CÁC THÀNH PHẦN CÚ PHÁP (CONSTITUENTS) ---
 
     # Cụm danh từ (chỉ món ăn)
@@ -112,11 +99,151 @@ def write_grammar(GRAMMAR_FILE):
 
     # Từ chỉ đơn hàng
     ORDER -> "đơn hàng" | "đơn" | "đơn hàng của tôi" | "đơn của tôi" | "đơn hàng tôi" | "đơn tôi"
-    """%(food_rules, number_rules, unit_rules, attribute_rules)
+    """
+
+def load_data(data_file=DATA_FILE):
+    """
+    Đọc dữ liệu menu (món, đơn vị, số lượng) từ data.json.
+    """
+    with open(data_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# Các loại từ vựng lấy từ data.json, theo thứ tự các chỗ %s trong GRAMMAR_TEMPLATE
+LEXICAL_CATEGORIES = ('FOOD', 'NUMBER', 'UNIT', 'ATTRIBUTE')
+
+# Terminal giữ chỗ cho một loại từ vựng trong khung văn phạm (không bao giờ là token)
+LEXICON_PLACEHOLDER = "<%s>"
+
+def build_lexicon(data):
+    """
+    Từ điển các loại từ vựng: {loại: [từ]} (món, số lượng, đơn vị, thuộc tính).
+    """
+    # dict.fromkeys giữ thứ tự xuất hiện để văn phạm sinh ra luôn giống nhau
+    return {
+        'FOOD': [item["name"] for item in data["menu"]],
+        'NUMBER': [str(num) for num in data["number"]],
+        'UNIT': [str(unit) for unit in data["unit"]],
+        'ATTRIBUTE': list(dict.fromkeys(opt for item in data["menu"] for opt in item["options"])),
+    }
+
+def diff_lexicon(old, new):
+    """
+    Các loại từ vựng bị thay đổi: {loại: (từ thêm, từ bớt)}.
+    """
+    changes = {}
+    for category, words in new.items():
+        old_words = old.get(category, [])
+        if words != old_words:
+            old_set, new_set = set(old_words), set(words)
+            changes[category] = ([word for word in words if word not in old_set],
+                                 [word for word in old_words if word not in new_set])
+    return changes
+
+def lexicon_grammar_str(lexicon):
+    """
+    Văn phạm đầy đủ: mỗi từ trong từ điển là một luật của loại từ vựng tương ứng.
+    """
+    return GRAMMAR_TEMPLATE %tuple(" | ".join(f'"{word}"' for word in lexicon[category])
+                                   for category in LEXICAL_CATEGORIES)
+
+def build_grammar_str(data):
+    """
+    Điền dữ liệu menu vào khung văn phạm.
+    """
+    return lexicon_grammar_str(build_lexicon(data))
+
+def build_skeleton_str():
+    """
+    Khung văn phạm chỉ giữ các tiền-terminal: mỗi loại từ vựng có đúng một luật
+    tới terminal giữ chỗ, các từ cụ thể được tra trong từ điển khi phân tích.
+    """
+    return GRAMMAR_TEMPLATE %tuple(f'"{LEXICON_PLACEHOLDER % category}"' for category in LEXICAL_CATEGORIES)
+
+def write_grammar(GRAMMAR_FILE, grammar_str=None):
+    """
+    Định nghĩa CFG và lưu vào file output/grammar.txt.
+    """
+    print(f"--- 2.1: Viết grammar ra file {GRAMMAR_FILE} ---")
+    if grammar_str is None:
+        grammar_str = build_grammar_str(load_data())
 
     # Ghi văn phạm ra file
     with io.open(GRAMMAR_FILE, "w", encoding="utf-8") as f:
         f.write(grammar_str)
         
     print(f"Đã viết grammar thành công vào file: {GRAMMAR_FILE}\n")
-    return grammar_str
\ No newline at end of file
+    return grammar_str
+
+# --- HÀNH ĐỘNG NGỮ NGHĨA ---
+# Mỗi luật của văn phạm gắn với một hành động theo vế trái của nó. Bộ phân tích
+# gọi action(children) khi hoàn tất một thành phần, children là danh sách
+# (nhãn con hoặc None nếu là terminal, giá trị con). Thành phần không có hành
+# động riêng mang giá trị là tuple các từ (leaves) của nó.
+
+def _child(children, label):
+    return next((value for child_label, value in children if child_label == label), None)
+
+def _text(leaves):
+    return " ".join(leaves)
+
+def default_action(children):
+    # Cụm con đã có ngữ nghĩa (dict) thì truyền lên, ngược lại gom các từ
+    leaves = []
+    for label, value in children:
+        if label is None:
+            leaves.append(value)
+        elif isinstance(value, tuple):
+            leaves.extend(value)
+        elif value:
+            return value
+    return tuple(leaves)
+
+def _sem_first(children):
+    return children[0][1]
+
+def _sem_command(intent, np_label, children):
+    sem = dict(_child(children, np_label) or {})
+    sem['type'] = intent
+    time = _child(children, 'TIME_CLAUSE')
+    if time:
+        sem['time'] = _text(time).strip()
+    return sem
+
+def _sem_food_query(intent, children):
+    np = _child(children, 'NP')
+    return {'type': intent, 'food': np.get('food') if np else None}
+
+def _sem_intent(intent, children):
+    return {'type': intent}
+
+def _sem_filter(children):
+    return {'type': 'filter', 'option': _text(_child(children, 'ATTRIBUTE'))}
+
+def _sem_np(children):
+    food = _child(children, 'FOOD')
+    quantity = _child(children, 'QUANTITY')
+    attr = _child(children, 'ATTRIBUTE')
+
+    sem = {'food': _text(food) if food else None}
+    if quantity:
+        qty_str = _text(quantity)
+        sem['quantity'] = int(qty_str) if qty_str.isdigit() else 1
+    if attr:
+        sem['attributes'] = [_text(attr)]
+    return sem
+
+SEMANTIC_ACTIONS = {
+    'S': _sem_first,
+    'CMD': _sem_first,
+    'QRY': _sem_first,
+    'VP_ORDER': partial(_sem_command, 'order', 'NP_QUANTIFIED'),
+    'VP_ADD': partial(_sem_command, 'add', 'NP_QUANTIFIED'),
+    'VP_REMOVE': partial(_sem_command, 'remove', 'NP'),
+    'Q_AVAIL': partial(_sem_food_query, 'avail'),
+    'Q_PRICE': partial(_sem_food_query, 'price'),
+    'Q_MENU': partial(_sem_intent, 'menu'),
+    'Q_STATUS': partial(_sem_intent, 'status'),
+    'Q_FILTER': _sem_filter,
+    'NP': _sem_np,
+    'NP_QUANTIFIED': _sem_np,
+}
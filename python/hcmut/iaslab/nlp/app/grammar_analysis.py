@@ -0,0 +1,189 @@
+import argparse
+import io
+import os
+import random
+import time
+
+# Ký hiệu "hết câu" trong các tập FOLLOW (id terminal luôn >= 0)
+END = -1
+
+class GrammarAnalysis:
+    """
+    Phân tích tĩnh văn phạm đã mã hóa số nguyên của EarleyParser (productions là
+    (lhs, rhs), nonterminal >= 0, terminal ~id): nullable, FIRST, FOLLOW, các terminal
+    có thể mở đầu/kết thúc câu và quan hệ "terminal b có thể đứng ngay sau a".
+
+    Dùng để:
+    - loại trong O(n) dãy token không thể là câu (possible);
+    - chỉ dự đoán các luật có thể bắt đầu bằng token kế tiếp (predictions).
+    Chỉ phụ thuộc khung văn phạm: các từ của loại từ vựng được đại diện bởi
+    terminal giữ chỗ của loại đó.
+    """
+    def __init__(self, productions, nullable, phrasal, start):
+        self.nullable = list(nullable)
+        self.start = start
+        n = len(nullable)
+
+        # FIRST của từng nonterminal (tập id terminal), lặp tới điểm bất động
+        self.first = [set() for _ in range(n)]
+        changed = True
+        while changed:
+            changed = False
+            for lhs, rhs in productions:
+                before = len(self.first[lhs])
+                self.first[lhs] |= self.first_of(rhs)
+                changed |= len(self.first[lhs]) != before
+        self.first = [frozenset(first) for first in self.first]
+
+        # FOLLOW của nonterminal và của terminal (có thể chứa END)
+        self.follow = [set() for _ in range(n)]
+        self.follow[start].add(END)
+        self.terminal_follow = {}
+        changed = True
+        while changed:
+            changed = False
+            for lhs, rhs in productions:
+                for k, sym in enumerate(rhs):
+                    rest = rhs[k + 1:]
+                    follow = set(self.first_of(rest))
+                    if self.nullable_seq(rest):
+                        follow |= self.follow[lhs]
+                    target = self.follow[sym] if sym >= 0 else self.terminal_follow.setdefault(~sym, set())
+                    before = len(target)
+                    target |= follow
+                    changed |= len(target) != before
+        self.follow = [frozenset(follow) for follow in self.follow]
+        self.terminal_follow = {t: frozenset(follow) for t, follow in self.terminal_follow.items()}
+
+        self.start_terminals = self.first[start]
+        self.end_terminals = frozenset(t for t, follow in self.terminal_follow.items() if END in follow)
+
+        # Bảng dự đoán: predict[A][t] = các luật phrasal của A (theo thứ tự văn phạm)
+        # có thể bắt đầu bằng t hoặc suy ra rỗng; predict_empty[A] = chỉ các luật suy ra rỗng
+        self.predict = []
+        self.predict_empty = []
+        for lhs in range(n):
+            prods = phrasal[lhs]
+            firsts = {q: self.first_of(productions[q][1]) for q in prods}
+            empty = {q for q in prods if self.nullable_seq(productions[q][1])}
+            table = {}
+            for t in set().union(*firsts.values()) if firsts else ():
+                table[t] = [q for q in prods if t in firsts[q] or q in empty]
+            self.predict.append(table)
+            self.predict_empty.append([q for q in prods if q in empty])
+
+    def first_of(self, seq):
+        """
+        FIRST của một dãy ký hiệu.
+        """
+        result = set()
+        for sym in seq:
+            if sym < 0:
+                result.add(~sym)
+                return result
+            result |= self.first[sym]
+            if not self.nullable[sym]:
+                return result
+        return result
+
+    def nullable_seq(self, seq):
+        return all(sym >= 0 and self.nullable[sym] for sym in seq)
+
+    def possible(self, classes):
+        """
+        Kiểm tra cần (chưa đủ) để dãy token là câu: token đầu mở đầu được câu, mỗi
+        cặp liền nhau đứng cạnh nhau được, token cuối kết thúc được câu. O(n).
+        classes[i] là các terminal mà token i có thể là (xem EarleyParser.token_classes).
+        """
+        if not classes:
+            return self.nullable[self.start]
+        follow = self.terminal_follow
+        if not any(t in self.start_terminals for t in classes[0]):
+            return False
+        for a, b in zip(classes, classes[1:]):
+            if not any(y in follow.get(x, ()) for x in a for y in b):
+                return False
+        return any(END in follow.get(t, ()) for t in classes[-1])
+
+    def predictions(self, lhs, lookahead):
+        """
+        Các luật phrasal của lhs cần dự đoán khi token kế tiếp là một trong lookahead
+        (tuple terminal; (END,) nếu đã hết câu).
+        """
+        table = self.predict[lhs]
+        if len(lookahead) == 1:
+            return table.get(lookahead[0], self.predict_empty[lhs])
+        chosen = set()
+        for t in lookahead:
+            chosen.update(table.get(t, ()))
+        chosen.update(self.predict_empty[lhs])
+        return sorted(chosen)
+
+def _shuffled_sentences(compiled, sentences, rng):
+    # Câu gần như chắc chắn sai: đảo ngẫu nhiên thứ tự các token của câu mẫu
+    from utils import custom_tokenizer
+    result = []
+    for sentence in sentences:
+        tokens = custom_tokenizer(sentence, compiled.trie) or sentence.split()
+        rng.shuffle(tokens)
+        result.append(" ".join(tokens))
+    return result
+
+def _report_file(compiled, label, sentences):
+    from utils import custom_tokenizer
+    parser, terminals = compiled.parser, compiled.trie
+    analysis = parser.analysis
+    tokenized = [custom_tokenizer(sentence, terminals) for sentence in sentences]
+    valid = [tokens for tokens in tokenized if tokens is not None]
+    early = sum(not analysis.possible([parser.token_classes(tid) for tid in parser.encode(tokens)]) for tokens in valid)
+
+    timings = {}
+    trees = {}
+    for prune in (False, True):
+        parser.prune = prune
+        start = time.perf_counter()
+        trees[prune] = [parser.parse_first(tokens) for tokens in valid]
+        timings[prune] = time.perf_counter() - start
+    parser.prune = True
+    rejected = sum(tree is None for tree in trees[True])
+    assert trees[True] == trees[False], "phân tích có cắt tỉa phải cho cùng cây"
+
+    print(f"{label}: {len(sentences)} câu, lỗi tokenize {len(sentences) - len(valid)}, "
+          f"không phân tích được {rejected}, trong đó loại sớm O(n) {early}")
+    saved = timings[False] - timings[True]
+    print(f"    phân tích: {timings[False] * 1000:.0f} ms không cắt tỉa, {timings[True] * 1000:.0f} ms có cắt tỉa "
+          f"(tiết kiệm {saved * 1000:.0f} ms, {saved / timings[False] if timings[False] else 0:.0%})")
+
+if __name__ == "__main__":
+    from grammar_cache import load_compiled_grammar
+    from main import GRAMMAR_CACHE_FILE, INPUT_SENTENCES_FILE, SAMPLES_FILE
+
+    arg_parser = argparse.ArgumentParser(description="Phân tích tĩnh văn phạm (nullable/FIRST/FOLLOW) và đo hiệu quả loại sớm")
+    arg_parser.add_argument("--files", nargs="+", default=[INPUT_SENTENCES_FILE, SAMPLES_FILE])
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    compiled, _ = load_compiled_grammar(GRAMMAR_CACHE_FILE)
+    parser = compiled.parser
+    analysis = parser.analysis
+    labels = [sym.symbol() for sym in parser.nonterminals]
+    names = lambda tids: ", ".join(sorted(repr(parser.terminals[t]) for t in tids))
+
+    print("=== PHÂN TÍCH TĨNH VĂN PHẠM ===")
+    print(f"{len(labels)} nonterminal, {len(parser.productions)} luật, {parser.skeleton_terminals} terminal khung")
+    print("Nullable:", ", ".join(label for label, ok in zip(labels, analysis.nullable) if ok))
+    print("Terminal mở đầu câu:", names(analysis.start_terminals))
+    print("Terminal kết thúc câu:", names(analysis.end_terminals))
+    pairs = sum(len(follow - {END}) for follow in analysis.terminal_follow.values())
+    print(f"Cặp terminal liền nhau hợp lệ: {pairs}/{len(analysis.terminal_follow) ** 2}")
+    print()
+
+    rng = random.Random(args.seed)
+    for file in args.files:
+        if not os.path.exists(file):
+            print(f"Không tìm thấy file {file}")
+            continue
+        with io.open(file, "r", encoding="utf-8") as f:
+            sentences = [line.strip() for line in f if line.strip()]
+        _report_file(compiled, file, sentences)
+        _report_file(compiled, f"{file} (đảo token)", _shuffled_sentences(compiled, sentences, rng))
@@ -0,0 +1,167 @@
+import copy
+import hashlib
+import io
+import os
+import pickle
+import time
+from nltk import CFG
+from grammar import GRAMMAR_TEMPLATE, DATA_FILE, load_data, build_lexicon, diff_lexicon, lexicon_grammar_str, build_skeleton_str
+from utils import get_terminals, TerminalTrie
+from earley import EarleyParser
+
+# Tăng số này khi cấu trúc CompiledGrammar thay đổi để bỏ các cache cũ
+CACHE_VERSION = 5
+
+class CompiledGrammar:
+    """
+    Văn phạm đã biên dịch theo từ điển: khung văn phạm chỉ giữ các tiền-terminal
+    (FOOD, NUMBER, UNIT, ATTRIBUTE), các từ cụ thể nằm trong lexicon và được
+    bộ phân tích Earley tra theo token. Kèm danh sách terminal và trie cho tokenizer.
+
+    Văn phạm NLTK đầy đủ (grammar, grammar_str) chỉ được dựng khi cần,
+    ví dụ để ghi grammar.txt hoặc sinh câu.
+    """
+    def __init__(self, key, lexicon):
+        self.key = key
+        self.lexicon = lexicon
+        self.skeleton = CFG.fromstring(build_skeleton_str())
+        self.parser = EarleyParser(self.skeleton, lexicon)
+        self.terminals = self.parser.vocabulary()
+        self.trie = TerminalTrie(self.terminals)
+        self._grammar = None
+
+    def with_lexicon(self, key, lexicon, changes=None):
+        """
+        Biên dịch lại tăng dần khi chỉ từ điển thay đổi: chỉ sửa bảng từ vựng
+        của các loại có từ thêm/bớt (changes, xem diff_lexicon) và các nhánh trie
+        tương ứng. Trả về CompiledGrammar mới, bản hiện tại không bị sửa.
+        """
+        if changes is None:
+            changes = diff_lexicon(self.lexicon, lexicon)
+        compiled = copy.copy(self)
+        compiled.key = key
+        compiled.lexicon = lexicon
+        compiled.parser = parser = self.parser.with_lexicon(changes)
+
+        added = {word for words, _ in changes.values() for word in words if not self.parser.is_live(word)}
+        removed = {word for _, words in changes.values() for word in words if not parser.is_live(word)}
+        terminals = [term for term in self.terminals if term not in removed] if removed else list(self.terminals)
+        compiled.terminals = terminals + sorted(added)
+        compiled.trie = self.trie.updated(added=added, removed=removed)
+        compiled._grammar = None
+        return compiled
+
+    @property
+    def grammar_str(self):
+        return lexicon_grammar_str(self.lexicon)
+
+    @property
+    def grammar(self):
+        if self._grammar is None:
+            self._grammar = CFG.fromstring(self.grammar_str)
+        return self._grammar
+
+    def __getstate__(self):
+        # Không ghi văn phạm đầy đủ vào cache (dựng lại được khi cần)
+        state = dict(self.__dict__)
+        state["_grammar"] = None
+        return state
+
+def data_key(raw:bytes):
+    """
+    Khóa cache: băm nội dung data.json (raw) cùng khung văn phạm.
+    """
+    h = hashlib.sha256()
+    h.update(str(CACHE_VERSION).encode())
+    h.update(GRAMMAR_TEMPLATE.encode("utf-8"))
+    h.update(raw)
+    return h.hexdigest()
+
+def grammar_key(data_file=DATA_FILE):
+    with open(data_file, "rb") as f:
+        return data_key(f.read())
+
+def load_compiled_grammar(cache_file, data_file=DATA_FILE):
+    """
+    Nạp văn phạm đã biên dịch từ cache nếu khóa còn khớp,
+    ngược lại biên dịch lại từ data.json và ghi đè cache.
+    Trả về (CompiledGrammar, có dùng cache hay không).
+    """
+    key = grammar_key(data_file)
+    try:
+        with open(cache_file, "rb") as f:
+            compiled = pickle.load(f)
+        if getattr(compiled, "key", None) == key:
+            return compiled, True
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        pass
+
+    compiled = CompiledGrammar(key, build_lexicon(load_data(data_file)))
+
+    # Ghi ra file tạm rồi đổi tên để không để lại cache hỏng
+    cache_dir = os.path.dirname(cache_file)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with io.open(tmp_file, "wb") as f:
+        pickle.dump(compiled, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, cache_file)
+    return compiled, False
+
+def _build_inline(lexicon):
+    # Cách cũ: mọi từ là một luật của CFG, terminal lấy từ toàn bộ văn phạm
+    grammar = CFG.fromstring(lexicon_grammar_str(lexicon))
+    return EarleyParser(grammar), TerminalTrie(get_terminals(grammar))
+
+def _build_lexicon(lexicon):
+    compiled = CompiledGrammar(None, lexicon)
+    return compiled.parser, compiled.trie
+
+def benchmark(sizes, sentences_per_size=2000):
+    """
+    So sánh văn phạm nội tuyến (mọi món là một luật) với văn phạm theo từ điển
+    trên menu giả lập: thời gian dựng, bộ nhớ giữ lại và độ trễ phân tích.
+    """
+    import tracemalloc
+    from menu_db import synthetic_menu
+    from utils import custom_tokenizer
+
+    data = load_data()
+    print(f"{'số món':>8} {'cách':>8} {'dựng (ms)':>10} {'bộ nhớ (MB)':>12} {'phân tích (µs/câu)':>19}")
+    for size in sizes:
+        data["menu"] = synthetic_menu(size)
+        lexicon = build_lexicon(data)
+        foods = lexicon["FOOD"]
+        sentences = []
+        for i in range(sentences_per_size):
+            food = foods[i * 7919 % len(foods)]
+            sentences.append((f"cho tôi 2 phần {food} không cay", f"{food} giá bao nhiêu", f"có {food} không")[i % 3])
+
+        for name, build in (("nội tuyến", _build_inline), ("từ điển", _build_lexicon)):
+            start = time.perf_counter()
+            parser, trie = build(lexicon)
+            build_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            for sentence in sentences:
+                tokens = custom_tokenizer(sentence, trie)
+                if tokens is None or parser.parse_first(tokens) is None:
+                    raise ValueError(f"Không phân tích được câu: {sentence}")
+            parse_us = (time.perf_counter() - start) / len(sentences) * 1e6
+            del parser, trie
+
+            tracemalloc.start()
+            result = build(lexicon)
+            memory_mb = tracemalloc.get_traced_memory()[0] / 2**20
+            tracemalloc.stop()
+            del result
+            print(f"{size:>8} {name:>8} {build_ms:>10.0f} {memory_mb:>12.1f} {parse_us:>19.1f}")
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="So sánh văn phạm nội tuyến và văn phạm theo từ điển trên menu giả lập")
+    arg_parser.add_argument("--sizes", default="1000,10000,100000", help="các kích thước menu, cách nhau bởi dấu phẩy")
+    arg_parser.add_argument("--sentences", type=int, default=2000, help="số câu phân tích cho mỗi kích thước")
+    args = arg_parser.parse_args()
+    benchmark([int(size) for size in args.sizes.split(",")], args.sentences)
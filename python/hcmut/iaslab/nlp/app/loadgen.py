@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import time
+
+# Câu hỏi mặc định lấy từ các file input
+DEFAULT_QUERY_FILES = [os.path.join("input", "sample-queries.txt"), os.path.join("input", "sentences.txt")]
+
+def load_queries(files):
+    queries = []
+    for file in files:
+        with io.open(file, "r", encoding="utf-8") as f:
+            queries.extend(line.strip() for line in f if line.strip())
+    return queries
+
+def percentile(sorted_values, p):
+    """
+    Phân vị p (0-100) theo nearest-rank trên danh sách đã sắp xếp.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+async def _post(reader, writer, host, path, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    writer.write((f"POST {path} HTTP/1.1\r\nHost: {host}\r\n"
+                  "Content-Type: application/json; charset=utf-8\r\n"
+                  f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        header = await reader.readline()
+        if header in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = header.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+async def _client(client_id, host, port, queries, counter, total, latencies, errors, rng):
+    """
+    Một khách ảo: một kết nối keep-alive, một phiên (giỏ hàng) riêng.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    session = f"loadgen-{client_id}-{rng.getrandbits(32):08x}"
+    try:
+        while counter[0] < total:
+            counter[0] += 1
+            query = rng.choice(queries)
+            start = time.perf_counter()
+            status, _ = await _post(reader, writer, host, "/query", {"session": session, "query": query})
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors[0] += 1
+    finally:
+        writer.close()
+
+async def run_level(host, port, queries, concurrency, total, seed):
+    """
+    Gửi total yêu cầu với concurrency khách đồng thời.
+    Trả về (độ trễ đã sắp xếp (giây), số lỗi, thời gian chạy).
+    """
+    counter, errors, latencies = [0], [0], []
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _client(i, host, port, queries, counter, total, latencies, errors, random.Random(rng.getrandbits(64)))
+        for i in range(concurrency)
+    ))
+    return sorted(latencies), errors[0], time.perf_counter() - start
+
+async def main(host, port, queries, levels, total, seed):
+    print(f"{'đồng thời':>10} {'yêu cầu':>8} {'lỗi':>5} {'p50 (ms)':>9} {'p99 (ms)':>9} {'req/s':>9}")
+    for concurrency in levels:
+        latencies, errors, elapsed = await run_level(host, port, queries, concurrency, total, seed)
+        rate = len(latencies) / elapsed if elapsed > 0 else 0.0
+        print(f"{concurrency:>10} {len(latencies):>8} {errors:>5} "
+              f"{percentile(latencies, 50) * 1000:>9.2f} {percentile(latencies, 99) * 1000:>9.2f} {rate:>9.0f}")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Tạo tải cho server.py, đo độ trễ p50/p99 và số yêu cầu/giây")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8080)
+    arg_parser.add_argument("--concurrency", default="1,8,32",
+                            help="các mức số khách đồng thời, cách nhau bởi dấu phẩy")
+    arg_parser.add_argument("--requests", type=int, default=2000, help="số yêu cầu mỗi mức")
+    arg_parser.add_argument("--queries", nargs="+", default=DEFAULT_QUERY_FILES,
+                            help="file câu hỏi (mỗi dòng một câu)")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    asyncio.run(main(args.host, args.port, load_queries(args.queries), levels, args.requests, args.seed))
@@ -1,8 +1,12 @@
 from nltk import CFG
+import argparse
 import os
 from grammar import write_grammar
-from generator import generate_sentences
-from parser import build_parser
+from grammar_cache import load_compiled_grammar
+from generator import generate_sentences, stream_sentences, shard_sentences
+from parser import build_parser, report_ambiguity
+from metrics import Metrics
+from utils import positive_int
 
 OUTPUT_DIR = "output"
 INPUT_DIR = "input"
@@ -10,31 +14,82 @@ GRAMMAR_FILE = os.path.join(OUTPUT_DIR, "grammar.txt")
 SAMPLES_FILE = os.path.join(OUTPUT_DIR, "samples.txt")
 INPUT_SENTENCES_FILE = os.path.join(INPUT_DIR, "sentences.txt")
 PARSE_RESULTS_FILE = os.path.join(OUTPUT_DIR, "parse-results.txt")
+GRAMMAR_CACHE_FILE = os.path.join(OUTPUT_DIR, "grammar-cache.pkl")
+AMBIGUITY_FILE = os.path.join(OUTPUT_DIR, "ambiguity-report.txt")
+PARSE_METRICS_FILE = os.path.join(OUTPUT_DIR, "parse-metrics.json")
+SLOW_PARSES_FILE = os.path.join(OUTPUT_DIR, "slow-parses.jsonl")
 
-def main():
+def main(workers=1, chunk_size=1000, seed=None, max_sentences=10000, stream=False, resume=False, gen_workers=1,
+         ambiguity=False, metrics_file=None, slow_ms=None, profile_rate=0.0):
     # Tạo các thư mục và file input mẫu 
     print("Khởi tạo môi trường")
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     os.makedirs(INPUT_DIR, exist_ok=True)
 
-    # 2.1: Tạo Grammar 
-    grammar_str = write_grammar(GRAMMAR_FILE)
-    
-    # Load grammar từ string
+    # Load grammar đã biên dịch (cache theo data.json và khung văn phạm)
     try:
-        grammar:CFG = CFG.fromstring(grammar_str)
+        compiled, _ = load_compiled_grammar(GRAMMAR_CACHE_FILE)
     except ValueError as e:
         print(f"Lỗi khi nạp văn phạm: {e}")
         return
+    grammar:CFG = compiled.grammar
+
+    # 2.1: Tạo Grammar 
+    write_grammar(GRAMMAR_FILE, compiled.grammar_str)
 
     # 2.2: Sinh câu 
-    generate_sentences(grammar, SAMPLES_FILE, max_sentences=10000)
+    if gen_workers > 1:
+        # Sinh song song theo shard, seed mỗi shard suy ra từ seed gốc
+        shard_sentences(grammar, SAMPLES_FILE, max_sentences=max_sentences, seed=seed, workers=gen_workers)
+    elif stream or resume:
+        # Tập lớn: ghi dần, khử trùng bằng Bloom, có thể chạy tiếp
+        try:
+            stream_sentences(grammar, SAMPLES_FILE, max_sentences=max_sentences, seed=seed, resume=resume)
+        except ValueError as e:
+            print(f"Lỗi khi sinh câu: {e}")
+            return
+    else:
+        generate_sentences(grammar, SAMPLES_FILE, max_sentences=max_sentences, seed=seed)
+
+    # 2.3: Phân tích cú pháp (đo từng giai đoạn nếu có metrics_file/slow_ms)
+    metrics = None
+    if metrics_file or slow_ms is not None or profile_rate:
+        metrics = Metrics(enabled=True, slow_ms=slow_ms,
+                          slow_log=SLOW_PARSES_FILE if slow_ms is not None else None, profile_rate=profile_rate)
+    build_parser(compiled, INPUT_SENTENCES_FILE, PARSE_RESULTS_FILE, workers=workers, chunk_size=chunk_size,
+                 metrics=metrics)
+    if metrics is not None:
+        for line in metrics.summary():
+            print(line)
+        metrics.export(metrics_file or PARSE_METRICS_FILE)
 
-    # 2.3: Phân tích cú pháp 
-    build_parser(grammar, INPUT_SENTENCES_FILE, PARSE_RESULTS_FILE)
+    # Báo cáo nhập nhằng trên các câu mẫu (tùy chọn)
+    if ambiguity:
+        report_ambiguity(compiled, SAMPLES_FILE, AMBIGUITY_FILE)
 
     print("HOÀN TẤT")
     print(f"Kiểm tra kết quả trong thư mục '{OUTPUT_DIR}'.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Part I: grammar, sinh câu mẫu và phân tích cú pháp")
+    arg_parser.add_argument("--workers", type=positive_int, default=1, help="số tiến trình phân tích cú pháp")
+    arg_parser.add_argument("--chunk-size", type=positive_int, default=1000, help="số câu trong mỗi khối gửi cho tiến trình con")
+    arg_parser.add_argument("--seed", type=int, default=None, help="seed khi sinh câu mẫu (để tái lập kết quả)")
+    arg_parser.add_argument("--samples", type=int, default=10000, help="số câu mẫu cần sinh")
+    arg_parser.add_argument("--stream", action="store_true", help="sinh theo luồng với bộ lọc Bloom (cho tập rất lớn)")
+    arg_parser.add_argument("--resume", action="store_true", help="chạy tiếp lần sinh theo luồng bị ngắt")
+    arg_parser.add_argument("--gen-workers", type=positive_int, default=1, help="số tiến trình sinh câu (mỗi tiến trình một shard)")
+    arg_parser.add_argument("--ambiguity", action="store_true",
+                            help="đếm dẫn xuất trên rừng phân tích và ghi output/ambiguity-report.txt")
+    arg_parser.add_argument("--metrics", nargs="?", const=PARSE_METRICS_FILE, default=None, metavar="FILE",
+                            help=f"đo từng giai đoạn khi phân tích và ghi số liệu (mặc định {PARSE_METRICS_FILE}; "
+                                 "đuôi .prom cho định dạng Prometheus)")
+    arg_parser.add_argument("--slow-ms", type=float, default=None,
+                            help=f"ghi các câu phân tích chậm hơn ngưỡng này (ms) vào {SLOW_PARSES_FILE}")
+    arg_parser.add_argument("--profile-rate", type=float, default=0.0,
+                            help="tỉ lệ câu chạy dưới cProfile (chỉ khi --workers 1)")
+    args = arg_parser.parse_args()
+    main(workers=args.workers, chunk_size=args.chunk_size, seed=args.seed,
+         max_sentences=args.samples, stream=args.stream, resume=args.resume,
+         gen_workers=args.gen_workers, ambiguity=args.ambiguity,
+         metrics_file=args.metrics, slow_ms=args.slow_ms, profile_rate=args.profile_rate)
\ No newline at end of file
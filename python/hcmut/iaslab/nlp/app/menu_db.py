@@ -0,0 +1,199 @@
+import argparse
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+class MenuDB:
+    """
+    Menu nạp từ data.json vào SQLite (mặc định trong bộ nhớ), có chỉ mục theo
+    tên món và theo thuộc tính (option).
+
+    Ngữ nghĩa của câu hỏi được biên dịch thành câu lệnh có tham số
+    (compile) rồi chạy thật (execute); kết quả được cache theo (câu lệnh, tham số)
+    và bị xóa khi menu được nạp lại (load).
+    """
+    SCHEMA = """
+        CREATE TABLE menu (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            price INTEGER NOT NULL
+        );
+        CREATE TABLE menu_options (
+            option TEXT NOT NULL,
+            menu_id INTEGER NOT NULL REFERENCES menu (id),
+            PRIMARY KEY (option, menu_id)
+        ) WITHOUT ROWID;
+    """
+    # Các câu lệnh là hằng, chỉ khác tham số nên sqlite3 dùng lại bản đã biên dịch
+    STATEMENTS = {
+        'price': "SELECT price FROM menu WHERE name = ?",
+        'avail': "SELECT EXISTS (SELECT 1 FROM menu WHERE name = ?)",
+        'menu': "SELECT name, price FROM menu ORDER BY id",
+        'filter': """
+            SELECT m.name, m.price FROM menu_options o JOIN menu m ON m.id = o.menu_id
+            WHERE o.option = ? ORDER BY m.id
+        """,
+    }
+
+    def __init__(self, items, path=":memory:", cache_size=4096):
+        self.cache_size = cache_size
+        self.version = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = self._connect(path)
+        self._conn.executescript(self.SCHEMA)
+        self.load(items)
+
+    def _connect(self, path):
+        return sqlite3.connect(path, check_same_thread=False, isolation_level=None,
+                               cached_statements=len(self.STATEMENTS) + 8)
+
+    def load(self, items):
+        """
+        Thay toàn bộ menu bằng items (danh sách {"name", "price", "options"} như trong data.json).
+        """
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            conn.execute("DELETE FROM menu_options")
+            conn.execute("DELETE FROM menu")
+            conn.executemany("INSERT INTO menu (id, name, price) VALUES (?, ?, ?)",
+                             ((i, item["name"], item["price"]) for i, item in enumerate(items)))
+            conn.executemany("INSERT OR IGNORE INTO menu_options (option, menu_id) VALUES (?, ?)",
+                             ((option, i) for i, item in enumerate(items) for option in item["options"]))
+            conn.execute("COMMIT")
+            conn.execute("ANALYZE")
+            self.items = {item["name"]: (i, item["price"], list(item["options"])) for i, item in enumerate(items)}
+            self._next_id = len(items)
+            self._cache.clear()
+            self.version += 1
+
+    def with_items(self, items):
+        """
+        MenuDB mới cho menu items; bản hiện tại giữ nguyên (các câu đang chạy dở dùng tiếp).
+        Nếu các món cũ giữ nguyên thứ tự và món mới chỉ nằm ở cuối, sao chép DB
+        (backup của SQLite) rồi chỉ áp phần thay đổi; ngược lại nạp lại toàn bộ.
+        """
+        names = [item["name"] for item in items]
+        kept = [name for name in names if name in self.items]
+        first_added = next((i for i, name in enumerate(names) if name not in self.items), len(names))
+        incremental = (len(set(names)) == len(names)
+                       and all(name not in self.items for name in names[first_added:])
+                       and all(self.items[a][0] < self.items[b][0] for a, b in zip(kept, kept[1:])))
+        if not incremental:
+            return MenuDB(items, cache_size=self.cache_size)
+
+        menu_db = MenuDB.__new__(MenuDB)
+        menu_db.cache_size = self.cache_size
+        menu_db.version = self.version + 1
+        menu_db._cache = OrderedDict()
+        menu_db._lock = threading.Lock()
+        menu_db._conn = self._connect(":memory:")
+        with self._lock:
+            self._conn.backup(menu_db._conn)
+
+        current = {item["name"]: item for item in items}
+        menu_db.items = {}
+        menu_db._next_id = self._next_id
+        conn = menu_db._conn
+        conn.execute("BEGIN")
+        for name, (menu_id, price, options) in self.items.items():
+            if name not in current:
+                conn.execute("DELETE FROM menu_options WHERE menu_id = ?", (menu_id,))
+                conn.execute("DELETE FROM menu WHERE id = ?", (menu_id,))
+        for item in items:
+            name, price, options = item["name"], item["price"], list(item["options"])
+            if name in self.items:
+                menu_id, old_price, old_options = self.items[name]
+                if price != old_price:
+                    conn.execute("UPDATE menu SET price = ? WHERE id = ?", (price, menu_id))
+                if options != old_options:
+                    conn.execute("DELETE FROM menu_options WHERE menu_id = ?", (menu_id,))
+                    conn.executemany("INSERT OR IGNORE INTO menu_options (option, menu_id) VALUES (?, ?)",
+                                     ((option, menu_id) for option in options))
+            else:
+                menu_id = menu_db._next_id
+                menu_db._next_id += 1
+                conn.execute("INSERT INTO menu (id, name, price) VALUES (?, ?, ?)", (menu_id, name, price))
+                conn.executemany("INSERT OR IGNORE INTO menu_options (option, menu_id) VALUES (?, ?)",
+                                 ((option, menu_id) for option in options))
+            menu_db.items[name] = (menu_id, price, options)
+        conn.execute("COMMIT")
+        return menu_db
+
+    def compile(self, sem):
+        """
+        Biên dịch ngữ nghĩa thành (câu lệnh, tham số); None nếu không phải câu hỏi trên menu.
+        """
+        typ = sem.get('type') if sem else None
+        if typ in ('price', 'avail'):
+            return self.STATEMENTS[typ], (sem.get('food'),)
+        if typ == 'menu':
+            return self.STATEMENTS[typ], ()
+        if typ == 'filter':
+            return self.STATEMENTS[typ], (sem.get('option'),)
+        return None
+
+    def execute(self, statement):
+        """
+        Chạy câu lệnh đã biên dịch, trả về tuple các dòng (có cache).
+        """
+        with self._lock:
+            rows = self._cache.get(statement)
+            if rows is not None:
+                self._cache.move_to_end(statement)
+                return rows
+            sql, params = statement
+            rows = tuple(self._conn.execute(sql, params))
+            self._cache[statement] = rows
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return rows
+
+    def query(self, sem):
+        statement = self.compile(sem)
+        return self.execute(statement) if statement is not None else ()
+
+    def contains(self, food):
+        return bool(self.execute((self.STATEMENTS['avail'], (food,)))[0][0])
+
+    def price(self, food):
+        rows = self.execute((self.STATEMENTS['price'], (food,)))
+        return rows[0][0] if rows else None
+
+    def close(self):
+        self._conn.close()
+
+def synthetic_menu(size, options_per_item=3):
+    """
+    Menu giả lập size món để đo hiệu năng.
+    """
+    options = ["cay", "không cay", "nhiều rau", "ít đường", "nhiều đá", "tái", "chín", "hải sản", "thịt"]
+    return [{"name": f"món thử {i}", "price": 10000 + (i % 100) * 1000,
+             "options": [options[(i + k) % len(options)] for k in range(options_per_item)]}
+            for i in range(size)]
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Đo thời gian truy vấn menu trên menu giả lập")
+    arg_parser.add_argument("--size", type=int, default=100000, help="số món của menu giả lập")
+    arg_parser.add_argument("--queries", type=int, default=20000)
+    args = arg_parser.parse_args()
+
+    start = time.perf_counter()
+    menu_db = MenuDB(synthetic_menu(args.size))
+    print(f"Nạp {args.size} món: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    sems = [{'type': 'price', 'food': f"món thử {i * 7919 % args.size}"} for i in range(args.queries)]
+    for label, run in [("giá (lần đầu)", sems), ("giá (cache)", sems)]:
+        start = time.perf_counter()
+        for sem in run:
+            menu_db.query(sem)
+        elapsed = time.perf_counter() - start
+        print(f"{label}: {elapsed / len(run) * 1e6:.1f} µs/truy vấn")
+
+    for sem in [{'type': 'filter', 'option': 'không cay'}, {'type': 'menu'}]:
+        for label in ("lần đầu", "cache"):
+            start = time.perf_counter()
+            rows = menu_db.query(sem)
+            print(f"{sem['type']} ({label}): {len(rows)} dòng, {(time.perf_counter() - start) * 1000:.2f} ms")
@@ -0,0 +1,256 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+from bisect import bisect_left
+
+# Cận trên các bucket của histogram (giây), thang log từ 10 µs tới 10 s
+BUCKETS = tuple(m * 10.0 ** e for e in range(-5, 1) for m in (1.0, 2.5, 5.0)) + (10.0,)
+
+# Các bộ đếm luôn có trong kết quả xuất (kể cả khi bằng 0)
+COUNTERS = ("queries", "token_errors", "no_parse", "parse_errors", "cache_hits", "cache_misses", "slow_queries",
+            "multi_intent")
+
+class Histogram:
+    """
+    Histogram thời gian theo các bucket cố định BUCKETS (kiểu Prometheus).
+    """
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """
+        Ước lượng phân vị q (0-1) bằng cận trên của bucket chứa nó.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def merge(self, state):
+        for k, n in enumerate(state["counts"]):
+            self.counts[k] += n
+        self.count += state["count"]
+        self.sum += state["sum"]
+
+    def state(self):
+        return {"counts": list(self.counts), "count": self.count, "sum": self.sum}
+
+class Metrics:
+    """
+    Đo thời gian từng giai đoạn (tokenize, parse, semantics, execute, ...) bằng histogram,
+    đếm lỗi tokenize, "No parse", lỗi phân tích và hit/miss của parse cache.
+    Tùy chọn: chạy cProfile cho một tỉ lệ câu (profile_rate) và ghi log các câu chậm
+    hơn slow_ms (mỗi dòng một JSON: câu, số token, kích thước chart, thời gian từng giai đoạn).
+
+    Khi tắt, timer() trả về NULL_TIMER mà mọi phương thức đều không làm gì.
+    """
+    def __init__(self, enabled=False, slow_ms=None, slow_log=None, profile_rate=0.0, seed=None):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.slow_log = slow_log
+        self.profile_rate = profile_rate
+        self.stages = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.profile = None
+        self.profiled = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def config(self):
+        """
+        Cấu hình (không gồm số liệu) để dựng Metrics tương ứng trong tiến trình con.
+        """
+        return {"enabled": self.enabled, "slow_ms": self.slow_ms, "slow_log": self.slow_log}
+
+    def timer(self, query, profile=True):
+        """
+        Bộ đo cho một câu; profile=False để không bao giờ chạy cProfile (ví dụ trong
+        coroutine, nơi các câu khác xen vào giữa).
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        profiler = None
+        if profile and self.profile_rate and self._rng.random() < self.profile_rate:
+            profiler = cProfile.Profile()
+        return Timer(self, query, profiler)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_profile(self, profiler):
+        with self._lock:
+            if self.profile is None:
+                self.profile = pstats.Stats(profiler)
+            else:
+                self.profile.add(profiler)
+            self.profiled += 1
+
+    def log_slow(self, record):
+        self.count("slow_queries")
+        if self.slow_log is None:
+            return
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock, io.open(self.slow_log, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def state(self):
+        with self._lock:
+            return {"stages": {stage: h.state() for stage, h in self.stages.items()},
+                    "counters": dict(self.counters)}
+
+    def merge(self, state):
+        """
+        Cộng số liệu (state() của một Metrics khác, ví dụ từ tiến trình con) vào đây.
+        """
+        with self._lock:
+            for stage, histogram in state["stages"].items():
+                self.stages.setdefault(stage, Histogram()).merge(histogram)
+            for name, n in state["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def to_json(self):
+        state = self.state()
+        for stage, histogram in state["stages"].items():
+            h = self.stages[stage]
+            histogram["buckets"] = list(BUCKETS)
+            histogram.update({f"p{int(q * 100)}": h.quantile(q) for q in (0.5, 0.9, 0.99)})
+        return state
+
+    def to_prometheus(self, prefix="qa"):
+        """
+        Số liệu ở định dạng văn bản của Prometheus.
+        """
+        state = self.state()
+        lines = []
+        for name, n in sorted(state["counters"].items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {n}")
+        lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+        for stage, histogram in sorted(state["stages"].items()):
+            seen = 0
+            for bound, n in zip(BUCKETS, histogram["counts"]):
+                seen += n
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {seen}')
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"]:.9f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """
+        Ghi số liệu ra path: Prometheus text nếu đuôi là .prom hoặc .txt, ngược lại JSON.
+        Nếu có câu được profile thì ghi thêm thống kê cProfile ra path + ".pstats".
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with io.open(path, "w", encoding="utf-8") as f:
+            if path.endswith((".prom", ".txt")):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), f, ensure_ascii=False, indent=2)
+                f.write("\n")
+        if self.profile is not None:
+            self.profile.dump_stats(path + ".pstats")
+
+    def summary(self):
+        """
+        Các dòng tóm tắt để in ra màn hình.
+        """
+        state = self.state()
+        lines = [" ".join(f"{name}={n}" for name, n in state["counters"].items())]
+        for stage, h in self.stages.items():
+            mean = h.sum / h.count if h.count else 0.0
+            lines.append(f"{stage:<10} {h.count:>8} lần, trung bình {mean * 1e6:9.1f} µs, "
+                         f"p50 ≤ {h.quantile(0.5) * 1e6:g} µs, p99 ≤ {h.quantile(0.99) * 1e6:g} µs")
+        if self.profiled:
+            lines.append(f"cProfile: {self.profiled} câu")
+        return lines
+
+class Timer:
+    """
+    Đo một câu: lap(stage) ghi thời gian từ lần lap trước; done(result) ghi tổng thời gian,
+    kết thúc cProfile và ghi log nếu câu chậm (kèm số token và kích thước chart
+    nếu người gọi truyền tokens và parser).
+    """
+    def __init__(self, metrics, query, profiler=None):
+        self.metrics = metrics
+        self.query = query
+        self.laps = {}
+        self.profiler = profiler
+        if profiler is not None:
+            profiler.enable()
+        self.start = self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.laps[stage] = self.laps.get(stage, 0.0) + now - self.last
+        self.metrics.observe(stage, now - self.last)
+        self.last = now
+
+    def count(self, name):
+        self.metrics.count(name)
+
+    def done(self, result, counter=None, tokens=None, parser=None):
+        total = time.perf_counter() - self.start
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.metrics.add_profile(self.profiler)
+        metrics = self.metrics
+        metrics.observe("total", total)
+        metrics.count("queries")
+        if counter is not None:
+            metrics.count(counter)
+        if metrics.slow_ms is not None and total * 1000 >= metrics.slow_ms:
+            record = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "query": self.query,
+                      "tokens": len(tokens) if tokens is not None else None,
+                      "chart_size": None, "ms": round(total * 1000, 3),
+                      "stages_ms": {stage: round(t * 1000, 3) for stage, t in self.laps.items()}}
+            if tokens is not None and parser is not None:
+                # Chỉ dựng lại chart cho câu chậm
+                record["chart_size"] = parser.chart_size(tokens)
+            metrics.log_slow(record)
+        return result
+
+class _NullTimer:
+    """
+    Bộ đo khi tắt đo đạc: không làm gì.
+    """
+    def lap(self, stage):
+        pass
+
+    def count(self, name):
+        pass
+
+    def done(self, result, counter=None, tokens=None, parser=None):
+        return result
+
+NULL_TIMER = _NullTimer()
@@ -0,0 +1,399 @@
+import abc
+import argparse
+import contextlib
+import os
+import queue
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Phân cách các thuộc tính của một món khi lưu trong SQLite
+ATTRIBUTE_SEPARATOR = "\x1f"
+
+class OrderStore(abc.ABC):
+    """
+    Giao diện lưu giỏ hàng theo phiên.
+
+    items(session)   -> [(món, số lượng, [thuộc tính], thời gian giao, thành tiền)]
+                        theo thứ tự món được thêm vào giỏ lần đầu
+    summary(session) -> (tổng tiền, [các thời gian giao khác nhau theo thứ tự xuất hiện])
+
+    Thành tiền tính theo bảng giá hiện tại (set_prices); món đã bị bỏ khỏi menu
+    (nạp lại data.json) vẫn ở trong giỏ với đơn giá lúc được thêm lần cuối.
+    """
+    # True nếu các thao tác có thể chặn (I/O), khi đó server chạy chúng ở thread riêng
+    blocking = False
+
+    @abc.abstractmethod
+    def add(self, session, food, quantity, attributes, time):
+        """
+        Thêm món (cộng dồn số lượng và thuộc tính nếu đã có; thời gian giao mới ghi đè thời gian cũ).
+        """
+
+    @abc.abstractmethod
+    def remove(self, session, food):
+        """
+        Xóa món khỏi giỏ; trả về False nếu giỏ không có món đó.
+        """
+
+    @abc.abstractmethod
+    def items(self, session):
+        """
+        Các món trong giỏ (xem định dạng ở trên).
+        """
+
+    @abc.abstractmethod
+    def summary(self, session):
+        """
+        (tổng tiền, các thời gian giao) của giỏ.
+        """
+
+    @abc.abstractmethod
+    def set_prices(self, prices):
+        """
+        Thay bảng giá {món: giá} (khi menu được nạp lại).
+        """
+
+    def release(self, session):
+        """
+        Phiên hết hạn: bỏ trạng thái giữ trong bộ nhớ (nếu có).
+        """
+        pass
+
+    def close(self):
+        pass
+
+    def cart(self, session):
+        return Cart(self, session)
+
+class Cart:
+    """
+    Giỏ hàng của một phiên trong một OrderStore.
+    """
+    def __init__(self, store:OrderStore, session):
+        self.store = store
+        self.session = session
+
+    def add(self, food, quantity, attributes, time):
+        self.store.add(self.session, food, quantity, attributes, time)
+
+    def remove(self, food):
+        return self.store.remove(self.session, food)
+
+    def items(self):
+        return self.store.items(self.session)
+
+    def summary(self):
+        return self.store.summary(self.session)
+
+class MemoryOrderStore(OrderStore):
+    """
+    Giỏ hàng giữ trong bộ nhớ tiến trình (mất khi khởi động lại).
+    """
+    def __init__(self, prices):
+        self.prices = dict(prices)
+        self._orders = {}
+        self._lock = threading.Lock()
+
+    def add(self, session, food, quantity, attributes, time):
+        with self._lock:
+            order = self._orders.setdefault(session, {})
+            price = self.prices.get(food)
+            if food in order:
+                order[food]['quantity'] += quantity
+                order[food]['attributes'].extend(attributes)
+                if time:
+                    order[food]['time'] = time  # Cập nhật thời gian mới nhất
+                if price is not None:
+                    order[food]['price'] = price
+            else:
+                order[food] = {'quantity': quantity, 'attributes': list(attributes), 'time': time, 'price': price}
+
+    def _unit_price(self, food, info):
+        # Giá hiện tại; món không còn trong menu giữ đơn giá lúc thêm vào giỏ
+        price = self.prices.get(food)
+        if price is None:
+            price = info['price'] or 0
+        return price
+
+    def remove(self, session, food):
+        with self._lock:
+            order = self._orders.get(session, {})
+            if food not in order:
+                return False
+            del order[food]
+            return True
+
+    def items(self, session):
+        with self._lock:
+            return [(food, info['quantity'], list(info['attributes']), info['time'],
+                     info['quantity'] * self._unit_price(food, info))
+                    for food, info in self._orders.get(session, {}).items()]
+
+    def summary(self, session):
+        with self._lock:
+            order = self._orders.get(session, {})
+            total = sum(info['quantity'] * self._unit_price(food, info) for food, info in order.items())
+            return total, list(dict.fromkeys(info['time'] for info in order.values()))
+
+    def set_prices(self, prices):
+        with self._lock:
+            self.prices = dict(prices)
+
+    def release(self, session):
+        with self._lock:
+            self._orders.pop(session, None)
+
+class _Write:
+    __slots__ = ("fn", "done", "result", "error")
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SQLiteOrderStore(OrderStore):
+    """
+    Giỏ hàng lưu trong SQLite (chế độ WAL), dùng chung được giữa các tiến trình
+    và còn nguyên sau khi khởi động lại.
+
+    Đọc: một pool kết nối, mỗi kết nối giữ cache câu lệnh đã biên dịch
+    (các câu SQL là hằng, chỉ khác tham số).
+    Ghi: một thread ghi duy nhất gom các thao tác đang chờ thành một transaction
+    (tối đa batch_size thao tác mỗi lần commit); người gọi chờ đến khi commit xong
+    nên luôn đọc được dữ liệu mình vừa ghi.
+    Tổng tiền và thời gian giao được tính bằng truy vấn trên chỉ mục (session, food).
+    """
+    blocking = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS prices (
+            name TEXT PRIMARY KEY,
+            price INTEGER NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER PRIMARY KEY,
+            session TEXT NOT NULL,
+            food TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            attributes TEXT NOT NULL,
+            time TEXT NOT NULL,
+            price INTEGER,
+            UNIQUE (session, food)
+        );
+    """
+    ADD_SQL = """
+        INSERT INTO order_items (session, food, quantity, attributes, time, price)
+        VALUES (?, ?, ?, ?, ?, (SELECT price FROM prices WHERE name = ?))
+        ON CONFLICT (session, food) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            attributes = CASE WHEN excluded.attributes = '' THEN attributes
+                              WHEN attributes = '' THEN excluded.attributes
+                              ELSE attributes || char(31) || excluded.attributes END,
+            time = CASE WHEN excluded.time = '' THEN time ELSE excluded.time END,
+            price = COALESCE(excluded.price, price)
+    """
+    REMOVE_SQL = "DELETE FROM order_items WHERE session = ? AND food = ?"
+    ITEMS_SQL = """
+        SELECT o.food, o.quantity, o.attributes, o.time, o.quantity * COALESCE(p.price, o.price, 0)
+        FROM order_items o LEFT JOIN prices p ON p.name = o.food
+        WHERE o.session = ? ORDER BY o.id
+    """
+    TOTAL_SQL = """
+        SELECT COALESCE(SUM(o.quantity * COALESCE(p.price, o.price, 0)), 0)
+        FROM order_items o LEFT JOIN prices p ON p.name = o.food
+        WHERE o.session = ?
+    """
+    TIMES_SQL = "SELECT time FROM order_items WHERE session = ? GROUP BY time ORDER BY MIN(id)"
+
+    def __init__(self, path, prices, pool_size=4, batch_size=64):
+        self.path = path
+        self.batch_size = batch_size
+        self._closed = False
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        writer = self._connect()
+        writer.execute("PRAGMA journal_mode=WAL")
+        writer.executescript(self.SCHEMA)
+        # File tạo bởi phiên bản cũ chưa có cột đơn giá lúc thêm món
+        if "price" not in [row[1] for row in writer.execute("PRAGMA table_info(order_items)")]:
+            writer.execute("ALTER TABLE order_items ADD COLUMN price INTEGER")
+        writer.execute("BEGIN IMMEDIATE")
+        self._replace_prices(writer, dict(prices))
+        writer.execute("COMMIT")
+
+        self._readers = queue.Queue()
+        for _ in range(pool_size):
+            self._readers.put(self._connect())
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, args=(writer,), daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        # isolation_level=None: tự quản lý transaction (BEGIN/COMMIT)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                               check_same_thread=False, cached_statements=64)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextlib.contextmanager
+    def _reader(self):
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def _write(self, fn):
+        """
+        Gửi thao tác ghi fn(conn) cho thread ghi và chờ đến khi được commit.
+        """
+        if self._closed:
+            raise RuntimeError("order store is closed")
+        write = _Write(fn)
+        self._writes.put(write)
+        write.done.wait()
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    def _write_loop(self, conn):
+        stop = False
+        while not stop:
+            first = self._writes.get()
+            if first is None:
+                break
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    write = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if write is None:
+                    stop = True
+                    break
+                batch.append(write)
+
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for write in batch:
+                    write.result = write.fn(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                # Chạy lại từng thao tác để một thao tác lỗi không làm hỏng cả lô
+                for write in batch:
+                    try:
+                        conn.execute("BEGIN IMMEDIATE")
+                        write.result = write.fn(conn)
+                        conn.execute("COMMIT")
+                    except Exception as e:
+                        if conn.in_transaction:
+                            conn.execute("ROLLBACK")
+                        write.error = e
+            for write in batch:
+                write.done.set()
+        conn.close()
+
+    def _replace_prices(self, conn, prices):
+        conn.execute("DELETE FROM prices")
+        conn.executemany("INSERT INTO prices (name, price) VALUES (?, ?)", prices.items())
+
+    def add(self, session, food, quantity, attributes, time):
+        params = (session, food, quantity, ATTRIBUTE_SEPARATOR.join(attributes), time, food)
+        self._write(lambda conn: conn.execute(self.ADD_SQL, params))
+
+    def remove(self, session, food):
+        return self._write(lambda conn: conn.execute(self.REMOVE_SQL, (session, food)).rowcount > 0)
+
+    def items(self, session):
+        with self._reader() as conn:
+            rows = conn.execute(self.ITEMS_SQL, (session,)).fetchall()
+        return [(food, quantity, attributes.split(ATTRIBUTE_SEPARATOR) if attributes else [], time, subtotal)
+                for food, quantity, attributes, time, subtotal in rows]
+
+    def summary(self, session):
+        with self._reader() as conn:
+            total = conn.execute(self.TOTAL_SQL, (session,)).fetchone()[0]
+            times = [row[0] for row in conn.execute(self.TIMES_SQL, (session,))]
+        return total, times
+
+    def set_prices(self, prices):
+        prices = dict(prices)
+        self._write(lambda conn: self._replace_prices(conn, prices))
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._writes.put(None)
+        self._writer.join()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+
+def open_order_store(kind, prices, path=None):
+    """
+    Tạo order store theo tên: "memory" hoặc "sqlite" (lưu tại path).
+    """
+    if kind == "memory":
+        return MemoryOrderStore(prices)
+    if kind == "sqlite":
+        return SQLiteOrderStore(path, prices)
+    raise ValueError(f"Unknown order store: {kind}")
+
+def benchmark(store:OrderStore, foods, sessions=1000, threads=16, operations=20000, seed=0):
+    """
+    Chạy operations thao tác (đặt/thêm 60%, xóa 15%, xem đơn 25%) trên các phiên
+    ngẫu nhiên từ nhiều thread đồng thời; trả về số thao tác/giây.
+    """
+    per_thread = operations // threads
+
+    def run(thread_index):
+        rng = random.Random(seed * 1000003 + thread_index)
+        for _ in range(per_thread):
+            session = f"s{rng.randrange(sessions)}"
+            r = rng.random()
+            if r < 0.6:
+                store.add(session, rng.choice(foods), rng.randint(1, 3), [], rng.choice(["", "12 giờ"]))
+            elif r < 0.75:
+                store.remove(session, rng.choice(foods))
+            else:
+                store.items(session)
+                store.summary(session)
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    return per_thread * threads / elapsed if elapsed > 0 else 0.0
+
+if __name__ == "__main__":
+    import json
+
+    arg_parser = argparse.ArgumentParser(description="Đo số thao tác/giây của các order store")
+    arg_parser.add_argument("--stores", default="memory,sqlite")
+    arg_parser.add_argument("--sessions", type=int, default=1000)
+    arg_parser.add_argument("--threads", type=int, default=16)
+    arg_parser.add_argument("--operations", type=int, default=20000)
+    args = arg_parser.parse_args()
+
+    with open(os.path.join(os.path.dirname(__file__), "data.json"), "r", encoding="utf-8") as f:
+        prices = {item["name"]: item["price"] for item in json.load(f)["menu"]}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for kind in args.stores.split(","):
+            store = open_order_store(kind, prices, os.path.join(tmp_dir, "orders.db"))
+            try:
+                rate = benchmark(store, list(prices), args.sessions, args.threads, args.operations)
+            finally:
+                store.close()
+            print(f"{kind:>8}: {rate:,.0f} thao tác/giây ({args.threads} thread, {args.sessions} phiên)")
@@ -0,0 +1,77 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+class ParseCache:
+    """
+    Cache LRU (có TTL tùy chọn) cho kết quả phân tích: khóa là tuple token
+    đã chuẩn hóa, giá trị là (có phân tích được hay không, ngữ nghĩa).
+    Cache gắn với một phiên bản văn phạm (khóa của grammar_cache);
+    khi phiên bản đổi thì toàn bộ cache bị xóa. An toàn khi dùng từ nhiều thread.
+    copy_value: hàm sao chép giá trị khi lưu/trả về (mặc định deepcopy).
+    """
+    def __init__(self, max_size=10000, ttl=None, version=None, copy_value=copy.deepcopy):
+        self.max_size = max_size
+        self.copy_value = copy_value
+        self.ttl = ttl
+        self.version = version
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def bind(self, version):
+        """
+        Gắn cache với phiên bản văn phạm/data.json; xóa cache nếu phiên bản khác.
+        Gọi được từ thread khác (thread theo dõi data.json) trong lúc get/put đang chạy.
+        """
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+
+    def get(self, key, version=None):
+        """
+        version: phiên bản văn phạm người gọi đang dùng; khác phiên bản của
+        cache (đã nạp lại) thì coi như không có.
+        """
+        with self._lock:
+            entry = self._entries.get(key) if version is None or version == self.version else None
+            if entry is not None and entry[0] is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # Trả bản sao vì execute_query có thể sửa danh sách thuộc tính
+        return self.copy_value(entry[1])
+
+    def put(self, key, value, version=None):
+        value = self.copy_value(value)
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            # Kết quả phân tích theo văn phạm cũ (câu chạy dở khi nạp lại) thì bỏ qua;
+            # kiểm tra cùng lúc với bind nên không lọt vào cache của phiên bản mới
+            if version is not None and version != self.version:
+                return
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
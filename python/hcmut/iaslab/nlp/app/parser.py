@@ -1,55 +1,183 @@
 import io
-from nltk import ChartParser
-from utils import get_terminals, custom_tokenizer
-def build_parser(grammar, input_file, output_file):
+import math
+import time
+from collections import Counter
+from itertools import islice
+from multiprocessing import Pool
+from utils import custom_tokenizer
+from metrics import Metrics, NULL_TIMER
+
+# Trạng thái của mỗi tiến trình con: (parser, terminals, metrics), nạp một lần khi khởi tạo
+_worker_state = None
+
+def parse_sentence(parser, terminals, sentence, timer=NULL_TIMER):
+    """
+    Phân tích một câu, trả về dòng kết quả (cây cú pháp hoặc "()").
+    timer: bộ đo của metrics (đo tokenize/parse/format, đếm lỗi).
+    """
+    # Tokenize câu dựa trên văn phạm
+    tokens = custom_tokenizer(sentence, terminals)
+    timer.lap("tokenize")
+    if tokens is None:
+        # Lỗi tokenize (từ không xác định)
+        return timer.done("()\n", "token_errors")
+
+    # Phân tích cú pháp
+    try:
+        # Chỉ dựng cây cú pháp đầu tiên, không liệt kê mọi dẫn xuất
+        tree = parser.parse_first(tokens)
+    except ValueError:
+        return timer.done("()\n", "parse_errors", tokens, parser)
+    timer.lap("parse")
+
+    if tree is None:
+        # Không có cây cú pháp nào hợp lệ
+        return timer.done("()\n", "no_parse", tokens, parser)
+    result = " ".join(str(tree).split()) + "\n"
+    timer.lap("format")
+    return timer.done(result, None, tokens, parser)
+
+def _init_worker(compiled, metrics_config):
+    global _worker_state
+    _worker_state = (compiled.parser, compiled.trie, Metrics(**metrics_config))
+
+def _parse_chunk(sentences):
+    parser, terminals, metrics = _worker_state
+    results = [parse_sentence(parser, terminals, sentence, metrics.timer(sentence)) for sentence in sentences]
+    if not metrics.enabled:
+        return results, None
+    # Gửi kèm số liệu của khối để tiến trình chính cộng dồn
+    state = metrics.state()
+    metrics.reset()
+    return results, state
+
+def _read_chunks(f_in, chunk_size):
+    """
+    Đọc file theo từng khối câu (bỏ dòng trống) để không nạp hết vào bộ nhớ.
+    """
+    sentences = (line.strip() for line in f_in)
+    sentences = (sentence for sentence in sentences if sentence)
+    while True:
+        chunk = list(islice(sentences, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def build_parser(compiled, input_file, output_file, workers=1, chunk_size=1000, metrics=None):
     """
     Phân tích cú pháp các câu trong input/sentences.txt
     và ghi kết quả ra output/parse-results.txt
+
+    compiled là CompiledGrammar (bộ phân tích và trie dựng sẵn).
+    workers > 1: chia file thành các khối chunk_size câu và phân tích song song
+    bằng process pool; văn phạm được nạp một lần cho mỗi tiến trình,
+    kết quả vẫn được ghi đúng thứ tự dòng ban đầu.
+    metrics: Metrics để đo từng giai đoạn của mỗi câu (None là không đo).
     """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be at least 1, got {chunk_size}")
     print(f"--- 2.3: Phân tích cú pháp file {input_file} ---")
-    
-    parser = ChartParser(grammar)
-    terminals = get_terminals(grammar)
-    results = []
 
     try:
-        with io.open(input_file, "r", encoding="utf-8") as f_in:
-            sentences = f_in.readlines()
-            
-        for sentence in sentences:
-            sentence = sentence.strip()
+        f_in = io.open(input_file, "r", encoding="utf-8")
+    except FileNotFoundError:
+        print(f"Lỗi: Không tìm thấy file {input_file}")
+        return
+
+    if metrics is None:
+        metrics = Metrics()
+    start = time.perf_counter()
+    count = 0
+    with f_in, io.open(output_file, "w", encoding="utf-8") as f_out:
+        chunks = _read_chunks(f_in, chunk_size)
+        if workers > 1:
+            with Pool(workers, initializer=_init_worker, initargs=(compiled, metrics.config())) as pool:
+                # imap giữ nguyên thứ tự các khối
+                for results, state in pool.imap(_parse_chunk, chunks):
+                    f_out.writelines(results)
+                    count += len(results)
+                    if state is not None:
+                        metrics.merge(state)
+        else:
+            parser, terminals = compiled.parser, compiled.trie
+            for chunk in chunks:
+                f_out.writelines(parse_sentence(parser, terminals, sentence, metrics.timer(sentence))
+                                 for sentence in chunk)
+                count += len(chunk)
+    elapsed = time.perf_counter() - start
+
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"Đã phân tích {count} câu trong {elapsed:.2f} giây ({rate:.0f} câu/giây, {workers} tiến trình)")
+    print(f"Đã phân tích và ghi kết quả ra file: {output_file}\n")
+
+def report_ambiguity(compiled, input_file, output_file, k=3, top=10):
+    """
+    Báo cáo nhập nhằng trên một tập câu (mặc định output/samples.txt): số dẫn xuất
+    của mỗi câu được đếm trên rừng phân tích (không liệt kê cây), thống kê các
+    nonterminal/luật gây nhập nhằng và in k cây đầu của các câu nhập nhằng nhất.
+    """
+    print(f"--- Báo cáo nhập nhằng trên {input_file} ---")
+    try:
+        f_in = io.open(input_file, "r", encoding="utf-8")
+    except FileNotFoundError:
+        print(f"Lỗi: Không tìm thấy file {input_file}")
+        return
+
+    parser, terminals = compiled.parser, compiled.trie
+    start = time.perf_counter()
+    total = token_errors = parse_errors = 0
+    derivations, nodes = [], []
+    sources, points = Counter(), Counter()
+    most = []
+    with f_in:
+        for sentence in (line.strip() for line in f_in):
             if not sentence:
                 continue
-                
-            # Tokenize câu dựa trên văn phạm
+            total += 1
             tokens = custom_tokenizer(sentence, terminals)
             if tokens is None:
-                # Lỗi tokenize (từ không xác định)
-                results.append("()\n")
+                token_errors += 1
                 continue
-                
-            # Phân tích cú pháp
-            try:
-                # parser.parse() trả về một generator
-                parse_trees = list(parser.parse(tokens))
-                
-                if not parse_trees:
-                    # Không có cây cú pháp nào hợp lệ
-                    results.append("()\n")
-                else:
-                    # Lấy cây cú pháp đầu tiên 
-                    tree_str = " ".join(str(parse_trees[0]).split()) 
-                    results.append(tree_str + "\n")
-                    
-            except ValueError as e:
-                results.append("()\n")
-
-    except FileNotFoundError:
-        print(f"Lỗi: Không tìm thấy file {input_file}")
-        return
+            forest = parser.parse_forest(tokens)
+            if forest is None:
+                parse_errors += 1
+                continue
+            count = forest.count()
+            derivations.append(count)
+            nodes.append(len(forest.nodes()))
+            if count > 1:
+                ambiguities = forest.ambiguities()
+                sources.update({label for label, _, _, _ in ambiguities})
+                points.update(label for label, _, _, _ in ambiguities)
+                most.append((count, sentence, forest))
+                # Chỉ giữ top câu nhiều dẫn xuất nhất
+                most.sort(key=lambda x: -x[0])
+                del most[top:]
+    elapsed = time.perf_counter() - start
 
-    # Ghi kết quả ra file
+    parsed = len(derivations)
+    ambiguous = sum(count > 1 for count in derivations)
     with io.open(output_file, "w", encoding="utf-8") as f_out:
-        f_out.writelines(results)
-        
-    print(f"Đã phân tích và ghi kết quả ra file: {output_file}\n")
\ No newline at end of file
+        f_out.write(f"=== BÁO CÁO NHẬP NHẰNG ({input_file}) ===\n\n")
+        f_out.write(f"Số câu: {total} (lỗi tokenize: {token_errors}, không phân tích được: {parse_errors})\n")
+        f_out.write(f"Câu nhập nhằng: {ambiguous}/{parsed} ({ambiguous / parsed if parsed else 0:.2%})\n")
+        if parsed:
+            finite = [count for count in derivations if count != math.inf]
+            f_out.write(f"Số dẫn xuất: trung bình {sum(finite) / len(finite) if finite else 0:.2f}, "
+                        f"lớn nhất {max(derivations)}, vô hạn (chu trình): {parsed - len(finite)}\n")
+            f_out.write(f"Kích thước rừng: trung bình {sum(nodes) / parsed:.1f} nút, lớn nhất {max(nodes)} nút\n")
+
+        f_out.write("\nNguồn nhập nhằng (số câu, số điểm gói):\n")
+        for label, sentences in sources.most_common():
+            f_out.write(f"  {sentences:>6} {points[label]:>6}  {label}\n")
+        if not sources:
+            f_out.write("  (không có)\n")
+
+        f_out.write(f"\nCác câu nhiều dẫn xuất nhất ({k} cây đầu):\n")
+        for count, sentence, forest in most:
+            f_out.write(f"\n[{count} cây] {sentence}\n")
+            for rank, (_, tree) in enumerate(forest.kbest(k), 1):
+                f_out.write(f"  {rank}. {' '.join(str(tree).split())}\n")
+
+    print(f"{ambiguous}/{parsed} câu nhập nhằng, {elapsed:.2f} giây")
+    print(f"Đã ghi báo cáo nhập nhằng ra file: {output_file}\n")
@@ -0,0 +1,364 @@
+import argparse
+import io
+import json
+import math
+import os
+import time
+from nltk import Tree, PCFG
+from nltk.grammar import Nonterminal, ProbabilisticProduction
+from earley import EarleyParser, BudgetExceeded
+from utils import custom_tokenizer
+from main import OUTPUT_DIR, SAMPLES_FILE, INPUT_DIR, GRAMMAR_CACHE_FILE
+
+# Văn phạm xác suất (khung văn phạm kèm xác suất mỗi luật, định dạng PCFG của NLTK)
+PCFG_FILE = os.path.join(OUTPUT_DIR, "pcfg.txt")
+
+def uniform_probs(parser:EarleyParser):
+    """
+    Xác suất đều: mỗi luật của A có xác suất 1 / số luật của A.
+    """
+    return [1.0 / len(parser.by_lhs[lhs]) for lhs, _ in parser.productions]
+
+def probs_to_costs(probs):
+    """
+    Chi phí của từng production cho EarleyParser.parse_viterbi: -log xác suất.
+    """
+    return [-math.log(prob) if prob > 0 else math.inf for prob in probs]
+
+def _postorder(forest):
+    # Các nút của rừng, con đứng trước cha
+    order, seen = [], {forest.root}
+    stack = [(forest.root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            order.append(node)
+            continue
+        stack.append((node, True))
+        for _, tails in forest.edges(node):
+            for tail in tails:
+                if tail not in seen:
+                    seen.add(tail)
+                    stack.append((tail, False))
+    return order
+
+def add_expected_counts(forest, probs, counts):
+    """
+    Cộng số lần dùng kỳ vọng của từng production (inside-outside trên rừng phân tích,
+    theo xác suất probs) vào counts. Câu không nhập nhằng cho đúng số lần dùng trong cây.
+    Trả về xác suất của câu (inside của gốc).
+    """
+    order = _postorder(forest)
+    inside = {}
+    for node in order:
+        total = 0.0
+        for p, tails in forest.edges(node):
+            weight = probs[p] if p is not None else 1.0
+            for tail in tails:
+                weight *= inside[tail]
+            total += weight
+        inside[node] = total
+    z = inside[forest.root]
+    if z <= 0:
+        return z
+
+    outside = dict.fromkeys(order, 0.0)
+    outside[forest.root] = 1.0
+    for node in reversed(order):
+        out = outside[node]
+        if not out:
+            continue
+        for p, tails in forest.edges(node):
+            weight = probs[p] if p is not None else 1.0
+            inner = [inside[tail] for tail in tails]
+            edge = out * weight * math.prod(inner)
+            if p is not None:
+                counts[p] += edge / z
+            for k, tail in enumerate(tails):
+                outside[tail] += out * weight * math.prod(inner[:k] + inner[k + 1:])
+    return z
+
+def add_tree_counts(parser:EarleyParser, tree:Tree, counts):
+    """
+    Cộng số lần dùng các production trong một cây gán nhãn sẵn vào counts.
+    Luật từ vựng của một loại từ vựng (FOOD -> 'phở bò') được tính cho luật giữ chỗ của loại.
+    Trả về số production không có trong văn phạm (bị bỏ qua).
+    """
+    index = _production_index(parser)
+    placeholders = {lhs: parser.by_lhs[lhs][0] for lhs in parser.categories.values()}
+    unknown = 0
+    for production in tree.productions():
+        lhs = parser.nonterminal_ids.get(production.lhs())
+        if lhs in placeholders and production.is_lexical():
+            counts[placeholders[lhs]] += 1
+            continue
+        rhs = production.rhs()
+        if len(rhs) > 1 and production.is_lexical() and all(isinstance(sym, str) for sym in rhs):
+            # Cây dạng ngoặc tách terminal nhiều từ ("tôi muốn") thành nhiều lá
+            rhs = (" ".join(rhs),)
+        p = index.get((lhs, _encode_rhs(parser, rhs)))
+        if p is None:
+            unknown += 1
+        else:
+            counts[p] += 1
+    return unknown
+
+def _encode_rhs(parser, rhs):
+    return tuple(parser.nonterminal_ids.get(sym) if isinstance(sym, Nonterminal) else ~parser.terminal_ids.get(sym, -1)
+                 for sym in rhs)
+
+def _production_index(parser):
+    return {(lhs, rhs): p for p, (lhs, rhs) in enumerate(parser.productions)}
+
+def normalize(parser:EarleyParser, counts, smoothing=1.0):
+    """
+    Xác suất từ số lần dùng, chuẩn hóa theo vế trái, cộng thêm smoothing cho mỗi luật
+    (luật chưa gặp vẫn có xác suất dương).
+    """
+    probs = [0.0] * len(parser.productions)
+    for prods in parser.by_lhs:
+        total = sum(counts[p] for p in prods) + smoothing * len(prods)
+        for p in prods:
+            probs[p] = (counts[p] + smoothing) / total if total else 1.0 / len(prods)
+    return probs
+
+def estimate_from_sentences(parser:EarleyParser, terminals, sentences, iterations=1, smoothing=1.0):
+    """
+    Ước lượng xác suất luật từ câu chưa gán nhãn bằng EM (inside-outside), bắt đầu
+    từ xác suất đều. Câu không nhập nhằng (gần như mọi câu của samples.txt) góp đúng
+    tần suất luật ngay từ vòng đầu; các vòng sau chỉ đổi cách chia các câu nhập nhằng.
+    Trả về (xác suất, số câu dùng được).
+    """
+    forests = []
+    for sentence in sentences:
+        tokens = custom_tokenizer(sentence, terminals)
+        if tokens is None:
+            continue
+        forest = parser.parse_forest(tokens)
+        if forest is not None and forest.count() != math.inf:
+            forests.append(forest)
+    probs = uniform_probs(parser)
+    for _ in range(max(1, iterations)):
+        counts = [0.0] * len(parser.productions)
+        for forest in forests:
+            add_expected_counts(forest, probs, counts)
+        probs = normalize(parser, counts, smoothing)
+    return probs, len(forests)
+
+def estimate_from_trees(parser:EarleyParser, trees, smoothing=1.0):
+    """
+    Ước lượng có giám sát từ các cây gán nhãn (tần suất luật).
+    Trả về (xác suất, số cây, số production lạ bị bỏ qua).
+    """
+    counts = [0.0] * len(parser.productions)
+    n = unknown = 0
+    for tree in trees:
+        unknown += add_tree_counts(parser, tree, counts)
+        n += 1
+    return normalize(parser, counts, smoothing), n, unknown
+
+def read_trees(file):
+    """
+    Đọc cây gán nhãn: mỗi dòng là một cây dạng ngoặc (như parse-results.txt, bỏ dòng "()")
+    hoặc JSON {"tree": "(S ...)"}.
+    """
+    with io.open(file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("{"):
+                line = json.loads(line).get("tree") or ""
+            if line and line != "()":
+                yield Tree.fromstring(line)
+
+def write_pcfg(parser:EarleyParser, probs, output_file=PCFG_FILE):
+    """
+    Ghi khung văn phạm kèm xác suất từng luật theo định dạng PCFG của NLTK
+    (nltk.PCFG.fromstring đọc lại được). Các từ của một loại từ vựng dùng chung
+    luật giữ chỗ ('<FOOD>') nên file không phụ thuộc vào menu.
+    """
+    grammar = parser.grammar
+    with io.open(output_file, "w", encoding="utf-8") as f:
+        for production, prob in zip(grammar.productions(), probs):
+            f.write(str(ProbabilisticProduction(production.lhs(), production.rhs(), prob=prob)) + "\n")
+
+def load_pcfg(parser:EarleyParser, pcfg_file=PCFG_FILE):
+    """
+    Đọc xác suất luật từ file của write_pcfg. Báo ValueError nếu một luật của
+    khung văn phạm không có trong file (văn phạm đã đổi, cần ước lượng lại).
+    """
+    with io.open(pcfg_file, "r", encoding="utf-8") as f:
+        grammar = PCFG.fromstring(f.read())
+    index = _production_index(parser)
+    probs = [None] * len(parser.productions)
+    for production in grammar.productions():
+        p = index.get((parser.nonterminal_ids.get(production.lhs()), _encode_rhs(parser, production.rhs())))
+        if p is not None:
+            probs[p] = production.prob()
+    missing = [str(parser.grammar.productions()[p]) for p, prob in enumerate(probs) if prob is None]
+    if missing:
+        raise ValueError("%s does not cover the grammar: %s" % (pcfg_file, ", ".join(missing[:5])))
+    return probs
+
+class ViterbiDecoder:
+    """
+    Chọn dẫn xuất có xác suất lớn nhất (Viterbi có cắt chùm) thay cho dẫn xuất đầu tiên,
+    với ngân sách mỗi câu: beam (số item đọc token giữ lại mỗi cột), max_items (tổng số
+    item) và budget_ms (thời gian). Vượt ngân sách thì parse_semantics báo BudgetExceeded.
+    """
+    def __init__(self, costs, beam=None, max_items=None, budget_ms=None):
+        self.costs = costs
+        self.beam = beam
+        self.max_items = max_items
+        self.budget_ms = budget_ms
+        self._nulls = None
+
+    def nulls(self, parser:EarleyParser):
+        # Dẫn xuất rỗng chỉ phụ thuộc khung văn phạm (productions dùng chung khi nạp lại từ điển)
+        if self._nulls is None or self._nulls[0] is not parser.productions:
+            self._nulls = (parser.productions, parser.null_derivations(self.costs))
+        return self._nulls[1]
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_nulls"] = None
+        return state
+
+    def parse(self, parser:EarleyParser, tokens, build=None, ids=None):
+        deadline = time.perf_counter() + self.budget_ms / 1000 if self.budget_ms is not None else None
+        return parser.parse_viterbi(tokens, self.costs, self.beam, self.max_items, deadline,
+                                    self.nulls(parser), ids, build)
+
+    def parse_semantics(self, parser:EarleyParser, tokens, actions, ids=None):
+        """
+        Như EarleyParser.parse_semantics nhưng trên dẫn xuất tốt nhất.
+        """
+        result = self.parse(parser, tokens, lambda p, children: actions[p](children), ids)
+        if result is None:
+            return False, None
+        return True, result[1]
+
+def add_decoder_arguments(arg_parser):
+    arg_parser.add_argument("--weights", nargs="?", const=PCFG_FILE, default=None, metavar="FILE",
+                            help=f"chọn dẫn xuất có xác suất lớn nhất theo văn phạm xác suất (mặc định {PCFG_FILE}, "
+                                 "tạo bằng pcfg.py)")
+    arg_parser.add_argument("--beam", type=int, default=None, help="số item đọc token giữ lại mỗi cột (với --weights)")
+    arg_parser.add_argument("--max-items", type=int, default=None, help="số item tối đa mỗi câu (với --weights)")
+    arg_parser.add_argument("--budget-ms", type=float, default=None, help="thời gian phân tích tối đa mỗi câu (với --weights)")
+
+def decoder_from_args(args, parser:EarleyParser):
+    """
+    ViterbiDecoder theo các tham số của add_decoder_arguments, None nếu không có --weights.
+    """
+    if args.weights is None:
+        return None
+    return ViterbiDecoder(probs_to_costs(load_pcfg(parser, args.weights)), args.beam, args.max_items, args.budget_ms)
+
+def evaluate(parser:EarleyParser, token_lists, decoder:ViterbiDecoder, reference, semantics, actions, repeat=1):
+    """
+    Đo một cấu hình trên các câu đã tokenize: số câu phân tích được, vượt ngân sách,
+    số câu có cây giống reference (cây Viterbi không cắt chùm) và ngữ nghĩa giống
+    semantics (dẫn xuất đầu tiên, như cli.py; None nếu không phân tích được),
+    thời gian mỗi câu (nhỏ nhất qua repeat lần) và số item trung bình.
+    """
+    build_tree = lambda p, children: (p, tuple(value for _, value in children))
+    latencies = [math.inf] * len(token_lists)
+    parsed = exceeded = same_tree = same_sem = items = 0
+    for run in range(repeat):
+        for k, tokens in enumerate(token_lists):
+            start = time.perf_counter()
+            try:
+                chart = parser.viterbi_chart(tokens, decoder.costs, decoder.beam, decoder.max_items,
+                                             None if decoder.budget_ms is None else start + decoder.budget_ms / 1000,
+                                             decoder.nulls(parser))
+            except BudgetExceeded:
+                chart = False
+            latencies[k] = min(latencies[k], time.perf_counter() - start)
+            if run:
+                continue
+            tree = sem = None
+            if chart is False:
+                exceeded += 1
+            elif chart is not None:
+                parsed += 1
+                items += chart.size
+                tree = chart.build(tokens, build_tree)
+                sem = chart.build(tokens, lambda p, children: actions[p](children))
+            # Không phân tích được ở cả hai phía cũng tính là giống
+            same_tree += tree == reference[k]
+            same_sem += sem == semantics[k]
+    latencies.sort()
+    n = len(token_lists) or 1
+    return {"parsed": parsed, "exceeded": exceeded, "same_tree": same_tree, "same_semantics": same_sem,
+            "mean_us": sum(latencies) / n * 1e6, "p50_us": latencies[len(latencies) // 2] * 1e6,
+            "p99_us": latencies[int(len(latencies) * 0.99)] * 1e6, "max_us": latencies[-1] * 1e6,
+            "items": items / (parsed or 1)}
+
+if __name__ == "__main__":
+    from grammar import SEMANTIC_ACTIONS, default_action
+    from grammar_cache import load_compiled_grammar
+
+    arg_parser = argparse.ArgumentParser(description="Ước lượng văn phạm xác suất và đo Viterbi có cắt chùm (độ chính xác/độ trễ)")
+    arg_parser.add_argument("--samples", default=SAMPLES_FILE, help="câu chưa gán nhãn để ước lượng bằng EM")
+    arg_parser.add_argument("--trees", metavar="FILE", help="cây gán nhãn (dạng ngoặc hoặc JSON {\"tree\"}) để ước lượng có giám sát")
+    arg_parser.add_argument("--iterations", type=int, default=1, help="số vòng EM")
+    arg_parser.add_argument("--smoothing", type=float, default=1.0)
+    arg_parser.add_argument("--output", default=PCFG_FILE)
+    arg_parser.add_argument("--queries", nargs="+",
+                            default=[os.path.join(INPUT_DIR, "sample-queries.txt"), os.path.join(INPUT_DIR, "sentences.txt"), SAMPLES_FILE])
+    arg_parser.add_argument("--beams", default="1,2,3,4,8,0", help="các độ rộng chùm cần đo (0: không cắt)")
+    arg_parser.add_argument("--max-items", type=int, default=None)
+    arg_parser.add_argument("--budget-ms", type=float, default=None)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    compiled, _ = load_compiled_grammar(GRAMMAR_CACHE_FILE)
+    parser, terminals = compiled.parser, compiled.trie
+    start = time.perf_counter()
+    if args.trees:
+        probs, n, unknown = estimate_from_trees(parser, read_trees(args.trees), args.smoothing)
+        print(f"Ước lượng từ {n} cây gán nhãn trong {args.trees} ({unknown} production lạ bị bỏ qua)")
+    else:
+        with io.open(args.samples, "r", encoding="utf-8") as f:
+            probs, n = estimate_from_sentences(parser, terminals, (line.strip() for line in f if line.strip()),
+                                               args.iterations, args.smoothing)
+        print(f"Ước lượng bằng EM ({args.iterations} vòng) từ {n} câu trong {args.samples}")
+    write_pcfg(parser, probs, args.output)
+    print(f"Đã ghi văn phạm xác suất ra file: {args.output} ({time.perf_counter() - start:.2f} giây)\n")
+
+    actions = parser.compile_actions(SEMANTIC_ACTIONS, default_action)
+    costs = probs_to_costs(load_pcfg(parser, args.output))
+    build_tree = lambda p, children: (p, tuple(value for _, value in children))
+    for file in args.queries:
+        if not os.path.exists(file):
+            print(f"Không tìm thấy file {file}")
+            continue
+        with io.open(file, "r", encoding="utf-8") as f:
+            sentences = [line.strip() for line in f if line.strip()]
+        token_lists = [tokens for tokens in (custom_tokenizer(s, terminals) for s in sentences) if tokens is not None]
+        exhaustive = ViterbiDecoder(costs)
+        reference = [exhaustive.parse(parser, tokens, build_tree) for tokens in token_lists]
+        reference = [result[1] if result else None for result in reference]
+        semantics = [parser.parse_semantics(tokens, actions)[1] for tokens in token_lists]
+
+        first = [math.inf] * len(token_lists)
+        for _ in range(args.repeat):
+            for k, tokens in enumerate(token_lists):
+                t = time.perf_counter()
+                parser.parse_semantics(tokens, actions)
+                first[k] = min(first[k], time.perf_counter() - t)
+        first.sort()
+        n = len(token_lists)
+        print(f"{file}: {len(sentences)} câu, {n} tokenize được, {sum(r is not None for r in reference)} phân tích được")
+        print(f"  {'cấu hình':<22} {'phân tích':>9} {'vượt':>5} {'cây đúng':>9} {'ngữ nghĩa':>9} "
+              f"{'TB µs':>7} {'p50 µs':>7} {'p99 µs':>7} {'max µs':>7} {'item':>6}")
+        print(f"  {'dẫn xuất đầu (Earley)':<22} {n - semantics.count(None):>9} {'-':>5} {'-':>9} {'-':>9} "
+              f"{sum(first) / (n or 1) * 1e6:7.1f} {first[n // 2] * 1e6:7.1f} {first[int(n * 0.99)] * 1e6:7.1f} "
+              f"{first[-1] * 1e6:7.1f} {'-':>6}")
+        for beam in (int(b) for b in args.beams.split(",")):
+            decoder = ViterbiDecoder(costs, beam or None, args.max_items, args.budget_ms)
+            r = evaluate(parser, token_lists, decoder, reference, semantics, actions, args.repeat)
+            label = f"Viterbi beam={beam or '∞'}"
+            print(f"  {label:<22} {r['parsed']:>9} {r['exceeded']:>5} {r['same_tree'] / (n or 1):9.2%} "
+                  f"{r['same_semantics'] / (n or 1):9.2%} {r['mean_us']:7.1f} {r['p50_us']:7.1f} {r['p99_us']:7.1f} "
+                  f"{r['max_us']:7.1f} {r['items']:6.1f}")
+        print()
@@ -0,0 +1,353 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+import cli
+from main import OUTPUT_DIR
+from order_store import OrderStore, MemoryOrderStore, open_order_store
+from metrics import Metrics
+from pcfg import add_decoder_arguments, decoder_from_args
+
+ORDER_DB_FILE = os.path.join(OUTPUT_DIR, "orders.db")
+
+# Giới hạn kích thước body của một yêu cầu (byte)
+MAX_BODY_SIZE = 64 * 1024
+
+def _pool_context():
+    # Không fork tiến trình đang có thread (thread theo dõi data.json, thread ghi SQLite):
+    # tiến trình con có thể giữ bản sao của khóa không bao giờ được mở
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def _init_worker(viterbi=None):
+    # Tiến trình con khởi động mới (không fork) nên tự import server/cli và nạp văn phạm
+    # từ cache; decoder (tùy chọn dòng lệnh) được truyền từ tiến trình chính
+    cli.decoder = viterbi
+
+def _worker_ready():
+    return os.getpid()
+
+def _parse_batch(token_lists, key):
+    # Chạy trong tiến trình con: văn phạm, đường tắt và bảng hành động
+    # đã được nạp một lần khi tiến trình import cli; nạp lại khi tiến trình
+    # chính đã chuyển sang phiên bản văn phạm khác.
+    # Mọi đoạn của một tin nhắn đi chung một lượt; lỗi của từng đoạn được trả về
+    # (không ném ra) để các đoạn khác vẫn có kết quả.
+    snapshot = cli.reloader.snapshot
+    if snapshot.key != key:
+        cli.reloader.check()
+        snapshot = cli.reloader.snapshot
+    parse = lambda part, ids: cli.cached_parse(part, ids, snapshot)
+    results = []
+    for tokens in token_lists:
+        try:
+            results.append(cli.parse_clauses(tokens, snapshot, parse=parse))
+        except Exception as e:
+            results.append(e)
+    return snapshot.key, results
+
+class Session:
+    """
+    Trạng thái của một phiên: giỏ hàng riêng (trong order store) và khóa để
+    các yêu cầu trong cùng phiên được thực hiện lần lượt theo thứ tự đến.
+    """
+    def __init__(self, order):
+        self.order = order
+        self.lock = asyncio.Lock()
+        self.last_seen = time.monotonic()
+
+class OrderingServer:
+    """
+    Dịch vụ HTTP/JSON cho hệ thống Q&A đặt món, phục vụ nhiều khách cùng lúc.
+
+    POST /query  {"session": "...", "query": "..."}
+        -> {"session", "qhnn", "qhvp", "ll", "answer"}
+    GET  /health -> số phiên, số yêu cầu, thống kê cache
+    GET  /metrics -> số liệu đo từng giai đoạn (Prometheus text, khi chạy với --metrics)
+
+    Tokenize, tra cache và thực thi trên giỏ hàng chạy trong event loop;
+    phân tích cú pháp (tốn CPU) được đẩy sang process pool khi workers > 0.
+    Với order store có I/O (SQLite), thao tác trên giỏ hàng chạy ở thread pool
+    để các phiên đồng thời được gom commit.
+    """
+    def __init__(self, workers=None, session_ttl=3600, store:OrderStore=None, reload_interval=1.0):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.session_ttl = session_ttl
+        self.reload_interval = reload_interval
+        self.store = store if store is not None else MemoryOrderStore(cli.reloader.snapshot.prices)
+        cli.reloader.subscribe(lambda snapshot: self.store.set_prices(snapshot.prices))
+        self.sessions = {}
+        self.requests = 0
+        self.pool = None
+        if self.workers > 0:
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=_pool_context(),
+                                            initializer=_init_worker, initargs=(cli.decoder,))
+
+    def session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = Session(self.store.cart(session_id))
+        session.last_seen = time.monotonic()
+        return session
+
+    def expire_sessions(self):
+        deadline = time.monotonic() - self.session_ttl
+        for session_id in [sid for sid, s in self.sessions.items() if s.last_seen < deadline and not s.lock.locked()]:
+            del self.sessions[session_id]
+            self.store.release(session_id)
+
+    async def _parse(self, token_lists, snapshot, timer):
+        """
+        Phân tích các đoạn của một tin nhắn: [các câu (cli.parse_clauses) hoặc lỗi] theo
+        thứ tự token_lists. Đoạn đã có trong parse cache được trả lời ngay; các đoạn còn
+        lại được gửi sang process pool trong một lượt.
+        """
+        if self.pool is None:
+            parse = lambda part, ids: cli.cached_parse(part, ids, snapshot, timer)
+            results = []
+            for tokens in token_lists:
+                try:
+                    results.append(cli.parse_clauses(tokens, snapshot, parse=parse))
+                except Exception as e:
+                    results.append(e)
+            return results
+
+        results = [None] * len(token_lists)
+        misses = []
+        for k, tokens in enumerate(token_lists):
+            _, key = cli.cache_key(tokens, snapshot)
+            cached = cli.parse_cache.get(key, snapshot.key)
+            # Chỉ lưu câu phân tích được: câu không phân tích được có thể tách thành nhiều câu
+            if cached is not None and cached[0]:
+                timer.count("cache_hits")
+                results[k] = [(tokens,) + cached]
+            else:
+                timer.count("cache_misses")
+                misses.append(k)
+        if not misses:
+            return results
+        loop = asyncio.get_running_loop()
+        version, parsed = await loop.run_in_executor(self.pool, _parse_batch, [token_lists[k] for k in misses],
+                                                     snapshot.key)
+        for k, clauses in zip(misses, parsed):
+            results[k] = clauses
+            if isinstance(clauses, Exception):
+                continue
+            for tokens, ok, sem in clauses:
+                if ok:
+                    cli.parse_cache.put(cli.cache_key(tokens, snapshot)[1], (ok, sem), version)
+        return results
+
+    async def process_query(self, session_id, query):
+        """
+        Như cli.process_query nhưng phân tích bất đồng bộ và dùng giỏ hàng của phiên.
+        """
+        session = self.session(session_id)
+        async with session.lock:
+            # Không chạy cProfile ở đây: các yêu cầu khác chạy xen vào trong lúc chờ
+            timer = cli.metrics.timer(query, profile=False)
+            # Cả yêu cầu dùng một snapshot, kể cả khi data.json được nạp lại giữa chừng
+            snapshot = cli.reloader.snapshot
+            parts = cli.tokenize_parts(query, snapshot)
+            timer.lap("tokenize")
+
+            clauses = []
+            token_lists = [tokens for tokens in parts if tokens is not None]
+            results = iter(await self._parse(token_lists, snapshot, timer) if token_lists else ())
+            for tokens in parts:
+                if tokens is None:
+                    clauses.append((None, False, None, "token_errors"))
+                    continue
+                result = next(results)
+                if isinstance(result, Exception):
+                    clauses.append((tokens, False, result, "parse_errors"))
+                else:
+                    clauses.extend(clause + (None,) for clause in result)
+            timer.lap("parse")
+
+            if len(clauses) > 1:
+                timer.count("multi_intent")
+            if self.store.blocking:
+                loop = asyncio.get_running_loop()
+                result, counter = await loop.run_in_executor(None, cli.answer_clauses, clauses, session.order,
+                                                             snapshot, timer)
+            else:
+                result, counter = cli.answer_clauses(clauses, session.order, snapshot, timer)
+            tokens = clauses[0][0] if len(clauses) == 1 else None
+            return timer.done(result, counter, tokens, snapshot.parser)
+
+    async def handle_request(self, method, path, body):
+        """
+        Trả về (mã trạng thái, dữ liệu JSON).
+        """
+        if path == "/health" and method == "GET":
+            return HTTPStatus.OK, {
+                "sessions": len(self.sessions),
+                "requests": self.requests,
+                "workers": self.workers,
+                "cache": cli.parse_cache.stats(),
+                "reload": cli.reloader.stats(),
+            }
+        if path == "/metrics" and method == "GET":
+            if not cli.metrics.enabled:
+                return HTTPStatus.NOT_FOUND, {"error": "metrics disabled (start with --metrics)"}
+            return HTTPStatus.OK, cli.metrics.to_prometheus()
+        if path != "/query":
+            return HTTPStatus.NOT_FOUND, {"error": "not found"}
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "method not allowed"}
+
+        try:
+            request = json.loads(body.decode("utf-8"))
+            query = request["query"]
+            if not isinstance(query, str):
+                raise TypeError("query must be a string")
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return HTTPStatus.BAD_REQUEST, {"error": f"invalid request: {e}"}
+
+        session_id = str(request.get("session") or uuid.uuid4().hex)
+        qhnn, qhvp, ll, answer = await self.process_query(session_id, query.strip())
+        self.requests += 1
+        return HTTPStatus.OK, {"session": session_id, "qhnn": qhnn, "qhvp": qhvp, "ll": ll, "answer": answer}
+
+    async def handle_connection(self, reader, writer):
+        """
+        Xử lý một kết nối HTTP/1.1 (hỗ trợ keep-alive).
+        """
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except (ValueError, asyncio.IncompleteReadError):
+                    writer.write(_response(HTTPStatus.BAD_REQUEST, {"error": "malformed request"}, False))
+                    break
+                if request is None:
+                    break
+                method, path, headers, body, keep_alive = request
+                if body is None:
+                    status, payload = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "body too large"}
+                    keep_alive = False
+                else:
+                    try:
+                        status, payload = await self.handle_request(method, path, body)
+                    except Exception as e:
+                        # Lỗi khi xử lý (không phải do yêu cầu sai): vẫn trả lời để khách không bị ngắt kết nối
+                        print(f"Lỗi khi xử lý {method} {path}: {type(e).__name__}: {e}")
+                        status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"internal error: {type(e).__name__}"}
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _sweep_sessions(self):
+        while True:
+            await asyncio.sleep(min(60, self.session_ttl))
+            self.expire_sessions()
+
+    async def warm_up(self):
+        """
+        Khởi động đủ các tiến trình phân tích (mỗi tiến trình nạp văn phạm mất vài trăm ms)
+        trước khi nhận yêu cầu đầu tiên.
+        """
+        if self.pool is None:
+            return
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, _worker_ready) for _ in range(self.workers)))
+
+    async def serve(self, host, port):
+        await self.warm_up()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        sweeper = asyncio.create_task(self._sweep_sessions())
+        cli.reloader.watch(self.reload_interval)
+        print(f"Phục vụ tại http://{host}:{port} ({self.workers} tiến trình phân tích)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            sweeper.cancel()
+
+    def close(self):
+        cli.reloader.stop()
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.store.close()
+
+async def _read_request(reader):
+    """
+    Đọc một yêu cầu HTTP: (method, path, headers, body, keep_alive),
+    body là None nếu quá MAX_BODY_SIZE; trả về None khi kết nối đóng.
+    """
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    method, path, version = line.decode("latin-1").split()
+    headers = {}
+    while True:
+        header = await reader.readline()
+        if header in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = header.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY_SIZE:
+        return method, path, headers, None, False
+    body = await reader.readexactly(length) if length else b""
+    return method, path.split("?", 1)[0], headers, body, keep_alive
+
+def _response(status, payload, keep_alive):
+    # payload là chuỗi thì trả về dạng văn bản (số liệu Prometheus), ngược lại JSON
+    if isinstance(payload, str):
+        body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+    head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Dịch vụ HTTP/JSON cho hệ thống Q&A đặt món")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8080)
+    arg_parser.add_argument("--workers", type=int, default=None,
+                            help="số tiến trình phân tích (mặc định: số CPU; 0 = phân tích ngay trong event loop)")
+    arg_parser.add_argument("--session-ttl", type=float, default=3600,
+                            help="xóa phiên không hoạt động sau số giây này")
+    arg_parser.add_argument("--store", choices=["memory", "sqlite"], default="memory",
+                            help="nơi lưu giỏ hàng (sqlite: còn sau khi khởi động lại, dùng chung giữa các tiến trình)")
+    arg_parser.add_argument("--store-path", default=ORDER_DB_FILE, help="file SQLite cho --store sqlite")
+    arg_parser.add_argument("--reload-interval", type=float, default=1.0,
+                            help="chu kỳ (giây) kiểm tra data.json để nạp lại menu")
+    arg_parser.add_argument("--metrics", action="store_true",
+                            help="đo từng giai đoạn và bộ đếm, xem tại GET /metrics")
+    arg_parser.add_argument("--slow-ms", type=float, default=None,
+                            help=f"ghi các yêu cầu chậm hơn ngưỡng này (ms) vào {cli.SLOW_LOG_FILE}")
+    add_decoder_arguments(arg_parser)
+    args = arg_parser.parse_args()
+    # Đặt trước khi tạo pool: decoder được truyền cho các tiến trình con qua initializer
+    cli.decoder = decoder_from_args(args, cli.reloader.snapshot.parser)
+    if args.metrics or args.slow_ms is not None:
+        cli.metrics = Metrics(enabled=True, slow_ms=args.slow_ms,
+                              slow_log=cli.SLOW_LOG_FILE if args.slow_ms is not None else None)
+
+    store = open_order_store(args.store, cli.reloader.snapshot.prices, args.store_path)
+    ordering_server = OrderingServer(args.workers, args.session_ttl, store, args.reload_interval)
+    try:
+        asyncio.run(ordering_server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nTạm biệt!")
+    finally:
+        ordering_server.close()
@@ -0,0 +1,165 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from grammar import DATA_FILE, SEMANTIC_ACTIONS, default_action, build_lexicon, diff_lexicon
+from grammar_cache import load_compiled_grammar, data_key
+from fastpath import FastPath
+from fuzzy import FuzzyTokenizer
+from menu_db import MenuDB
+
+class Snapshot:
+    """
+    Mọi thứ suy ra từ một phiên bản data.json: menu, bảng giá, văn phạm đã biên dịch,
+    bộ phân tích, hành động ngữ nghĩa, đường tắt và menu DB.
+    Không bị sửa sau khi tạo; khi nạp lại thì một Snapshot mới thay nguyên khối,
+    các câu đang xử lý dở vẫn chạy tiếp trên bản cũ.
+    """
+    def __init__(self, data, compiled, actions=None, fast_path=None, menu_db=None):
+        self.data = data
+        self.compiled = compiled
+        # Phiên bản văn phạm (cho parse cache); không đổi khi chỉ giá món thay đổi
+        self.key = compiled.key
+        self.parser = compiled.parser
+        self.terminals = compiled.trie
+        self.actions = actions if actions is not None else self.parser.compile_actions(SEMANTIC_ACTIONS, default_action)
+        self.fast_path = fast_path if fast_path is not None else FastPath(self.parser, self.actions)
+        self.menu = {item["name"]: {"price": item["price"], "options": item["options"]} for item in data["menu"]}
+        self.prices = {name: info["price"] for name, info in self.menu.items()}
+        self.menu_db = menu_db if menu_db is not None else MenuDB(data["menu"])
+        self._fuzzy = None
+
+    @property
+    def fuzzy(self):
+        # Chỉ dựng khi có câu đầu tiên không tokenize chính xác được
+        if self._fuzzy is None:
+            self._fuzzy = FuzzyTokenizer(self.compiled.terminals, self.parser.recognize)
+        return self._fuzzy
+
+    def derive(self, data, key):
+        """
+        Tạo Snapshot cho data mới, dùng lại những gì không đổi.
+        Trả về (loại thay đổi, Snapshot): "menu" nếu từ điển giữ nguyên (chỉ giá...),
+        "lexicon" nếu phải dựng lại bảng từ vựng.
+        """
+        names = [item["name"] for item in data["menu"]]
+        if len(set(names)) != len(names):
+            duplicates = sorted({name for name in names if names.count(name) > 1})
+            raise ValueError(f"Duplicate dish names: {', '.join(duplicates)}")
+        lexicon = build_lexicon(data)
+        if lexicon == self.compiled.lexicon:
+            return "menu", Snapshot(data, self.compiled, self.actions, self.fast_path,
+                                    self.menu_db.with_items(data["menu"]))
+        changes = diff_lexicon(self.compiled.lexicon, lexicon)
+        compiled = self.compiled.with_lexicon(key, lexicon, changes)
+        # Khung văn phạm không đổi nên bảng hành động và các khuôn đi tắt vẫn dùng được
+        words = {word for added, removed in changes.values() for word in added + removed}
+        fast_path = self.fast_path.with_parser(compiled.parser, words)
+        return "lexicon", Snapshot(data, compiled, self.actions, fast_path, self.menu_db.with_items(data["menu"]))
+
+class MenuReloader:
+    """
+    Giữ Snapshot hiện tại và nạp lại khi data.json thay đổi (theo mtime/kích thước).
+    Các hàm đăng ký bằng subscribe(fn) được gọi với Snapshot mới sau mỗi lần thay.
+    """
+    def __init__(self, cache_file, data_file=DATA_FILE):
+        self.data_file = data_file
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+
+        start = time.perf_counter()
+        self._signature = self._stat()
+        # Lần nạp đầu dùng cache văn phạm đã biên dịch trên đĩa
+        compiled, self.cache_hit = load_compiled_grammar(cache_file, data_file)
+        with open(data_file, "r", encoding="utf-8") as f:
+            self.snapshot = Snapshot(json.load(f), compiled)
+        self.load_ms = (time.perf_counter() - start) * 1000
+
+        self.reloads = 0
+        self.last_reload_kind = None
+        self.last_reload_ms = None
+        self.last_error = None
+
+    def _stat(self):
+        st = os.stat(self.data_file)
+        return st.st_mtime_ns, st.st_size
+
+    def subscribe(self, fn):
+        self._listeners.append(fn)
+
+    def check(self):
+        """
+        Nạp lại nếu data.json đã thay đổi; trả về True nếu đã thay Snapshot.
+        """
+        try:
+            changed = self._stat() != self._signature
+        except OSError:
+            return False
+        return self.reload() if changed else False
+
+    def reload(self):
+        with self._lock:
+            start = time.perf_counter()
+            try:
+                self._signature = self._stat()
+                with open(self.data_file, "rb") as f:
+                    raw = f.read()
+                kind, snapshot = self.snapshot.derive(json.loads(raw.decode("utf-8")), data_key(raw))
+            except (OSError, ValueError, KeyError, TypeError, sqlite3.Error) as e:
+                # data.json đang ghi dở hoặc sai định dạng: giữ bản cũ
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Không nạp lại được {self.data_file}: {self.last_error}")
+                return False
+
+            # Thay nguyên khối (một phép gán), rồi báo cho các nơi đăng ký
+            self.snapshot = snapshot
+            for fn in self._listeners:
+                try:
+                    fn(snapshot)
+                except Exception as e:
+                    # Một nơi đăng ký lỗi không được chặn các nơi khác
+                    print(f"Lỗi khi áp dụng {self.data_file} mới: {type(e).__name__}: {e}")
+            self.reloads += 1
+            self.last_reload_kind = kind
+            self.last_reload_ms = (time.perf_counter() - start) * 1000
+            self.last_error = None
+            print(f"Đã nạp lại {self.data_file} ({kind}) trong {self.last_reload_ms:.1f} ms")
+            return True
+
+    def watch(self, interval=1.0):
+        """
+        Theo dõi data.json bằng một thread nền, kiểm tra mỗi interval giây.
+        """
+        if self._thread is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.check()
+                except Exception as e:
+                    # Lỗi không lường trước: báo rồi tiếp tục theo dõi, giữ Snapshot hiện tại
+                    self.last_error = f"{type(e).__name__}: {e}"
+                    print(f"Không nạp lại được {self.data_file}: {self.last_error}")
+
+        self._thread = threading.Thread(target=loop, name="menu-reloader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {
+            "load_ms": self.load_ms,
+            "cache_hit": self.cache_hit,
+            "reloads": self.reloads,
+            "last_reload_kind": self.last_reload_kind,
+            "last_reload_ms": self.last_reload_ms,
+            "last_error": self.last_error,
+        }
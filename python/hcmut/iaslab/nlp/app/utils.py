@@ -1,4 +1,7 @@
+import argparse
+import json
 import re
+import sys
 from nltk import CFG
 
 def get_terminals(grammar:CFG):
@@ -12,35 +15,183 @@ def get_terminals(grammar:CFG):
                 terminals.add(term)
     return sorted(list(terminals), key=len, reverse=True)
 
+# Bảng xóa dấu câu cho str.translate
+_PUNCTUATION = str.maketrans('', '', '.,!?:;')
+
+# Dấu câu ngắt câu: một tin nhắn có thể gồm nhiều yêu cầu ("Thêm 1 trà sữa. Cho tôi 2 phở bò.");
+# dấu chấm giữa hai chữ số là dấu phân cách hàng nghìn ("100.000") nên không ngắt
+_SENTENCE_BREAK = re.compile(r"[!?;]|(?<!\d)\.|\.(?!\d)")
+
+def split_sentences(text:str):
+    """
+    Tách tin nhắn thành các câu tại dấu ngắt câu (. ! ? ;), bỏ các đoạn chỉ có khoảng trắng.
+    """
+    return [part for part in _SENTENCE_BREAK.split(text) if part and not part.isspace()]
+
 def preprocess_text(text:str):
     """
     Tiền xử lý văn bản (chữ thường, xóa dấu câu, khoảng trắng)
     """
-    text = text.lower()
-    text = re.sub(r'[.,!?:;]', '', text) 
-    text = re.sub(r'[\n\t]', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
+    # split() không tham số tách theo mọi khoảng trắng (như \s+) và bỏ hai đầu
+    return " ".join(text.lower().translate(_PUNCTUATION).split())
+
+class TerminalTrie:
+    """
+    Cây tiền tố (trie) theo ký tự, dựng một lần từ các terminal của văn phạm.
+    Mỗi nút là một dict {ký tự: nút con}; khóa None giữ terminal kết thúc tại nút đó.
+    """
+    def __init__(self, terminals=()):
+        self.root = {}
+        for term in terminals:
+            self.add(term)
+
+    def add(self, term:str):
+        # Terminal rỗng ("") không tiêu thụ ký tự nào nên không đưa vào trie
+        if not term:
+            return
+        node = self.root
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[None] = term
+
+    def updated(self, added=(), removed=()):
+        """
+        Trie mới có thêm/bớt các terminal; chỉ sao chép các nút trên đường đi
+        của từ thay đổi, các nhánh còn lại dùng chung (trie cũ giữ nguyên).
+        """
+        trie = TerminalTrie()
+        trie.root = dict(self.root)
+        copied = {id(trie.root)}
+
+        def copy_path(term):
+            node = trie.root
+            for ch in term:
+                child = node.get(ch)
+                if child is None:
+                    child = {}
+                elif id(child) not in copied:
+                    child = dict(child)
+                copied.add(id(child))
+                node[ch] = child
+                node = child
+            return node
+
+        for term in removed:
+            if term:
+                copy_path(term).pop(None, None)
+        for term in added:
+            if term:
+                copy_path(term)[None] = term
+        return trie
+
+    def longest_match(self, text:str, pos:int):
+        """
+        Tìm terminal dài nhất bắt đầu tại vị trí pos.
+        Trả về (terminal, vị trí kết thúc) hoặc (None, pos) nếu không khớp.
+        """
+        match, end, _ = self.scan(text, pos)
+        return match, end
+
+    def scan(self, text:str, pos:int):
+        """
+        Như longest_match nhưng cho biết thêm trie đã đọc tới đâu:
+        trả về (terminal, vị trí kết thúc, vị trí dừng) với vị trí dừng là ký tự
+        đầu tiên không đi tiếp được, hoặc len(text) nếu đọc hết câu
+        (khi đó gõ thêm ký tự có thể đổi kết quả khớp).
+        """
+        node = self.root
+        match, end = None, pos
+        for i in range(pos, len(text)):
+            node = node.get(text[i])
+            if node is None:
+                return match, end, i
+            if None in node:
+                match, end = node[None], i + 1
+        return match, end, len(text)
+
+    def matches(self, text:str):
+        """
+        Tokenize tham lam (khớp dài nhất) câu đã tiền xử lý, không cắt chuỗi:
+        sinh dần (start, end, terminal) theo offset ký tự. Gặp đoạn không khớp
+        terminal nào thì sinh (start, start, None) rồi dừng.
+        """
+        pos, n = 0, len(text)
+        while pos < n:
+            term, end, _ = self.scan(text, pos)
+            yield pos, end, term
+            if term is None:
+                return
+            # Bỏ qua khoảng trắng sau token (tương đương .strip() trước đây)
+            pos = end
+            while pos < n and text[pos].isspace():
+                pos += 1
+
+    def tokenize_spans(self, text:str):
+        """
+        Tokenize một lượt trên câu đã tiền xử lý.
+        Trả về danh sách (start, end, terminal) theo offset ký tự, hoặc None nếu lỗi.
+        """
+        spans = list(self.matches(text))
+        if spans and spans[-1][2] is None:
+            return None
+        return spans
+
+def _tokenize_terms(trie:TerminalTrie, text:str):
+    # Như tokenize_spans nhưng chỉ giữ terminal
+    terms = [term for _, _, term in trie.matches(text)]
+    if terms and terms[-1] is None:
+        return None
+    return terms
 
 def custom_tokenizer(sentence:str, terminals):
     """
-    Hàm tham lam để tokenize câu dựa trên các
+    Hàm tham lam (khớp dài nhất) để tokenize câu dựa trên các
     từ vựng đã định nghĩa trong văn phạm.
+    terminals là TerminalTrie dựng sẵn (hoặc danh sách terminal).
     """
+    if not isinstance(terminals, TerminalTrie):
+        terminals = TerminalTrie(terminals)
     sentence = preprocess_text(sentence) # Chuẩn hóa
-    tokens = []
-    while sentence:
-        found_match = False
-        for term in terminals:
-            if sentence.startswith(term):
-                tokens.append(term)
-                # Cắt bỏ phần đã khớp và khoảng trắng sau nó
-                sentence = sentence[len(term):].strip() 
-                found_match = True
-                break
-
-        
-        if not found_match:
-            return None # Trả về None để báo lỗi
-            
-    return tokens
\ No newline at end of file
+    # None nếu có đoạn không khớp terminal nào (lỗi tokenize)
+    return _tokenize_terms(terminals, sentence)
+
+def read_records(f):
+    """
+    Đọc dần luồng câu hỏi (không nạp hết vào bộ nhớ), bỏ dòng trống.
+    Mỗi dòng là một câu hoặc một object JSON {"session": ..., "query": ...};
+    object JSON không có "query" kiểu chuỗi bị bỏ qua (báo ra stderr).
+    Sinh ra (số dòng, session hoặc None, câu hỏi).
+    """
+    for line_no, line in enumerate(f, 1):
+        query, session = line.strip(), None
+        if query.startswith("{"):
+            try:
+                record = json.loads(query)
+            except ValueError:
+                record = None
+            if isinstance(record, dict):
+                query, session = record.get("query"), record.get("session")
+                if not isinstance(query, str):
+                    print(f"Bỏ qua dòng {line_no}: bản ghi JSON không có query kiểu chuỗi", file=sys.stderr)
+                    continue
+                query = query.strip()
+        if query:
+            yield line_no, None if session is None else str(session), query
+
+def positive_int(value:str):
+    """
+    Kiểu tham số cho argparse: số nguyên >= 1 (kích thước khối, số tiến trình...).
+    """
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+def non_negative_int(value:str):
+    """
+    Kiểu tham số cho argparse: số nguyên >= 0 (ví dụ số tiến trình, 0 là chạy ngay trong tiến trình này).
+    """
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be at least 0, got {value}")
+    return number